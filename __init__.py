@@ -27,7 +27,6 @@ import os
 import sys
 import json
 import importlib
-import traceback
 from typing import Any
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -39,13 +38,16 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 from main import \
     helpers, \
     dna_generator, \
+    derivation, \
     exporter, \
     headless_util, \
     intermediate, \
     logic, \
     material_generator, \
     metadata_templates, \
-    refactorer
+    record, \
+    refactorer, \
+    state_store
 
 from UILists import \
     custom_metadata_ui_list, \
@@ -56,13 +58,16 @@ if "bpy" in locals():
     modules = {
         "helpers": helpers,
         "dna_generator": dna_generator,
+        "derivation": derivation,
         "exporter": exporter,
         "headless_util": headless_util,
         "intermediate": intermediate,
         "logic": logic,
         "material_generator": material_generator,
         "metadata_templates": metadata_templates,
+        "record": record,
         "refactorer": refactorer,
+        "state_store": state_store,
         "custom_metadata_ui_list": custom_metadata_ui_list,
         "logic_ui_list": logic_ui_list,
     }
@@ -79,32 +84,70 @@ recommended_limit: int = 0
 dt = datetime.now(timezone.utc).astimezone()  # Date Time in UTC local
 
 
-@persistent
-def refresh_ui(dummy1, dummy2):
+# Seconds without depsgraph updates before the UI is refreshed, dragging objects around does not refresh it at all:
+REFRESH_DELAY = 0.5
+
+
+def count_valid_combinations():
+    """
+    Returns the number of combinations valid under the Logic rules and Materials set in the UI, None if they cannot be
+    read or the rules link too many Attributes to count them exactly.
     """
-    Refreshes the UI upon user interacting with Blender (using depsgraph_update_post handler). Might be a better handler
-    to use.
+    input_tool = bpy.context.scene.input_tool
+    try:
+        logic_file = None
+        if input_tool.enable_logic:
+            logic_file = intermediate.get_logic_rules(
+                    input_tool.enable_logic_json,
+                    bpy.path.abspath(input_tool.logic_file),
+            )
+
+        return helpers.get_valid_combinations(
+                input_tool.enable_rarity,
+                input_tool.enable_logic,
+                logic_file,
+                input_tool.enable_materials,
+                bpy.path.abspath(input_tool.materials_file),
+        )
+    except (OSError, ValueError, KeyError, TypeError):  # Logic.json or the Materials file is missing or invalid
+        return None
+
+
+def refresh_combinations():
+    """
+    Timer callback of refresh_ui(). Reads the number of combinations from the cached scene hierarchy, which is only
+    scanned again when collections changed, and redraws the 3D Viewport if it changed. With Logic or Materials on,
+    only the combinations valid under them are counted.
     """
     global combinations
     global recommended_limit
 
-    combinations = (helpers.get_combinations())
-    recommended_limit = int(round(combinations / 2))
+    new_combinations = helpers.get_combinations()
+    if bpy.context.scene.input_tool.enable_logic or bpy.context.scene.input_tool.enable_materials:
+        valid_combinations = count_valid_combinations()
+        if valid_combinations is not None:
+            new_combinations = valid_combinations
+    if new_combinations != combinations:
+        combinations = new_combinations
+        recommended_limit = int(round(combinations / 2))
 
-    # Add panel classes that require refresh to this refresh_panels tuple:
-    refresh_panel_classes = (
-        BMNFTS_PT_CreateData,
-    )
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
 
-    def redraw_panel(panels):
-        for i in panels:
-            try:
-                bpy.utils.unregister_class(i)
-            except Exception:
-                print(traceback.format_exc())
-            bpy.utils.register_class(i)
+    return None  # Runs once per refresh_ui() burst
 
-    redraw_panel(refresh_panel_classes)
+
+@persistent
+def refresh_ui(dummy1, dummy2):
+    """
+    Refreshes the UI upon user interacting with Blender (using depsgraph_update_post handler). Updates are debounced,
+    the refresh runs REFRESH_DELAY seconds after the last of a burst of updates.
+    """
+    if bpy.app.timers.is_registered(refresh_combinations):
+        bpy.app.timers.unregister(refresh_combinations)
+    bpy.app.timers.register(refresh_combinations, first_interval=REFRESH_DELAY)
 
 
 bpy.app.handlers.depsgraph_update_post.append(refresh_ui)
@@ -174,6 +217,15 @@ class BMNFTData:
     failed_batch: Any = None
     failed_dna: Any = None
     failed_dna_index: Any = None
+    time_budget: Any = None
+    attempt_budget: Any = None
+    seed: Any = None
+    workers: int = 1
+    rarity_mode: str = "weighted"
+    batch_strategy: str = "contiguous"
+    batch_render_order: str = "record"
+    logic_mode: str = "repair"
+    render_mode: str = "full"
 
     def __post_init__(self):
         self.custom_fields = {}
@@ -190,8 +242,11 @@ def get_bmnft_data():
         nfts_per_batch=bpy.context.scene.input_tool.nfts_per_batch,
         batch_to_generate=bpy.context.scene.input_tool.batch_to_generate,
         collection_size=bpy.context.scene.input_tool.collection_size,
+        batch_strategy=bpy.context.scene.input_tool.batch_strategy.lower(),
+        batch_render_order=bpy.context.scene.input_tool.batch_render_order.lower(),
 
         enable_rarity=bpy.context.scene.input_tool.enable_rarity,
+        rarity_mode=bpy.context.scene.input_tool.rarity_mode.lower(),
 
         blend_my_nfts_output=_Blend_My_NFTs_Output,
         batch_json_save_path=_batch_json_save_path,
@@ -200,9 +255,11 @@ def get_bmnft_data():
         enable_logic=bpy.context.scene.input_tool.enable_logic,
         enable_logic_json=bpy.context.scene.input_tool.enable_logic_json,
         logic_file=bpy.path.abspath(bpy.context.scene.input_tool.logic_file),
+        logic_mode=bpy.context.scene.input_tool.logic_mode.lower(),
 
         enable_images=bpy.context.scene.input_tool.image_bool,
         image_file_format=bpy.context.scene.input_tool.image_enum,
+        render_mode=bpy.context.scene.input_tool.render_mode.lower(),
 
         enable_animations=bpy.context.scene.input_tool.animation_bool,
         animation_file_format=bpy.context.scene.input_tool.animation_enum,
@@ -355,15 +412,48 @@ def run_as_headless():
     if args.batch_data_path:
         input.batch_json_save_path = args.batch_data_path
 
+    input.time_budget = args.time_budget
+    input.attempt_budget = args.attempt_budget
+    input.seed = args.seed
+    input.workers = args.workers
+    if args.rarity_mode:
+        input.rarity_mode = args.rarity_mode
+    if args.batch_strategy:
+        input.batch_strategy = args.batch_strategy
+    if args.batch_render_order:
+        input.batch_render_order = args.batch_render_order
+    if args.logic_mode:
+        input.logic_mode = args.logic_mode
+    if args.render_mode:
+        input.render_mode = args.render_mode
+
     if args.operation == 'create-dna':
         intermediate.send_to_record(input)
 
+    elif args.operation == 'count-dna':
+        intermediate.count_combinations(input)
+
+    elif args.operation == 'validate-dna':
+        intermediate.validate_dna(input, args.dna_file)
+
     elif args.operation == 'generate-nfts':
         intermediate.render_and_save_nfts(input)
 
     elif args.operation == 'refactor-batches':
         refactorer.reformat_nft_collection(input)
 
+    elif args.operation == 'extend-dna':
+        intermediate.send_to_record(input, extend=True)
+
+    elif args.operation == 'batch-status':
+        state_store.log_batch_status(input.batch_json_save_path)
+
+    elif args.operation == 'verify-dna':
+        derivation.verify_record(
+            record.find_record(input.blend_my_nfts_output),
+            os.path.join(input.blend_my_nfts_output, "NFTDerivation.json")
+        )
+
 
 # ======== User input Property Group ======== #
 class BMNFTS_PGT_Input_Properties(bpy.types.PropertyGroup):
@@ -381,6 +471,26 @@ class BMNFTS_PGT_Input_Properties(bpy.types.PropertyGroup):
         default=1,
         min=1
     )  # max=(combinations - offset)
+    batch_strategy: bpy.props.EnumProperty(
+        name="Batch Strategy",
+        description="Select how NFT DNA are split into batches",
+        items=[
+            ('CONTIGUOUS', "Contiguous", "Consecutive NFTs fill one batch after the other"),
+            ('ROUND_ROBIN', "Round Robin", "NFTs are dealt out to the batches in turn"),
+            ('BY_SIZE', "Even Size", "Consecutive NFTs in batches of sizes differing by at most one NFT"),
+            ('BY_COST', "Render Cost", "Batches take about as long to render, estimated from the batches rendered so "
+                                       "far")
+        ]
+    )
+    batch_render_order: bpy.props.EnumProperty(
+        name="Render Order",
+        description="Select the order NFTs are rendered in within each batch",
+        items=[
+            ('RECORD', "Record Order", "Render NFTs in the order they were created"),
+            ('MIN_CHANGES', "Fewest Scene Changes", "Render consecutive NFTs that share as many Variants and "
+                                                    "Materials as possible")
+        ]
+    )
 
     save_path: bpy.props.StringProperty(
         name="Save Path",
@@ -393,10 +503,26 @@ class BMNFTS_PGT_Input_Properties(bpy.types.PropertyGroup):
     enable_rarity: bpy.props.BoolProperty(
         name="Enable Rarity"
     )
+    rarity_mode: bpy.props.EnumProperty(
+        name="Rarity Mode",
+        description="Select how Rarity weights are applied",
+        items=[
+            ('WEIGHTED', "Weighted", "Draw every NFT at random with the Rarity weights"),
+            ('QUOTA', "Exact Quotas", "Every Variant appears exactly its Rarity share of the collection")
+        ]
+    )
 
     enable_logic: bpy.props.BoolProperty(
         name="Enable Logic"
     )
+    logic_mode: bpy.props.EnumProperty(
+        name="Logic Mode",
+        description="Select how NFTs breaking a Logic rule are fixed",
+        items=[
+            ('REPAIR', "Repair", "Apply the broken rules to the NFT one at a time"),
+            ('DIRECT', "Direct", "Draw the NFT again from the Variants the rules allow, never breaking a rule")
+        ]
+    )
     enable_logic_json: bpy.props.BoolProperty(
         name="Use Logic.json instead"
     )
@@ -432,6 +558,16 @@ class BMNFTS_PGT_Input_Properties(bpy.types.PropertyGroup):
         ]
     )
 
+    render_mode: bpy.props.EnumProperty(
+        name="Render Mode",
+        description="Select how NFT images are made",
+        items=[
+            ('FULL', "Full Render", "Render the whole scene for every NFT"),
+            ('COMPOSITE', "Composite Layers", "Render every Variant once on a transparent film and composite the "
+                                              "images from them. Only for fixed camera, layered scenes")
+        ]
+    )
+
     animation_bool: bpy.props.BoolProperty(
         name="Animation"
     )
@@ -606,6 +742,32 @@ class CreateData(bpy.types.Operator):
         return context.window_manager.invoke_confirm(self, event)
 
 
+class ExtendData(bpy.types.Operator):
+    bl_idname = 'extend.data'
+    bl_label = 'Extend Data'
+    bl_description = 'Adds new NFT Data up to the Collection Size. Existing DNA, order numbers and batches are kept, ' \
+                     'new DNA are saved to new batches.'
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        helpers.activate_logging()
+
+        input = get_bmnft_data()
+
+        if input.enable_logic:
+            if input.enable_logic_json and not input.logic_file:
+                self.report({'ERROR'},
+                            f"No Logic.json file path set. Please set the file path to your Logic.json file.")
+
+        intermediate.send_to_record(input, extend=True)
+
+        self.report({'INFO'}, f"NFT Data extended!")
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_confirm(self, event)
+
+
 class ExportNFTs(bpy.types.Operator):
     bl_idname = 'exporter.nfts'
     bl_label = 'Export NFTs'
@@ -640,13 +802,14 @@ class ResumeFailedBatch(bpy.types.Operator):
         _save_path = bpy.path.abspath(bpy.context.scene.input_tool.save_path)
         _Blend_My_NFTs_Output, _batch_json_save_path, _nftBatch_save_path = make_directories(_save_path)
 
-        _batchToGenerate = bpy.context.scene.input_tool.batch_to_generate
+        _fail_state, _failed_batch, _failed_dna, _failed_dna_index = helpers.check_failed_batches(_batch_json_save_path)
+
+        # Render settings are those the failed Batch was started with:
+        _batchToGenerate = _failed_batch if _fail_state else bpy.context.scene.input_tool.batch_to_generate
 
         file_name = os.path.join(_batch_json_save_path, "Batch{}.json".format(_batchToGenerate))
         batch_data = json.load(open(file_name))
 
-        _fail_state, _failed_batch, _failed_dna, _failed_dna_index = helpers.check_failed_batches(_batch_json_save_path)
-
         render_settings = batch_data["Generation Save"][-1]["Render_Settings"]
 
         input = BMNFTData(
@@ -662,6 +825,7 @@ class ResumeFailedBatch(bpy.types.Operator):
 
             enable_images=render_settings["enable_images"],
             image_file_format=render_settings["image_file_format"],
+            render_mode=render_settings.get("render_mode", "full"),  # Not saved by older versions
 
             enable_animations=render_settings["enable_animations"],
             animation_file_format=render_settings["animation_file_format"],
@@ -842,12 +1006,22 @@ class BMNFTS_PT_CreateData(bpy.types.Panel):
         row = layout.row()
         row.prop(input_tool_scene, "nfts_per_batch")
 
+        row = layout.row()
+        row.prop(input_tool_scene, "batch_strategy")
+
+        row = layout.row()
+        row.prop(input_tool_scene, "batch_render_order")
+
         row = layout.row()
         row.prop(input_tool_scene, "save_path")
 
         row = layout.row()
         row.prop(input_tool_scene, "enable_rarity")
 
+        if bpy.context.scene.input_tool.enable_rarity:
+            row = layout.row()
+            row.prop(input_tool_scene, "rarity_mode")
+
         row = layout.row()
         row.prop(input_tool_scene, "enable_logic")
 
@@ -875,6 +1049,9 @@ class BMNFTS_PT_CreateData(bpy.types.Panel):
             row = col.row(align=True)
             row.label(text=f"*Field Names must be unique.")
 
+            row = layout.row()
+            row.prop(input_tool_scene, "logic_mode")
+
             row = layout.row()
             row.prop(input_tool_scene, "enable_logic_json")
 
@@ -892,6 +1069,8 @@ class BMNFTS_PT_CreateData(bpy.types.Panel):
         row = layout.row()
         self.layout.operator("create.data", icon='DISCLOSURE_TRI_RIGHT', text="Create Data")
         row = layout.row()
+        self.layout.operator("extend.data", icon='ADD', text="Extend Data")
+        row = layout.row()
         layout.label(text=f"{BMNFTS_VERSION}")
 
 
@@ -914,6 +1093,8 @@ class BMNFTS_PT_GenerateNFTs(bpy.types.Panel):
         row.prop(input_tool_scene, "image_bool")
         if bpy.context.scene.input_tool.image_bool:
             row.prop(input_tool_scene, "image_enum")
+            row = layout.row()
+            row.prop(input_tool_scene, "render_mode")
 
         row = layout.row()
         row.prop(input_tool_scene, "animation_bool")
@@ -1144,6 +1325,7 @@ classes = (
 
               # Operator Classes:
               CreateData,
+              ExtendData,
               ExportNFTs,
               ResumeFailedBatch,
               RefactorBatches,
@@ -0,0 +1,249 @@
+# Purpose:
+# This file splits the DNA of an NFT record into Batch#.json files for dna_generator.py(make_batches). The record is
+# read once, every DNA is routed to its batch by a strategy, and each batch is written as soon as it is full while the
+# next ones are still being filled. BatchIndex.json records how the batches were planned, so the batch holding any
+# order_num can be found without opening the batch files.
+
+import os
+import json
+import heapq
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from . import record, render_order
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+BATCH_INDEX_FILE_NAME = "BatchIndex.json"
+
+
+class ContiguousStrategy:
+    """Consecutive order_nums fill one batch of nfts_per_batch DNA after the other, the last batch may be smaller."""
+
+    name = "contiguous"
+
+    def __init__(self, num_dna, nfts_per_batch, costs=None):
+        self.num_dna = num_dna
+        self.nfts_per_batch = nfts_per_batch
+        self.num_batches = -(-num_dna // nfts_per_batch)
+
+    def batch_of(self, position):
+        return position // self.nfts_per_batch
+
+    def batch_size(self, batch):
+        return min(self.nfts_per_batch, self.num_dna - batch * self.nfts_per_batch)
+
+
+class RoundRobinStrategy(ContiguousStrategy):
+    """
+    Deals order_nums out to the batches in turn, so every batch gets a slice of the whole collection. Batches are only
+    complete at the end of the record, all of them are held in memory until then.
+    """
+
+    name = "round_robin"
+
+    def batch_of(self, position):
+        return position % self.num_batches
+
+    def batch_size(self, batch):
+        return self.num_dna // self.num_batches + (batch < self.num_dna % self.num_batches)
+
+
+class BySizeStrategy(ContiguousStrategy):
+    """Consecutive order_nums in as many batches as contiguous, with sizes differing by at most one DNA."""
+
+    name = "by_size"
+
+    def __init__(self, num_dna, nfts_per_batch, costs=None):
+        super().__init__(num_dna, nfts_per_batch)
+        self.base_size, self.num_larger = divmod(num_dna, max(self.num_batches, 1))
+
+    def batch_of(self, position):
+        larger_positions = self.num_larger * (self.base_size + 1)
+        if position < larger_positions:
+            return position // (self.base_size + 1)
+        return self.num_larger + (position - larger_positions) // self.base_size
+
+    def batch_size(self, batch):
+        return self.base_size + (batch < self.num_larger)
+
+
+class ByCostStrategy(ContiguousStrategy):
+    """
+    Deals DNA out so every batch takes about as long to render, costs holds the predicted render time of every DNA (see
+    render_costs.py). The most expensive DNA go first, each to the batch with the lowest predicted render time so far.
+    Batches hold as many DNA as their render time allows rather than nfts_per_batch each.
+    """
+
+    name = "by_cost"
+
+    def __init__(self, num_dna, nfts_per_batch, costs=None):
+        super().__init__(num_dna, nfts_per_batch)
+        self.assignment = [0] * num_dna
+        self.batch_sizes = [0] * self.num_batches
+        self.predicted_times = [0.0] * self.num_batches
+
+        loads = [(0.0, batch) for batch in range(self.num_batches)]
+        for position in sorted(range(num_dna), key=lambda p: -costs[p]):
+            load, batch = heapq.heappop(loads)
+            self.assignment[position] = batch
+            self.batch_sizes[batch] += 1
+            self.predicted_times[batch] = load + costs[position]
+            heapq.heappush(loads, (load + costs[position], batch))
+
+    def batch_of(self, position):
+        return self.assignment[position]
+
+    def batch_size(self, batch):
+        return self.batch_sizes[batch]
+
+
+# Strategies by name, new strategies only need a batch_of() and batch_size() and to be added here:
+STRATEGIES = {
+    strategy.name: strategy for strategy in (ContiguousStrategy, RoundRobinStrategy, BySizeStrategy, ByCostStrategy)
+}
+
+
+def get_strategy(strategy_name, num_dna, nfts_per_batch, costs=None):
+    if strategy_name not in STRATEGIES:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"Unknown batch strategy '{strategy_name}'. Choose one of: {', '.join(STRATEGIES)}.{TextColors.RESET}"
+        )
+        raise ValueError()
+    return STRATEGIES[strategy_name](num_dna, nfts_per_batch, costs)
+
+
+def save_batch(batch_json_save_path, batch_num, hierarchy, batch_dna_list):
+    batch_dictionary = {
+        "nfts_in_batch": int(len(batch_dna_list)),
+        "hierarchy": hierarchy,
+        "batch_dna_list": batch_dna_list
+    }
+
+    batch_dictionary = json.dumps(batch_dictionary, indent=1, ensure_ascii=True)
+
+    with open(os.path.join(batch_json_save_path, f"Batch{batch_num}.json"), "w") as outfile:
+        outfile.write(batch_dictionary)
+
+
+def order_and_save_batch(batch_json_save_path, batch_num, hierarchy, batch_dna_list, batch_render_order):
+    ordered_dna_list = render_order.order_batch(batch_dna_list, batch_render_order)
+    if ordered_dna_list is not batch_dna_list:
+        log.debug(
+                f"\nBatch{batch_num}.json render order: {render_order.count_changes(batch_dna_list)} Variant and "
+                f"Material changes in record order, {render_order.count_changes(ordered_dna_list)} after ordering."
+        )
+    save_batch(batch_json_save_path, batch_num, hierarchy, ordered_dna_list)
+
+
+def read_batch_index(batch_json_save_path):
+    """Returns the BatchIndex.json dictionary of batch_json_save_path, an empty index if there is none."""
+    index_path = os.path.join(batch_json_save_path, BATCH_INDEX_FILE_NAME)
+    if not os.path.exists(index_path):
+        return {"plans": [], "batches": {}}
+
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def find_batch(batch_index, order_num):
+    """Returns the number of the batch holding order_num, None if order_num was not batched."""
+    for plan in batch_index["plans"]:
+        position = order_num - plan["first_order_num"]
+        if 0 <= position < plan["num_dna"]:
+            # Cost balanced plans cannot be recomputed without the costs, they keep every DNA's batch instead:
+            if "assignment" in plan:
+                return plan["first_batch_num"] + plan["assignment"][position]
+
+            strategy = get_strategy(plan["strategy"], plan["num_dna"], plan["nfts_per_batch"])
+            return plan["first_batch_num"] + strategy.batch_of(position)
+    return None
+
+
+def plan_batches(
+        nft_record_save_path,
+        batch_json_save_path,
+        collection_size,
+        nfts_per_batch,
+        strategy_name="contiguous",
+        first_order_num=1,
+        first_batch_num=1,
+        workers=1,
+        estimate_costs=None,
+        batch_render_order="record",
+):
+    """
+    Writes the DNA of the record from first_order_num up to collection_size to Batch#.json files numbered from
+    first_batch_num, in a single pass over the record. Full batches are written by up to workers threads while the
+    record is still being read. Adds the plan to BatchIndex.json and returns the number of batches written.
+
+    The "by_cost" strategy needs estimate_costs(hierarchy, dna_strings), returning the predicted render time of every
+    DNA string in dna_strings, see render_costs.estimate_costs().
+
+    batch_render_order "min_changes" orders the DNA of every batch so consecutive NFTs differ as little as possible,
+    see render_order.py.
+    """
+    hierarchy = record.read_header(nft_record_save_path)["hierarchy"]
+    num_dna = max(min(collection_size, record.count_dna(nft_record_save_path)) - first_order_num + 1, 0)
+
+    costs = None
+    if strategy_name == ByCostStrategy.name:
+        entries = itertools.islice(record.iter_dna(nft_record_save_path), first_order_num - 1, None)
+        costs = estimate_costs(hierarchy, [list(entry.keys())[0] for _, entry in zip(range(num_dna), entries)])
+    strategy = get_strategy(strategy_name, num_dna, nfts_per_batch, costs)
+
+    plan = {
+        "strategy": strategy.name,
+        "nfts_per_batch": nfts_per_batch,
+        "first_order_num": first_order_num,
+        "num_dna": num_dna,
+        "first_batch_num": first_batch_num,
+    }
+    if costs is not None:
+        plan["assignment"] = strategy.assignment
+
+    batch_index = read_batch_index(batch_json_save_path)
+    batch_index["plans"].append(plan)
+
+    filling = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        writes = []
+        entries = itertools.islice(record.iter_dna(nft_record_save_path), first_order_num - 1, None)
+        for position, entry in zip(range(num_dna), entries):
+            batch = strategy.batch_of(position)
+            batch_dna_list = filling.setdefault(batch, [])
+            batch_dna_list.append(entry)
+
+            if len(batch_dna_list) == strategy.batch_size(batch):
+                del filling[batch]
+                batch_num = first_batch_num + batch
+                writes.append(executor.submit(
+                        order_and_save_batch,
+                        batch_json_save_path,
+                        batch_num,
+                        hierarchy,
+                        batch_dna_list,
+                        batch_render_order,
+                ))
+
+                order_nums = [list(i.values())[0]["order_num"] for i in batch_dna_list]
+                batch_index["batches"][str(batch_num)] = {
+                    "file": f"Batch{batch_num}.json",
+                    "nfts_in_batch": len(batch_dna_list),
+                    "first_order_num": min(order_nums),
+                    "last_order_num": max(order_nums),
+                }
+                if costs is not None:
+                    batch_index["batches"][str(batch_num)]["predicted_render_time"] = strategy.predicted_times[batch]
+
+        # Surfaces errors raised while writing:
+        for write in writes:
+            write.result()
+
+    with open(os.path.join(batch_json_save_path, BATCH_INDEX_FILE_NAME), "w") as outfile:
+        outfile.write(json.dumps(batch_index, indent=1, ensure_ascii=True))
+
+    return strategy.num_batches
@@ -0,0 +1,193 @@
+# Purpose:
+# This file counts the NFT DNA that can actually be generated from a hierarchy once Logic rules and Materials are
+# applied, for the Create Data panel and dna_generator.py(send_to_record). Attributes that share no rule are counted
+# apart and multiplied. Attributes linked by rules are counted one at a time, only keeping the Variants of the counted
+# Attributes that later rules still read. Combinations are never enumerated. It does not import bpy.
+
+from collections import defaultdict
+
+from . import rule_compiler
+from .compiled_hierarchy import compile_hierarchy
+from .constrained_sampler import variant_domains
+
+# Counting gives up, returning None, rather than keep more partial combinations than this in memory at once:
+MAX_COUNTING_STATES = 50000
+
+
+def rule_attributes(rule):
+    return set(rule.if_side.attribute_indices) | set(rule.result_side.attribute_indices)
+
+
+def material_counts(materials, enable_rarity):
+    """
+    Returns {Variant collection name: number of Materials it can be drawn with} of the Variants listed in a Materials
+    file dictionary, see material_generator.select_material().
+    """
+    counts = {}
+    for variant, variant_materials in materials.items():
+        weights = [float(w) for w in variant_materials["Material List"].values()]
+        if enable_rarity and weights and weights[-1] != 0:
+            counts[variant] = sum(w > 0 for w in weights)
+        else:
+            counts[variant] = len(weights)
+    return counts
+
+
+def attribute_groups(num_attributes, rules):
+    """Returns the Attribute indices linked together by rules, as sorted lists, and lists of the rules of each."""
+    group_of = list(range(num_attributes))
+
+    def find(i):
+        while group_of[i] != i:
+            group_of[i] = group_of[group_of[i]]
+            i = group_of[i]
+        return i
+
+    for rule in rules:
+        first, *others = rule_attributes(rule)
+        for i in others:
+            group_of[find(i)] = find(first)
+
+    groups = defaultdict(list)
+    group_rules = defaultdict(list)
+    for i in range(num_attributes):
+        groups[find(i)].append(i)
+    for rule in rules:
+        group_rules[find(next(iter(rule_attributes(rule))))].append(rule)
+
+    return [(groups[g], group_rules[g]) for g in sorted(groups)]
+
+
+def counting_order(attributes, rules):
+    """
+    Returns the Attributes of a group in the order they are counted: each next Attribute is the one sharing rules with
+    the most Attributes already counted, so Attributes are dropped from the counting state as early as possible.
+    """
+    neighbours = {i: set() for i in attributes}
+    for rule in rules:
+        linked = rule_attributes(rule)
+        for i in linked:
+            neighbours[i].update(linked - {i})
+
+    order = []
+    remaining = set(attributes)
+    while remaining:
+        attribute_index = max(remaining, key=lambda i: (len(neighbours[i] - remaining), -i))
+        remaining.remove(attribute_index)
+        order.append(attribute_index)
+    return order, neighbours
+
+
+def count_group(rule_table, attributes, rules, domains, multiplicities):
+    """
+    Returns the weighted number of DNA of a group of Attributes breaking none of its rules, None if counting would need
+    more than MAX_COUNTING_STATES states. The counting state maps the Variants of counted Attributes that rules still
+    to be checked read to their number of combinations. Variants listed on the same sides of those rules break them
+    alike and share a state, kept under the lowest of their order numbers.
+    """
+    dna_bits = rule_table.dna_bits
+    order, neighbours = counting_order(attributes, rules)
+    position = {a: k for k, a in enumerate(order)}
+
+    # Rules are checked once all their Attributes are counted, Attributes stay in the state until then:
+    rules_at = defaultdict(list)
+    for rule in rules:
+        rules_at[max(position[i] for i in rule_attributes(rule))].append(rule)
+    last_use = {a: max([position[a]] + [position[n] for n in neighbours[a]]) for a in order}
+
+    def representatives(attribute_index, k):
+        """Returns {order number: lowest order number breaking the rules checked after step k alike}."""
+        masks = [
+            (rule.if_side.mask, rule.result_side.mask)
+            for j in range(k + 1, len(order)) for rule in rules_at[j]
+            if attribute_index in rule_attributes(rule)
+        ]
+        lowest = {}
+        representative = {}
+        for number in sorted(domains[attribute_index]):
+            bit = dna_bits.bit(attribute_index, number)
+            key = tuple((if_mask & bit != 0, result_mask & bit != 0) for if_mask, result_mask in masks)
+            representative[number] = lowest.setdefault(key, number)
+        return representative
+
+    states = {(): 1}
+    state_attributes = []
+    for k, attribute_index in enumerate(order):
+        next_attributes = [a for a in state_attributes + [attribute_index] if last_use[a] > k]
+        checked_rules = rules_at[k]
+        merged = {a: representatives(a, k) for a in next_attributes}
+
+        next_states = defaultdict(int)
+        for state, count in states.items():
+            values = dict(zip(state_attributes, state))
+            state_bits = 0
+            for a, number in values.items():
+                state_bits |= dna_bits.bit(a, number)
+
+            for number in domains[attribute_index]:
+                bits = state_bits | dna_bits.bit(attribute_index, number)
+                if any(rule.violated_by(bits) for rule in checked_rules):
+                    continue
+                values[attribute_index] = number
+                next_state = tuple(merged[a][values[a]] for a in next_attributes)
+                next_states[next_state] += count * multiplicities[attribute_index][number]
+
+            if len(next_states) > MAX_COUNTING_STATES:
+                return None
+
+        states = next_states
+        state_attributes = next_attributes
+        if not states:
+            return 0
+
+    return sum(states.values())
+
+
+def count_valid_combinations(
+        hierarchy,
+        enable_rarity,
+        enable_logic,
+        logic_file,
+        enable_materials=False,
+        materials=None,
+):
+    """
+    Returns the exact number of distinct NFT DNA, Materials included, that can be generated from a hierarchy: Variants
+    weighted 0 are left out with Rarity on (see constrained_sampler.variant_domains()) and DNA breaking a Logic rule
+    are not counted. Attributes without Variants are ignored, as in helpers.count_combinations().
+
+    Attributes are counted Empty as rule_compiler.EmptyRule allows. Where rules can unselect the IF Variants of a NOT
+    rule listing an Attribute in full, every DNA satisfying the rules with that Attribute Empty is counted, Logic may
+    make fewer of them.
+
+    Returns None if the rules link too many Attributes to count them exactly, see MAX_COUNTING_STATES.
+    """
+    hierarchy = compile_hierarchy(hierarchy)
+    rule_table = rule_compiler.compile_rules(hierarchy, logic_file if enable_logic else {}, enable_rarity)
+    domains, _ = variant_domains(rule_table, enable_rarity)
+    # Repeated order numbers make the same DNA, Attributes without Variants count once:
+    domains = [list(dict.fromkeys(d)) if len(a) else [0] for a, d in zip(hierarchy.attributes, domains)]
+
+    counts = material_counts(materials, enable_rarity) if enable_materials else {}
+    multiplicities = []
+    for attribute in hierarchy.attributes:
+        multiplicity = {0: 1}
+        for number, variant in attribute.by_number.items():
+            multiplicity[number] = counts.get(variant.key, 1)
+        multiplicities.append(multiplicity)
+
+    # Rules listing nothing found in the hierarchy can never be broken. Attributes are only Empty where Logic leaves
+    # them Empty, see rule_compiler.EmptyRule:
+    rules = [rule for rule in rule_table.constraints if rule_attributes(rule)]
+
+    combinations = 1
+    for attributes, group_rules in attribute_groups(len(hierarchy.attributes), rules):
+        if not group_rules:
+            combinations *= sum(multiplicities[attributes[0]][n] for n in domains[attributes[0]])
+        else:
+            group_combinations = count_group(rule_table, attributes, group_rules, domains, multiplicities)
+            if group_combinations is None:
+                return None
+            combinations *= group_combinations
+
+    return combinations
@@ -0,0 +1,126 @@
+# Purpose:
+# This file compiles the hierarchy dictionary returned by helpers.get_hierarchy() into an immutable index, built once
+# per run and shared by dna_worker.py, sampler.py, dna_codec.py, logic.py, material_generator.py and exporter.py.
+# Looking up a Variant by collection name or by Attribute and order number, and an Attribute's position in the DNA,
+# no longer scans the nested hierarchy dictionary. It does not import bpy.
+
+import numpy as np
+
+
+class Variant:
+    """A Variant collection, named "<name>_<order number>_<rarity>", and its data from the hierarchy dictionary."""
+
+    __slots__ = ("key", "name", "order_number", "rarity", "number", "weight", "attribute", "attribute_index")
+
+    def __init__(self, key, data, attribute, attribute_index):
+        self.key = key
+        self.name = data["name"]
+        self.order_number = data["number"]
+        self.rarity = data["rarity"]
+        self.number = int(self.order_number)
+        self.weight = float(self.rarity)
+        self.attribute = attribute
+        self.attribute_index = attribute_index
+
+    def var_info(self):
+        """Returns [name, order_number, rarity_number, attribute, attribute_index], as logic.get_var_info() does."""
+        return [self.name, self.order_number, self.rarity, self.attribute, self.attribute_index]
+
+    def __repr__(self):
+        return f"Variant({self.key!r})"
+
+
+class Attribute:
+    """An Attribute collection, its Variants in hierarchy order and their order numbers and weights as arrays."""
+
+    __slots__ = ("name", "index", "variants", "variant_names", "by_number", "numbers", "weights")
+
+    def __init__(self, name, index, variants):
+        self.name = name
+        self.index = index
+        self.variants = tuple(Variant(key, data, name, index) for key, data in variants.items())
+        self.variant_names = tuple(variants)
+        self.by_number = {}
+        for variant in reversed(self.variants):  # The first Variant wins if order numbers repeat
+            self.by_number[variant.number] = variant
+        self.numbers = np.array([variant.number for variant in self.variants], dtype=np.int64)
+        self.weights = np.array([variant.weight for variant in self.variants], dtype=np.float64)
+        self.numbers.flags.writeable = False
+        self.weights.flags.writeable = False
+
+    def __len__(self):
+        return len(self.variants)
+
+    def __repr__(self):
+        return f"Attribute({self.name!r}, {len(self.variants)} Variants)"
+
+
+class Hierarchy:
+    """
+    Compiled, read only view of a hierarchy dictionary. Iterating it yields the Attribute names in DNA order, like
+    iterating the dictionary does; the dictionary itself is kept as .data for saving to JSON files.
+    """
+
+    __slots__ = ("data", "attributes", "attribute_names", "_attributes", "_variants")
+
+    def __init__(self, hierarchy):
+        set_ = object.__setattr__
+        attributes = tuple(Attribute(a, i, hierarchy[a]) for i, a in enumerate(hierarchy))
+
+        set_(self, "data", hierarchy)
+        set_(self, "attributes", attributes)
+        set_(self, "attribute_names", tuple(a.name for a in attributes))
+        set_(self, "_attributes", {a.name: a for a in attributes})
+        set_(self, "_variants", {v.key: v for a in attributes for v in a.variants})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Compiled hierarchies are read only.")
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def __iter__(self):
+        return iter(self.attribute_names)
+
+    def __contains__(self, attribute_name):
+        return attribute_name in self._attributes
+
+    def attribute(self, attribute_name):
+        """Returns the Attribute named attribute_name, raises KeyError if there is none."""
+        return self._attributes[attribute_name]
+
+    def attribute_index(self, attribute_name):
+        """Returns the position of an Attribute in the DNA."""
+        return self._attributes[attribute_name].index
+
+    def variant(self, variant_name):
+        """Returns the Variant with collection name variant_name, None if there is none."""
+        return self._variants.get(variant_name)
+
+    def is_variant(self, variant_name):
+        return variant_name in self._variants
+
+    def variant_at(self, attribute_index, number):
+        """Returns the Variant of the Attribute at attribute_index with order number number, None if Empty."""
+        return self.attributes[attribute_index].by_number.get(int(number))
+
+    def match_dna(self, digits):
+        """
+        Returns {Attribute name: Variant name} of a DNA given as Variant order numbers. Attributes whose digit has no
+        Variant, 0 for Empty, map to the digit as a string.
+        """
+        dna_dictionary = {}
+        for attribute, digit in zip(self.attributes, digits):
+            variant = attribute.by_number.get(int(digit))
+            dna_dictionary[attribute.name] = variant.key if variant is not None else str(digit)
+        return dna_dictionary
+
+    def __repr__(self):
+        return f"Hierarchy({len(self.attributes)} Attributes, {len(self._variants)} Variants)"
+
+
+def compile_hierarchy(hierarchy):
+    """Returns hierarchy compiled into a Hierarchy, or hierarchy itself if it already is one."""
+    if isinstance(hierarchy, Hierarchy):
+        return hierarchy
+    return Hierarchy(hierarchy)
@@ -0,0 +1,186 @@
+# Purpose:
+# This file draws NFT DNA that already satisfy every Logic rule, for the "direct" Logic mode of dna_worker.py. Instead
+# of drawing a DNA and repairing it rule by rule (logic.py), Attributes are chosen one at a time in dependency order,
+# IF Attributes before the THEN/NOT Attributes they decide. Each Variant is drawn with its Rarity weight from the
+# Variants the rules still allow, with forward checking of the Attributes sharing a rule and backtracking on dead ends.
+# It does not import bpy.
+
+import logging
+
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+# Variants tried per DNA, across all Attributes, before giving up on it:
+MAX_SEARCH_STEPS = 10000
+
+
+class SearchLimitReached(Exception):
+    pass
+
+
+def dependency_order(rule_table):
+    """
+    Returns the Attribute indices in the order they are chosen: Attributes on the IF side of a rule before those on its
+    THEN/NOT side, in hierarchy order otherwise. Attributes in a cycle of rules are taken in hierarchy order.
+    """
+    num_attributes = len(rule_table.hierarchy.attributes)
+    decides = [set() for _ in range(num_attributes)]
+    for rule in rule_table.constraints:
+        for if_index in rule.if_side.attribute_indices:
+            decides[if_index].update(i for i in rule.result_side.attribute_indices if i != if_index)
+
+    num_deciding = [0] * num_attributes
+    for decided in decides:
+        for i in decided:
+            num_deciding[i] += 1
+
+    order = []
+    remaining = set(range(num_attributes))
+    while remaining:
+        ready = [i for i in remaining if num_deciding[i] == 0]
+        attribute_index = min(ready) if ready else min(remaining)
+        remaining.remove(attribute_index)
+        order.append(attribute_index)
+        for i in decides[attribute_index]:
+            num_deciding[i] -= 1
+
+    return order
+
+
+def variant_domains(rule_table, enable_rarity):
+    """
+    Returns the Variant order numbers each Attribute can be drawn from while keeping to the rules of a RuleTable, and
+    {order number: weight} of each Attribute, None when drawn uniformly. Variants weighted 0 are left out unless their
+    whole Attribute is weighted 0. Attributes a NOT rule lists in full can also be Empty (0), listed last, see
+    rule_compiler.EmptyRule.
+    """
+
+    domains = []
+    weights = []
+    for attribute in rule_table.hierarchy.attributes:
+        variants = list(attribute.variants)
+        attribute_weights = None
+        if enable_rarity and any(v.weight > 0 for v in variants):
+            variants = [v for v in variants if v.weight > 0]
+            attribute_weights = {v.number: v.weight for v in variants}
+
+        domain = [v.number for v in variants]
+        if attribute.index in rule_table.emptied:
+            domain.append(0)
+        domains.append(domain)
+        weights.append(attribute_weights)
+
+    return domains, weights
+
+
+class ConstrainedSampler:
+    """
+    Draws DNA, as lists of Variant order numbers, that break none of the rules of a RuleTable. Variants with a Rarity
+    weight of 0 are never drawn unless their whole Attribute is weighted 0. Attributes a NOT rule lists in full are
+    left Empty (0) only while one of those rules applies, see rule_compiler.EmptyRule.
+    """
+
+    def __init__(self, rule_table, enable_rarity):
+        hierarchy = rule_table.hierarchy
+        dna_bits = rule_table.dna_bits
+        num_attributes = len(hierarchy.attributes)
+
+        self.dna_bits = dna_bits
+        self.order = dependency_order(rule_table)
+        self.spans = [dna_bits.span(i) for i in range(num_attributes)]
+
+        self.rules_of = [[] for _ in range(num_attributes)]
+        self.neighbours = [set() for _ in range(num_attributes)]
+        for rule in rule_table.constraints:
+            rule_attributes = set(rule.if_side.attribute_indices) | set(rule.result_side.attribute_indices)
+            for i in rule_attributes:
+                self.rules_of[i].append(rule)
+                self.neighbours[i].update(rule_attributes - {i})
+
+        self.domains, self.weights = variant_domains(rule_table, enable_rarity)
+
+    def _allowed(self, attribute_index, number, bits, assigned):
+        """Returns the bits with number chosen for an Attribute, None if a rule is then broken whatever comes next."""
+        bits |= self.dna_bits.bit(attribute_index, number)
+        assigned |= self.spans[attribute_index]
+        for rule in self.rules_of[attribute_index]:
+            if rule.violated_by_partial(bits, assigned):
+                return None
+        return bits
+
+    def _draw(self, attribute_index, candidates, rng):
+        """
+        Draws one of the candidate order numbers of an Attribute. Empty (0) is only a candidate while the rules leaving
+        the Attribute Empty may still apply, it is then drawn as often as an average Variant.
+        """
+        weights = self.weights[attribute_index]
+        if weights is None:
+            return rng.choices(candidates, k=1)[0]
+        empty_weight = sum(weights.values()) / len(weights)
+        return rng.choices(candidates, weights=[weights.get(n, empty_weight) for n in candidates], k=1)[0]
+
+    def _search(self, position, digits, bits, assigned, domains, rng, steps):
+        if position == len(self.order):
+            return True
+
+        attribute_index = self.order[position]
+        candidates = list(domains[attribute_index])
+        span = self.spans[attribute_index]
+
+        while candidates:
+            steps[0] += 1
+            if steps[0] > MAX_SEARCH_STEPS:
+                raise SearchLimitReached()
+
+            number = self._draw(attribute_index, candidates, rng)
+            candidates.remove(number)
+
+            new_bits = self._allowed(attribute_index, number, bits, assigned)
+            if new_bits is None:
+                continue
+            new_assigned = assigned | span
+
+            # Forward checking, Attributes sharing a rule keep only the Variants still allowed:
+            new_domains = domains
+            for neighbour in self.neighbours[attribute_index]:
+                if new_assigned & self.spans[neighbour]:
+                    continue
+                domain = [
+                    n for n in domains[neighbour] if self._allowed(neighbour, n, new_bits, new_assigned) is not None
+                ]
+                if not domain:
+                    break
+                if len(domain) != len(domains[neighbour]):
+                    if new_domains is domains:
+                        new_domains = list(domains)
+                    new_domains[neighbour] = domain
+            else:
+                digits[attribute_index] = number
+                if self._search(position + 1, digits, new_bits, new_assigned, new_domains, rng, steps):
+                    return True
+
+        return False
+
+    def sample(self, rng):
+        """Returns a DNA breaking no rule as a list of Variant order numbers, drawn with rng, a random.Random."""
+        digits = [0] * len(self.domains)
+        try:
+            found = self._search(0, digits, 0, 0, self.domains, rng, [0])
+        except SearchLimitReached:
+            log.error(
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"No DNA satisfying every Logic rule was found within {MAX_SEARCH_STEPS} tries. Simplify your "
+                    f"Logic rules or use the 'Repair' Logic mode.{TextColors.RESET}"
+            )
+            raise ValueError()
+
+        if not found:
+            log.error(
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"No DNA can satisfy every Logic rule with Variants that have a Rarity weight above 0. Review your "
+                    f"Logic rules or use the 'Repair' Logic mode.{TextColors.RESET}"
+            )
+            raise ValueError()
+
+        return digits
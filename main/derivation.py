@@ -0,0 +1,238 @@
+# Purpose:
+# This file saves and loads NFTDerivation.json, the seed and settings a collection was generated from, and re-derives
+# the DNA of any order_num from it without reading the NFT record. Candidate DNA are re-drawn chunk by chunk with
+# dna_worker.py; the candidate numbers that were skipped as duplicates map order_nums back to candidates.
+
+import json
+import bisect
+import hashlib
+import logging
+from collections import OrderedDict
+
+from . import dna_worker, record
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+# Bumped whenever the way candidate DNA are drawn changes, older derivations can then no longer be re-derived:
+DERIVATION_VERSION = 1
+
+# Number of candidate chunks kept in memory by DNADeriver:
+CHUNK_CACHE_SIZE = 8
+
+
+def fingerprint(
+        hierarchy,
+        enable_rarity,
+        enable_logic,
+        logic_file,
+        enable_materials,
+        materials,
+        rarity_mode="weighted",
+        logic_mode="repair",
+):
+    """Returns a sha256 hex digest of everything that decides which DNA a seed generates."""
+    settings = [
+        DERIVATION_VERSION,
+        dna_worker.CHUNK_SIZE,
+        hierarchy,
+        enable_rarity,
+        rarity_mode if enable_rarity else None,
+        enable_logic,
+        logic_file if enable_logic else None,
+        enable_materials,
+        materials if enable_materials else None,
+    ]
+    # Settings added later are only hashed when not left at their default, older fingerprints stay valid:
+    if enable_logic and logic_mode != "repair":
+        settings.append(logic_mode)
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def create_derivation(
+        hierarchy,
+        seed,
+        enable_rarity,
+        enable_logic,
+        logic_file,
+        enable_materials,
+        materials_file,
+        materials,
+        skipped_candidates,
+        rarity_mode="weighted",
+        collection_size=None,
+        logic_mode="repair",
+):
+    """
+    Returns the NFTDerivation.json dictionary of a generated collection. collection_size is only needed in Rarity quota
+    mode, where the quotas and so every DNA depend on it.
+    """
+    return {
+        "version": DERIVATION_VERSION,
+        "fingerprint": fingerprint(
+                hierarchy,
+                enable_rarity,
+                enable_logic,
+                logic_file,
+                enable_materials,
+                materials,
+                rarity_mode,
+                logic_mode,
+        ),
+        "seed": seed,
+        "chunk_size": dna_worker.CHUNK_SIZE,
+        "enable_rarity": enable_rarity,
+        "rarity_mode": rarity_mode,
+        "collection_size": collection_size,
+        "enable_logic": enable_logic,
+        "logic_file": logic_file if enable_logic else None,
+        "logic_mode": logic_mode,
+        "enable_materials": enable_materials,
+        "materials_file": materials_file if enable_materials else None,
+        "materials": materials if enable_materials else None,
+        "hierarchy": hierarchy,
+        "skipped_candidates": skipped_candidates,
+    }
+
+
+def save_derivation(derivation, file_name):
+    with open(file_name, 'w') as outfile:
+        outfile.write(json.dumps(derivation, ensure_ascii=True) + '\n')
+
+
+def load_derivation(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+class DNADeriver:
+    """
+    Re-derives DNA strings from their order_num. Each lookup draws at most one chunk of dna_worker.CHUNK_SIZE candidate
+    DNA, consecutive order_nums share their chunk.
+    """
+
+    def __init__(self, derivation):
+        logic_mode = derivation.get("logic_mode", "repair")  # Not saved by older versions
+        expected_fingerprint = fingerprint(
+                derivation["hierarchy"],
+                derivation["enable_rarity"],
+                derivation["enable_logic"],
+                derivation["logic_file"],
+                derivation["enable_materials"],
+                derivation["materials"],
+                derivation["rarity_mode"],
+                logic_mode,
+        )
+
+        if derivation["version"] != DERIVATION_VERSION or derivation["fingerprint"] != expected_fingerprint:
+            log.error(
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"NFTDerivation.json was created by a different version of Blend_My_NFTs or has been edited. DNA "
+                    f"cannot be re-derived from it.{TextColors.RESET}"
+            )
+            raise ValueError()
+
+        # Materials are still read from materials_file while applying them, it must not have changed since:
+        if derivation["enable_materials"]:
+            with open(derivation["materials_file"]) as f:
+                if json.load(f) != derivation["materials"]:
+                    log.error(
+                            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                            f"The Materials file '{derivation['materials_file']}' changed after the DNA were "
+                            f"generated. DNA cannot be re-derived.{TextColors.RESET}"
+                    )
+                    raise ValueError()
+
+        self.chunk_generator = dna_worker.DNAChunkGenerator(
+                derivation["hierarchy"],
+                derivation["seed"],
+                derivation["enable_rarity"],
+                derivation["enable_logic"],
+                derivation["logic_file"],
+                derivation["enable_materials"],
+                derivation["materials_file"],
+                derivation["materials"],
+                logic_mode,
+        )
+        self.skipped_candidates = sorted(derivation["skipped_candidates"])
+        self._chunks = OrderedDict()
+
+        # Rarity quota mode allocates the whole collection at once, it is re-allocated on the first lookup:
+        self.quota_collection_size = None
+        if derivation["enable_rarity"] and derivation["rarity_mode"] == "quota":
+            self.quota_collection_size = derivation["collection_size"]
+        self._quota_dna = None
+
+    def candidate_index(self, order_num):
+        """Returns the number of the candidate DNA that became order_num."""
+        position = order_num - 1
+        if not self.skipped_candidates:
+            return position
+
+        # Smallest candidate with position + 1 candidates at or before it that were not skipped:
+        low, high = position, position + len(self.skipped_candidates)
+        while low < high:
+            middle = (low + high) // 2
+            if middle + 1 - bisect.bisect_right(self.skipped_candidates, middle) < position + 1:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def derive_packed(self, order_num):
+        """Returns the packed DNA of order_num, see dna_codec.py."""
+        if self.quota_collection_size is not None:
+            if self._quota_dna is None:
+                self._quota_dna, _ = self.chunk_generator.generate_quota(self.quota_collection_size)
+            return self._quota_dna[order_num - 1]
+
+        chunk_index, offset = divmod(self.candidate_index(order_num), dna_worker.CHUNK_SIZE)
+
+        if chunk_index in self._chunks:
+            self._chunks.move_to_end(chunk_index)
+        else:
+            self._chunks[chunk_index] = self.chunk_generator.generate(chunk_index)
+            if len(self._chunks) > CHUNK_CACHE_SIZE:
+                self._chunks.popitem(last=False)
+
+        return self._chunks[chunk_index][offset]
+
+    def derive(self, order_num):
+        """Returns the DNA string of order_num."""
+        return self.chunk_generator.codec.to_string(self.derive_packed(order_num))
+
+    def derive_dna_list(self, first_order_num, last_order_num):
+        """Returns order_nums first_order_num to last_order_num formatted like the NFT record dna_list."""
+        return [
+            {self.derive(order_num): {"complete": False, "order_num": order_num}}
+            for order_num in range(first_order_num, last_order_num + 1)
+        ]
+
+    def verify(self, dna_list):
+        """Re-derives every DNA in an NFT record dna_list, returns the order_nums that do not match."""
+        mismatched = []
+        for entry in dna_list:
+            for single_dna, dna_data in entry.items():
+                if self.derive(dna_data["order_num"]) != single_dna:
+                    mismatched.append(dna_data["order_num"])
+        return mismatched
+
+
+def verify_record(nft_record_save_path, derivation_save_path):
+    """Re-derives every DNA in an NFT record from NFTDerivation.json, logs and returns the order_nums that differ."""
+    deriver = DNADeriver(load_derivation(derivation_save_path))
+
+    mismatched = deriver.verify(record.iter_dna(nft_record_save_path))
+    num_dna = record.count_dna(nft_record_save_path)
+    if mismatched:
+        log.warning(
+                f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                f"{len(mismatched)} of {num_dna} DNA in the NFT record do not match their derivation. "
+                f"order_nums: {mismatched}{TextColors.RESET}"
+        )
+    else:
+        log.info(
+                f"\n{TextColors.OK}All {num_dna} DNA in the NFT record match their derivation.{TextColors.RESET}"
+        )
+
+    return mismatched
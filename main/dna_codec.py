@@ -0,0 +1,125 @@
+# Purpose:
+# This file packs NFT DNA and its Material DNA into a single mixed-radix integer. Generation, Logic and Materials work
+# on DNA as a list of Variant order numbers (digits) and dedup on the packed integer; "-" and ":" separated DNA strings
+# are only produced and parsed at the NFTRecord.jsonl and Batch#.json boundary.
+
+import numpy as np
+
+from .compiled_hierarchy import compile_hierarchy
+
+
+class DNACodec:
+    """
+    Mixed-radix DNA codec for a given hierarchy. Digit 0 of an Attribute means Empty (set by Logic NOT rules), digit n
+    is the Variant with order number n. Material digits follow the same rule with the Material order numbers from the
+    Materials.json file.
+    """
+
+    def __init__(self, hierarchy, materials=None):
+        hierarchy = compile_hierarchy(hierarchy)
+        self.attributes = list(hierarchy.attribute_names)
+        self.has_materials = materials is not None
+
+        self.radices = [max(a.by_number, default=0) + 1 for a in hierarchy.attributes]
+
+        self.material_radices = []
+        for a in hierarchy.attributes:
+            material_counts = [
+                len(materials[v]["Material List"]) for v in a.variant_names if materials and v in materials
+            ]
+            self.material_radices.append(max(material_counts, default=0) + 1)
+
+        self.places = _place_values(self.radices)
+        self.material_places = _place_values(self.material_radices)
+        self.dna_space = _space_size(self.radices)
+
+        # Packed matrices can be encoded with a single NumPy dot product when they fit into int64:
+        self._fits_int64 = self.dna_space * _space_size(self.material_radices) < 2 ** 63
+
+    def encode(self, digits, material_digits=None):
+        """Packs a list of Variant order numbers, and optionally their Material order numbers, into an integer."""
+        packed = 0
+        for digit, place in zip(digits, self.places):
+            packed += digit * place
+
+        if material_digits:
+            material_packed = 0
+            for digit, place in zip(material_digits, self.material_places):
+                material_packed += digit * place
+            packed += material_packed * self.dna_space
+
+        return packed
+
+    def encode_matrix(self, dna_matrix, material_matrix=None):
+        """
+        Packs every row of an (N x Attributes) DNA matrix, and optionally the same rows of a matrix of their Material
+        order numbers, returns a list of integers.
+        """
+        if self._fits_int64:
+            packed = dna_matrix @ np.array(self.places, dtype=np.int64)
+            if material_matrix is not None:
+                packed += (material_matrix @ np.array(self.material_places, dtype=np.int64)) * self.dna_space
+            return packed.tolist()
+        if material_matrix is not None:
+            return [self.encode(row, m) for row, m in zip(dna_matrix.tolist(), material_matrix.tolist())]
+        return [self.encode(row) for row in dna_matrix.tolist()]
+
+    def decode(self, packed):
+        """Returns (digits, material_digits) of a packed DNA, material_digits is None without Materials."""
+        material_packed, packed = divmod(packed, self.dna_space)
+
+        digits = _unpack(packed, self.radices)
+        material_digits = _unpack(material_packed, self.material_radices) if self.has_materials else None
+
+        return digits, material_digits
+
+    def to_string(self, packed):
+        """Formats a packed DNA as "1-2-3", or "1-2-3:0-1-0" with Materials."""
+        digits, material_digits = self.decode(packed)
+        return format_dna(digits, material_digits)
+
+    def from_string(self, single_dna):
+        """Packs a "1-2-3" or "1-2-3:0-1-0" DNA string."""
+        digits, material_digits = parse_dna(single_dna)
+        return self.encode(digits, material_digits)
+
+
+def parse_dna(single_dna):
+    """Splits a DNA string into (digits, material_digits), material_digits is None when the DNA has no Materials."""
+    if ":" in single_dna:
+        single_dna, material_dna = single_dna.split(":")
+        return [int(i) for i in single_dna.split("-")], [int(i) for i in material_dna.split("-")]
+
+    return [int(i) for i in single_dna.split("-")], None
+
+
+def format_dna(digits, material_digits=None):
+    """Joins digits, and optionally material_digits, into a DNA string."""
+    single_dna = "-".join(map(str, digits))
+    if material_digits is not None:
+        return f"{single_dna}:{'-'.join(map(str, material_digits))}"
+    return single_dna
+
+
+def _place_values(radices):
+    places = []
+    place = 1
+    for radix in radices:
+        places.append(place)
+        place *= radix
+    return places
+
+
+def _space_size(radices):
+    size = 1
+    for radix in radices:
+        size *= radix
+    return size
+
+
+def _unpack(packed, radices):
+    digits = []
+    for radix in radices:
+        packed, digit = divmod(packed, radix)
+        digits.append(digit)
+    return digits
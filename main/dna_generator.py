@@ -1,19 +1,30 @@
 # Purpose:
-# This file generates NFT DNA based on a .blend file scene structure and exports NFTRecord.json.
+# This file generates NFT DNA based on a .blend file scene structure and exports NFTRecord.jsonl.
 
 import os
+import re
 import time
 import json
-import random
 import logging
+import itertools
 import traceback
-from functools import partial
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from . import logic, material_generator, helpers
+import numpy as np
+
+from . import helpers, sampler, dna_worker, dna_codec, derivation, record, batch_planner, render_costs, logic, \
+    layer_compositor
 from .helpers import TextColors
 
 log = logging.getLogger(__name__)
 
+# Saturation detection: DNA generation stops early once SATURATION_ROUNDS consecutive rounds of candidate DNA each add
+# less than SATURATION_YIELD new unique DNA per candidate.
+SATURATION_YIELD = 0.001
+SATURATION_ROUNDS = 3
+
 
 def generate_nft_dna(
         collection_size,
@@ -22,174 +33,397 @@ def generate_nft_dna(
         logic_file,
         enable_materials,
         materials_file,
+        time_budget=None,
+        attempt_budget=None,
+        seed=None,
+        workers=1,
+        previous_dna_list=None,
+        previous_derivation=None,
+        rarity_mode="weighted",
+        logic_mode="repair",
 ):
     """
-    Returns batchDataDictionary containing the number of NFT combinations, hierarchy, and the dna_list.
-    """
+    Returns batchDataDictionary containing the number of NFT combinations, hierarchy, and the dna_list. The dna_list is
+    a generator formatting one new DNA at a time, for record.RecordWriter.
 
-    hierarchy = helpers.get_hierarchy()
+    time_budget (seconds) and attempt_budget (number of candidate DNA) optionally bound the time spent drawing DNA when
+    Rarity or Logic limit the number of unique DNA that can be reached.
 
-    # DNA random, Rarity and Logic methods:
-    data_dictionary = {}
+    Candidate DNA are drawn in chunks seeded from seed (see dna_worker.py), a random seed is picked and logged when seed
+    is None. With workers > 1 chunks are generated in a process pool, the dna_list is the same for the same seed.
 
-    def create_dna_random(hierarchy):
-        """Creates a single DNA randomly without Rarity or Logic."""
-        dna_str = ""
-        dna_str_list = []
-        list_option_variant = []
+    previous_dna_list extends the dna_list entries of an existing record (see record.iter_dna()) up to collection_size
+    DNA, the returned dna_list then only holds the new DNA, numbered after the existing ones. When previous_derivation
+    was made with the same settings its candidate stream is continued, so the extended collection can still be
+    re-derived from NFTDerivation.json.
 
-        for i in hierarchy:
-            num_child = len(hierarchy[i])
-            possible_nums = list(range(1, num_child + 1))
-            list_option_variant.append(possible_nums)
+    rarity_mode "quota" turns every Variant's Rarity weight into an exact number of DNA instead of drawing each DNA
+    independently, see sampler.allocate_quotas(). Extensions allocate quotas for the new DNA only.
 
-        for i in list_option_variant:
-            random_variant_num = random.choices(i, k=1)
-            str1 = ''.join(str(e) for e in random_variant_num)
-            dna_str_list.append(str1)
-
-        for i in dna_str_list:
-            num = "-" + str(i)
-            dna_str += num
+    logic_mode "direct" draws DNA breaking a Logic rule again from the Variants the rules allow instead of repairing
+    them rule by rule, see constrained_sampler.py.
+    """
 
-        dna = ''.join(dna_str.split('-', 1))
+    hierarchy = helpers.get_hierarchy()
 
-        return str(dna)
+    # DNA random, Rarity and Logic methods:
+    data_dictionary = {}
 
-    def create_dna_rarity(hierarchy):
-        """
-        Sorts through data_dictionary and appropriately weights each variant based on their rarity percentage set in Blender
-        ("rarity" in DNA_Generator). Then
-        """
-        single_dna = ""
+    materials = None
+    if enable_materials:
+        with open(materials_file) as f:
+            materials = json.load(f)
+
+    # Packed DNA in order_num order, dicts keep insertion order where sets of integers would sort them:
+    unique_dna = {}
+    if previous_dna_list is not None:
+        previous_codec = dna_codec.DNACodec(hierarchy, materials)
+        unique_dna = dict.fromkeys(previous_codec.from_string(list(i.keys())[0]) for i in previous_dna_list)
+    num_previous = len(unique_dna)
+
+    if enable_rarity and enable_logic and rarity_mode == "quota":
+        log.warning(
+                f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                f"Rarity quotas cannot be kept exact while Logic rules change Variants. DNA will be drawn with the "
+                f"weighted Rarity mode instead.{TextColors.RESET}"
+        )
+        rarity_mode = "weighted"
+    use_quotas = enable_rarity and rarity_mode == "quota"
+
+    # Continue the candidate stream of the previous derivation if the settings did not change:
+    continue_derivation = (
+        previous_derivation is not None
+        and not use_quotas
+        and previous_derivation["fingerprint"] == derivation.fingerprint(
+            hierarchy,
+            enable_rarity,
+            enable_logic,
+            logic_file,
+            enable_materials,
+            materials,
+            rarity_mode,
+            logic_mode,
+        )
+    )
+    first_candidate = 0
+    skipped_candidates = []
+    num_discarded = 0  # Candidates Logic gave up on, see logic.MAX_REPAIR_STEPS
+
+    if continue_derivation:
+        seed = previous_derivation["seed"]
+        skipped_candidates = list(previous_derivation["skipped_candidates"])
+        # Every candidate drawn so far either became an order_num or was skipped:
+        first_candidate = num_previous + len(skipped_candidates)
+    elif num_previous and use_quotas:
+        log.info(
+                f"\nRarity quotas are allocated for the new DNA only, from a new seed. NFTDerivation.json will no "
+                f"longer be created for this collection."
+        )
+    elif num_previous:
+        log.info(
+                f"\nThe NFT Data settings or scene changed since the NFT record was created, new DNA are drawn from a "
+                f"new seed. NFTDerivation.json will no longer be created for this collection."
+        )
 
-        for i in hierarchy:
-            number_list_of_i = []
-            rarity_list_of_i = []
-            if_zero_bool = None
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    log.info(f"\nDNA seed: {seed}")
 
-            for k in hierarchy[i]:
-                number = hierarchy[i][k]["number"]
-                number_list_of_i.append(number)
+    chunk_generator_args = (
+        hierarchy,
+        seed,
+        enable_rarity,
+        enable_logic,
+        logic_file,
+        enable_materials,
+        materials_file,
+        materials,
+        logic_mode,
+    )
+    chunk_generator = dna_worker.DNAChunkGenerator(*chunk_generator_args)
+    if enable_logic and logic_mode == "repair":
+        logic.warn_rule_cycles(chunk_generator.logic_file)
+    codec = chunk_generator.codec
+    executor = None
 
-                rarity = hierarchy[i][k]["rarity"]
-                rarity_list_of_i.append(float(rarity))
+    def draw_candidates(first, num_candidates):
+        """Returns num_candidates candidate DNA starting at candidate number first, in candidate order."""
+        nonlocal executor
 
-            for x in rarity_list_of_i:
-                if x == 0:
-                    if_zero_bool = True
-                elif x != 0:
-                    if_zero_bool = False
+        first_chunk, offset = divmod(first, dna_worker.CHUNK_SIZE)
+        chunk_indices = range(first_chunk, -(-(first + num_candidates) // dna_worker.CHUNK_SIZE))
 
+        chunks = None
+        if executor is not None:
             try:
-                if if_zero_bool:
-                    variant_by_num = random.choices(number_list_of_i, k=1)
-                elif not if_zero_bool:
-                    variant_by_num = random.choices(number_list_of_i, weights=rarity_list_of_i, k=1)
-            except IndexError:
-                raise IndexError(
-                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                    f"An issue was found within the Attribute collection '{i}'. For more information on Blend_My_NFTs "
-                    f"compatible scenes, see:\n{TextColors.RESET}"
-                    f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+                chunks = list(executor.map(dna_worker.generate_chunk, chunk_indices))
+            except BrokenProcessPool:
+                log.warning(
+                        f"\n{traceback.format_exc()}"
+                        f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                        f"The DNA worker processes stopped unexpectedly. DNA will be generated in this process "
+                        f"instead, the generated DNA are the same.{TextColors.RESET}"
                 )
+                executor = None
+
+        if chunks is None:
+            chunks = list(map(chunk_generator.generate, chunk_indices))
 
-            single_dna += "-" + str(variant_by_num[0])
-        single_dna = ''.join(single_dna.split('-', 1))
-        return single_dna
+        return [dna for chunk in chunks for dna in chunk][offset:offset + num_candidates]
 
-    def single_complete_dna():
+    def create_unique_dna_sampled(unique_dna):
         """
-        This function applies Rarity and Logic to a single DNA created by createDNASingle() if Rarity or Logic specified
+        Draws rounds of candidate DNA until collection_size unique DNA are found, the rate of new unique DNA per round
+        collapses, or time_budget/attempt_budget run out. Returns why drawing stopped.
         """
+        nonlocal num_discarded
+
+        attempts = 0
+        stalled_rounds = 0
+        time_start = time.time()
+        next_candidate = first_candidate
+
+        # Rounds start with one chunk per worker and double while they keep yielding new DNA, so saturation is detected
+        # after a few thousand candidates instead of after a full collection_size worth of Logic and Materials:
+        max_round_chunks = workers
+
+        while len(unique_dna) < collection_size:
+            if attempt_budget is not None and attempts >= attempt_budget:
+                return f"the attempt budget of {attempt_budget} candidate DNA ran out"
+
+            if time_budget is not None and time.time() - time_start >= time_budget:
+                return f"the time budget of {time_budget}s ran out"
+
+            round_size = min(collection_size - len(unique_dna), max_round_chunks * dna_worker.CHUNK_SIZE)
+            round_size = max(round_size, dna_worker.CHUNK_SIZE)
+            if attempt_budget is not None:
+                round_size = min(round_size, attempt_budget - attempts)
+
+            num_unique_before = len(unique_dna)
+            attempts_before = attempts
+            for candidate in draw_candidates(next_candidate, round_size):
+                if len(unique_dna) == collection_size:
+                    break
+
+                # Candidate numbers of duplicates and discarded candidates are kept so order_nums can be mapped back
+                # to candidates:
+                if candidate is None:
+                    num_discarded += 1
+                    skipped_candidates.append(next_candidate)
+                elif candidate in unique_dna:
+                    skipped_candidates.append(next_candidate)
+                else:
+                    unique_dna[candidate] = None
+                next_candidate += 1
+                attempts += 1
+
+            round_yield = (len(unique_dna) - num_unique_before) / (attempts - attempts_before)
+            log.debug(f"\n{len(unique_dna)} unique DNA after {attempts} candidates, last round yield: {round_yield}")
+
+            if round_yield < SATURATION_YIELD and attempts - attempts_before >= dna_worker.CHUNK_SIZE:
+                stalled_rounds += 1
+                if stalled_rounds >= SATURATION_ROUNDS:
+                    return (
+                        f"less than {SATURATION_YIELD:.1%} of the candidate DNA were new for {SATURATION_ROUNDS} "
+                        f"rounds in a row"
+                    )
+            else:
+                stalled_rounds = 0
+                max_round_chunks = min(max_round_chunks * 2, max(workers, sampler.BLOCK_SIZE // dna_worker.CHUNK_SIZE))
+
+        return None
+
+    def create_unique_dna_permuted(unique_dna):
+        """
+        Walks a seeded permutation of the combination space and decodes each position into a DNA. Every position is a
+        different DNA, so nothing is rejected unless the DNA was already in previous_dna_list under another seed.
+        """
+        next_position = first_candidate
+        combinations = chunk_generator.sampling_table.combinations
 
-        single_dna = ""
-        if not enable_rarity:
-            single_dna = create_dna_random(hierarchy)
-            log.debug(
-                    f"\n================"
-                    f"\nOriginal DNA: {single_dna}"
-            )
-
-        if enable_rarity:
-            single_dna = create_dna_rarity(hierarchy)
-            log.debug(
-                    f"\n================"
-                    f"\nRarity DNA: {single_dna}"
-            )
-
-        if enable_logic:
-            single_dna = logic.logicafy_dna_single(hierarchy, single_dna, logic_file, enable_rarity)
-            log.debug(
-                    f"\n================"
-                    f"\nLogic DNA: {single_dna}"
-            )
+        while len(unique_dna) < collection_size and next_position < combinations:
+            num_positions = min(collection_size - len(unique_dna), combinations - next_position)
+            for candidate in draw_candidates(next_position, num_positions):
+                if candidate not in unique_dna:
+                    unique_dna[candidate] = None
+            next_position += num_positions
 
-        if enable_materials:
-            single_dna = material_generator.apply_materials(hierarchy, single_dna, materials_file, enable_rarity)
-            log.debug(
-                    f"\n================"
-                    f"\nMaterials DNA: {single_dna}"
-                    f"\n================\n"
+        return None
 
-            )
+    def create_unique_dna_quota(unique_dna):
+        """
+        Allocates the remaining DNA with exact Rarity quotas in one pass. Returns why fewer DNA than collection_size
+        were made, if so.
+        """
+        taken = [tuple(codec.decode(packed)[0]) for packed in unique_dna]
+        quota_dna, num_dropped = chunk_generator.generate_quota(collection_size - len(unique_dna), taken)
+        unique_dna.update(dict.fromkeys(quota_dna))
 
-        return single_dna
+        if num_dropped:
+            return f"{num_dropped} DNA could not be made unique without breaking the Rarity quotas"
+        return None
 
     def create_dna_list():
         """
-        Creates dna_list. Loops through createDNARandom() and applies Rarity, and Logic while checking if all DNA
-        are unique.
+        Creates dna_list. Draws candidate DNA chunks and applies Logic and Materials while checking if all DNA are
+        unique. DNA are deduplicated as packed integers and only formatted as strings for NFTRecord.jsonl.
         """
-        dna_set_return = set()
-
-        for i in range(collection_size):
-            dna_push_to_list = partial(single_complete_dna)
-
-            dna_set_return |= {''.join([dna_push_to_list()]) for _ in range(collection_size - len(dna_set_return))}
-
-        dna_list_non_formatted = list(dna_set_return)
+        nonlocal executor
+
+        if workers > 1 and not use_quotas:
+            executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=dna_worker.init_worker,
+                    initargs=chunk_generator_args,
+            )
 
-        dna_list_formatted = []
-        dna_counter = 1
-        for i in dna_list_non_formatted:
-            dna_list_formatted.append({
-                i: {
+        try:
+            if use_quotas:
+                stop_reason = create_unique_dna_quota(unique_dna)
+            elif chunk_generator.permutation is not None:
+                stop_reason = create_unique_dna_permuted(unique_dna)
+            else:
+                stop_reason = create_unique_dna_sampled(unique_dna)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if stop_reason is not None:
+            diagnose_saturation(hierarchy, codec, unique_dna, stop_reason, enable_rarity, enable_logic, logic_file)
+
+    def format_dna_list():
+        """Yields the new DNA formatted as dna_list entries."""
+        dna_counter = num_previous + 1
+        for i in itertools.islice(unique_dna, num_previous, None):
+            yield {
+                codec.to_string(i): {
                     "complete": False,
                     "order_num": dna_counter
                 }
-            })
+            }
 
             dna_counter += 1
 
-        return dna_list_formatted
+    create_dna_list()
 
-    dna_list = create_dna_list()
+    if num_discarded:
+        log.warning(
+                f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                f"{num_discarded} candidate DNA were left out because Logic rules kept changing them more than "
+                f"{logic.MAX_REPAIR_STEPS} times without satisfying every rule. Rules changing the same Attributes can "
+                f"undo each other's changes forever, review your Logic rules.{TextColors.RESET}"
+        )
 
-    helpers.raise_warning_collection_size(dna_list, collection_size)
+    helpers.raise_warning_collection_size(unique_dna, collection_size)
 
     # Data stored in batchDataDictionary:
-    data_dictionary["num_nfts_generated"] = len(dna_list)
+    data_dictionary["num_nfts_generated"] = len(unique_dna)
+    data_dictionary["seed"] = seed
     data_dictionary["hierarchy"] = hierarchy
-    data_dictionary["dna_list"] = dna_list
+    data_dictionary["dna_list"] = format_dna_list()
+
+    # Everything needed to re-derive any DNA from its order_num, saved to NFTDerivation.json by send_to_record. An
+    # extension drawn from a new seed cannot be re-derived:
+    data_dictionary["derivation"] = None
+    if continue_derivation or not num_previous:
+        data_dictionary["derivation"] = derivation.create_derivation(
+                hierarchy,
+                seed,
+                enable_rarity,
+                enable_logic,
+                logic_file,
+                enable_materials,
+                materials_file,
+                materials,
+                skipped_candidates,
+                rarity_mode,
+                collection_size,
+                logic_mode,
+        )
 
     return data_dictionary
 
 
+def diagnose_saturation(hierarchy, codec, unique_dna, stop_reason, enable_rarity, enable_logic, logic_file):
+    """
+    Logs which Attributes, and the Rarity weights or Logic rules touching them, limit the number of unique DNA that
+    could be reached when DNA generation stopped before reaching collection_size.
+    """
+
+    attributes = list(hierarchy.keys())
+    seen_numbers = [set() for _ in attributes]
+    for packed in unique_dna:
+        digits, material_digits = codec.decode(packed)
+        for seen, digit in zip(seen_numbers, digits):
+            seen.add(digit)
+
+    # Logic rules that select (THEN) or exclude (NOT) Variants of each Attribute:
+    limiting_rules = {a: [] for a in attributes}
+    if enable_logic:
+        for rule in logic_file:
+            for rule_type in ("THEN", "NOT"):
+                for item in logic_file[rule].get(rule_type, []):
+                    for a in attributes:
+                        if (item == a or item in hierarchy[a]) and rule not in limiting_rules[a]:
+                            limiting_rules[a].append(rule)
+
+    reachable_bound = 1
+    message = (
+        f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+        f"DNA generation stopped after finding {len(unique_dna)} unique DNA because {stop_reason}."
+    )
+    for a, seen in zip(attributes, seen_numbers):
+        reachable_bound *= max(len(seen), 1)
+        missing = [v for v in hierarchy[a] if int(hierarchy[a][v]["number"]) not in seen]
+        if not missing and not limiting_rules[a]:
+            continue
+
+        message += f"\n\n{a}: {len(hierarchy[a]) - len(missing)}/{len(hierarchy[a])} Variants were selected."
+        for v in missing:
+            reason = "weighted 0" if enable_rarity and float(hierarchy[a][v]["rarity"]) == 0 else "never selected"
+            message += f"\n - {v}: {reason}."
+        if 0 in seen:
+            message += f"\n - Set to Empty by Logic."
+        if limiting_rules[a]:
+            message += f"\n - Limited by Logic rules: {', '.join(limiting_rules[a])}."
+
+    message += (
+        f"\n\nAt most {reachable_bound} unique DNA can be made from the Variants that were selected."
+        f"\n{TextColors.RESET}"
+    )
+    log.warning(message)
+
+
 def make_batches(
         collection_size,
         nfts_per_batch,
         save_path,
-        batch_json_save_path
+        batch_json_save_path,
+        first_order_num=1,
+        batch_strategy="contiguous",
+        workers=1,
+        log_path=None,
+        batch_render_order="record",
 ):
     """
     Sorts through all the batches and outputs a given number of batches depending on collection_size and nfts_per_batch.
-    These files are then saved as Batch#.json files to batch_json_save_path
+    These files are then saved as Batch#.json files to batch_json_save_path by batch_planner.py, batch_strategy decides
+    which DNA go in which batch. The "by_cost" strategy estimates render costs from the batches already rendered to
+    save_path and from log_path, see render_costs.py. batch_render_order orders the DNA within each batch, see
+    render_order.py.
+
+    With first_order_num > 1 only DNA from first_order_num onwards are batched, into new Batch#.json files numbered
+    after the existing ones, which are kept.
     """
 
     # Clears the Batch Data folder of Batches:
     batch_list = os.listdir(batch_json_save_path)
-    if batch_list:
+    first_batch_num = 1
+    if first_order_num > 1:
+        batch_nums = [int(i[len("Batch"):-len(".json")]) for i in batch_list if re.fullmatch(r"Batch\d+\.json", i)]
+        first_batch_num = max(batch_nums, default=0) + 1
+    else:
         for i in batch_list:
             batch = os.path.join(batch_json_save_path, i)
             if os.path.exists(batch):
@@ -197,44 +431,73 @@ def make_batches(
                     os.path.join(batch_json_save_path, i)
                 )
 
-    blend_my_nf_ts_output = os.path.join(save_path, "Blend_My_NFTs Output", "NFT_Data")
-    nft_record_save_path = os.path.join(blend_my_nf_ts_output, "NFTRecord.json")
-    data_dictionary = json.load(open(nft_record_save_path))
+        # Layers cached by the composite render mode may not match the scene the new Batches come from:
+        layer_compositor.clear_layer_cache(save_path)
 
-    hierarchy = data_dictionary["hierarchy"]
-    dna_list = data_dictionary["dna_list"]
-
-    num_batches = collection_size // nfts_per_batch
-    remainder_dna = collection_size % nfts_per_batch
-    if remainder_dna > 0:
-        num_batches += 1
+    blend_my_nf_ts_output = os.path.join(save_path, "Blend_My_NFTs Output", "NFT_Data")
+    nft_batch_save_path = os.path.join(save_path, "Blend_My_NFTs Output", "Generated NFT Batches")
+
+    def estimate_costs(hierarchy, dna_strings):
+        return render_costs.estimate_costs(hierarchy, dna_strings, nft_batch_save_path, log_path)
+
+    num_batches = batch_planner.plan_batches(
+            record.find_record(blend_my_nf_ts_output),
+            batch_json_save_path,
+            collection_size,
+            nfts_per_batch,
+            batch_strategy,
+            first_order_num,
+            first_batch_num,
+            workers,
+            estimate_costs,
+            batch_render_order,
+    )
 
     log.info(
-            f"\nGenerating {num_batches} batch files. If the last batch isn't filled all the way the program will "
+            f"\nGenerated {num_batches} batch files. If the last batch isn't filled all the way the program will "
             f"operate normally."
     )
 
-    batches_dna_list = []
 
-    for i in range(num_batches):
-        if i != range(num_batches)[-1]:
-            batch_dna_list = list(dna_list[0:nfts_per_batch])
-            batches_dna_list.append(batch_dna_list)
+def load_previous_record(blend_my_nfts_output, derivation_save_path, collection_size):
+    """
+    Returns the path and number of DNA of an existing record to extend, and its NFTDerivation.json dictionary if there
+    is one.
+    """
+    nft_record_save_path = record.find_record(blend_my_nfts_output)
+    if nft_record_save_path is None:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"No NFTRecord.jsonl found in {blend_my_nfts_output}. Create NFT Data before extending it."
+                f"{TextColors.RESET}"
+        )
+        raise FileNotFoundError(record.record_path(blend_my_nfts_output))
 
-            dna_list = [x for x in dna_list if x not in batch_dna_list]
-        else:
-            batch_dna_list = dna_list
+    hierarchy = record.read_header(nft_record_save_path)["hierarchy"]
+    num_previous = record.count_dna(nft_record_save_path)
+
+    # DNA digits are positions in the Attribute list, new or removed Attributes would change what existing DNA mean:
+    if list(hierarchy.keys()) != list(helpers.get_hierarchy().keys()):
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"The Attributes in your .blend file no longer match the Attributes in the NFT record. NFT Data can "
+                f"only be extended with the same Attributes, in the same order.{TextColors.RESET}"
+        )
+        raise ValueError()
 
-        batch_dictionary = {
-            "nfts_in_batch": int(len(batch_dna_list)),
-            "hierarchy": hierarchy,
-            "batch_dna_list": batch_dna_list
-        }
+    if collection_size <= num_previous:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"The NFT record already holds {num_previous} DNA. Set the Collection Size above {num_previous} to "
+                f"extend it.{TextColors.RESET}"
+        )
+        raise ValueError()
 
-        batch_dictionary = json.dumps(batch_dictionary, indent=1, ensure_ascii=True)
+    previous_derivation = None
+    if os.path.exists(derivation_save_path):
+        previous_derivation = derivation.load_derivation(derivation_save_path)
 
-        with open(os.path.join(batch_json_save_path, f"Batch{i + 1}.json"), "w") as outfile:
-            outfile.write(batch_dictionary)
+    return nft_record_save_path, num_previous, previous_derivation
 
 
 def send_to_record(
@@ -249,13 +512,25 @@ def send_to_record(
         blend_my_nfts_output,
         batch_json_save_path,
         enable_debug,
-        log_path
+        log_path,
+        time_budget=None,
+        attempt_budget=None,
+        seed=None,
+        workers=1,
+        extend=False,
+        rarity_mode="weighted",
+        batch_strategy="contiguous",
+        batch_render_order="record",
+        logic_mode="repair",
 ):
     """
-   Creates NFTRecord.json file and sends "batch_data_dictionary" to it. NFTRecord.json is a permanent record of all DNA
-   you've generated with all attribute variants. If you add new variants or attributes to your .blend file, other scripts
-   need to reference this .json file to generate new DNA and make note of the new attributes and variants to prevent
-   repeat DNA.
+   Creates NFTRecord.jsonl file and sends "batch_data_dictionary" to it. NFTRecord.jsonl is a permanent record of all
+   DNA you've generated with all attribute variants, see record.py. If you add new variants or attributes to your .blend
+   file, other scripts need to reference this file to generate new DNA and make note of the new attributes and variants
+   to prevent repeat DNA.
+
+   With extend=True the existing NFTRecord.jsonl is extended up to collection_size DNA instead. Existing DNA, order_nums
+   and Batch#.json files are kept and only the new DNA are batched.
    """
 
     # Checking Scene is compatible with BMNFTs:
@@ -277,20 +552,57 @@ def send_to_record(
                 f"\n - Rarity is ON. Weights listed in .blend scene will be taken into account."
                 f""
         )
+        if rarity_mode == "quota":
+            log.info(f"\n - Rarity quotas are ON. Every Variant will appear exactly its share of the collection.")
 
     if enable_logic:
         log.info(
                 f"\n - Logic is ON. {len(list(logic_file.keys()))} rules detected, implementation will "
                 f"be attempted."
         )
+        if logic_mode == "direct":
+            log.info(f"\n - Logic is direct. DNA breaking a rule are drawn again from the Variants the rules allow.")
 
     if enable_materials:
         log.info(
                 f"\n - Materials are ON. {len(list(json.load(open(materials_file)).keys()))} materials "
                 f"instances detected, implementation will be attempted."
         )
+
+    if enable_logic or enable_materials:
+        valid_combinations = helpers.get_valid_combinations(
+                enable_rarity,
+                enable_logic,
+                logic_file,
+                enable_materials,
+                materials_file,
+        )
+        if valid_combinations is None:
+            log.info(f"\n - The Logic rules link too many Attributes to count the valid combinations exactly.")
+        else:
+            log.info(f"\n - {valid_combinations} combinations are valid under these settings.")
+
+        if valid_combinations is not None and valid_combinations < collection_size:
+            log.warning(
+                    f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                    f"Only {valid_combinations} unique NFT DNA can be generated under your Rarity, Logic and Materials "
+                    f"settings, fewer than the Collection Size of {collection_size}.{TextColors.RESET}"
+            )
     time_start = time.time()
 
+    nft_record_save_path = record.record_path(blend_my_nfts_output)
+    derivation_save_path = os.path.join(blend_my_nfts_output, "NFTDerivation.json")
+
+    previous_record_path = None
+    num_previous = 0
+    previous_derivation = None
+    if extend:
+        previous_record_path, num_previous, previous_derivation = load_previous_record(
+                blend_my_nfts_output,
+                derivation_save_path,
+                collection_size,
+        )
+
     def create_nft_data():
         try:
             data_dictionary = generate_nft_dna(
@@ -300,24 +612,26 @@ def send_to_record(
                     logic_file,
                     enable_materials,
                     materials_file,
+                    time_budget,
+                    attempt_budget,
+                    seed,
+                    workers,
+                    record.iter_dna(previous_record_path) if extend else None,
+                    previous_derivation,
+                    rarity_mode,
+                    logic_mode,
             )
-            nft_record_save_path = os.path.join(blend_my_nfts_output, "NFTRecord.json")
 
             # Checks:
             helpers.raise_warning_max_nfts(nfts_per_batch, collection_size)
-            helpers.check_duplicates(data_dictionary["dna_list"])
             helpers.raise_error_zero_combinations()
 
-            if enable_rarity:
-                helpers.check_rarity(data_dictionary["hierarchy"], data_dictionary["dna_list"],
-                                     os.path.join(save_path, "Blend_My_NFTs Output/NFT_Data"))
-
         except FileNotFoundError:
             log.error(
                     f"\n{traceback.format_exc()}"
                     f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                    f"Data not saved to NFTRecord.json, file not found. Check that your save path, logic file path, or "
-                    f"materials file path is correct. For more information, see:\n{TextColors.RESET}"
+                    f"Data not saved to NFTRecord.jsonl, file not found. Check that your save path, logic file path, "
+                    f"or materials file path is correct. For more information, see:\n{TextColors.RESET}"
                     f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
             )
             raise
@@ -326,20 +640,35 @@ def send_to_record(
             loading.stop()
 
         try:
-            ledger = json.dumps(data_dictionary, indent=1, ensure_ascii=True)
-            with open(nft_record_save_path, 'w') as outfile:
-                outfile.write(ledger + '\n')
+            collection_derivation = data_dictionary.pop("derivation")
+            if collection_derivation is not None:
+                derivation.save_derivation(collection_derivation, derivation_save_path)
+            elif os.path.exists(derivation_save_path):
+                os.remove(derivation_save_path)
+
+            # DNA are formatted and written one at a time, an extension copies the existing DNA first:
+            with record.RecordWriter(nft_record_save_path, data_dictionary["hierarchy"], data_dictionary["seed"]) as w:
+                if extend:
+                    w.write_all(record.iter_dna(previous_record_path))
+                w.write_all(data_dictionary["dna_list"])
 
             log.info(
-                    f"\n{TextColors.OK}{len(data_dictionary['dna_list'])} NFT data successfully saved to:"
+                    f"\n{TextColors.OK}{w.num_dna} NFT data successfully saved to:"
                     f"\n{nft_record_save_path}{TextColors.RESET}"
             )
 
+            # Checks, reading the record back one DNA at a time:
+            helpers.check_duplicates(record.iter_dna(nft_record_save_path))
+
+            if enable_rarity:
+                helpers.check_rarity(data_dictionary["hierarchy"], record.iter_dna(nft_record_save_path),
+                                     os.path.join(save_path, "Blend_My_NFTs Output/NFT_Data"))
+
         except Exception:
             log.error(
                     f"\n{traceback.format_exc()}"
                     f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                    f"Data not saved to NFTRecord.json. Please review your Blender scene and ensure it follows "
+                    f"Data not saved to NFTRecord.jsonl. Please review your Blender scene and ensure it follows "
                     f"the naming conventions and scene structure. For more information, "
                     f"see:\n{TextColors.RESET}"
                     f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
@@ -349,7 +678,17 @@ def send_to_record(
     # Loading Animation:
     loading = helpers.Loader(f'\nCreating NFT DNA...', '').start()
     create_nft_data()
-    make_batches(collection_size, nfts_per_batch, save_path, batch_json_save_path)
+    make_batches(
+            collection_size,
+            nfts_per_batch,
+            save_path,
+            batch_json_save_path,
+            num_previous + 1,
+            batch_strategy,
+            workers,
+            log_path,
+            batch_render_order,
+    )
     loading.stop()
 
     time_end = time.time()
@@ -0,0 +1,112 @@
+# Purpose:
+# This file checks the DNA of an NFT record or of a Batch#.json file against Logic rules without generating anything.
+# The DNA are loaded into a single matrix of Variant order numbers and every compiled rule is checked against all of
+# them at once with RuleTable.violation_matrix(). It does not import bpy and can be run on its own:
+#
+#   python -m main.dna_validator <path to NFTRecord.jsonl or Batch#.json> <path to Logic.json>
+
+import sys
+import json
+import logging
+
+import numpy as np
+
+from . import record, rule_compiler
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+# Number of order_nums listed for each broken rule:
+MAX_LISTED_ORDER_NUMS = 100
+
+
+def read_dna_file(file_name):
+    """Returns the hierarchy and the dna_list entries of an NFT record or a Batch#.json file."""
+    if file_name.endswith((record.RECORD_FILE_NAME, record.LEGACY_RECORD_FILE_NAME)):
+        return record.read_header(file_name)["hierarchy"], record.read_dna_list(file_name)
+
+    with open(file_name) as f:
+        batch = json.load(f)
+    return batch["hierarchy"], batch["batch_dna_list"]
+
+
+def load_dna_matrix(dna_list, num_attributes):
+    """
+    Returns the order_nums of dna_list entries and an (N x Attributes) matrix of their Variant order numbers, Material
+    DNA left out.
+    """
+    order_nums = []
+    dna_strings = []
+    for entry in dna_list:
+        for single_dna, dna_data in entry.items():
+            order_nums.append(dna_data["order_num"])
+            dna_strings.append(single_dna.partition(":")[0])
+
+    if not dna_strings:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, num_attributes), dtype=np.int64)
+
+    # Parsing all DNA at once is much faster than splitting them one at a time:
+    digits = np.fromstring(" ".join(dna_strings).replace("-", " "), dtype=np.int64, sep=" ")
+    num_separators = num_attributes - 1
+    if len(digits) != len(dna_strings) * num_attributes or any(s.count("-") != num_separators for s in dna_strings):
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"Some DNA do not have one Variant for each of the {num_attributes} Attributes of the hierarchy. They "
+                f"cannot be validated.{TextColors.RESET}"
+        )
+        raise ValueError()
+
+    dna_matrix = digits.reshape(len(dna_strings), num_attributes)
+    return np.array(order_nums, dtype=np.int64), dna_matrix
+
+
+def find_violations(hierarchy, logic_file, dna_list):
+    """
+    Returns {rule name: [order_nums]} of the rules in logic_file broken by DNA in dna_list, in rule order. Rules broken
+    by no DNA are left out.
+    """
+    rule_table = rule_compiler.compile_rules(hierarchy, logic_file, False)
+    order_nums, dna_matrix = load_dna_matrix(dna_list, len(rule_table.hierarchy))
+
+    violating_rows = {}
+    violations = rule_table.violation_matrix(dna_matrix)
+    for j, rule in enumerate(rule_table.rules):
+        # The THEN and NOT parts of a rule are reported together:
+        rows = violating_rows.get(rule.name, np.zeros(len(order_nums), dtype=bool))
+        violating_rows[rule.name] = rows | violations[:, j]
+
+    return {name: order_nums[rows].tolist() for name, rows in violating_rows.items() if rows.any()}
+
+
+def validate_dna_file(file_name, logic_file):
+    """
+    Checks every DNA of an NFT record or Batch#.json file against the rules of logic_file, a Logic.json dictionary.
+    Logs and returns {rule name: [order_nums]} of the broken rules.
+    """
+    hierarchy, dna_list = read_dna_file(file_name)
+    violations = find_violations(hierarchy, logic_file, dna_list)
+
+    if violations:
+        message = (
+            f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+            f"DNA in {file_name} break {len(violations)} of the {len(logic_file)} Logic rules:"
+        )
+        for name, order_nums in violations.items():
+            listed = ", ".join(str(i) for i in order_nums[:MAX_LISTED_ORDER_NUMS])
+            if len(order_nums) > MAX_LISTED_ORDER_NUMS:
+                listed += ", ..."
+            message += f"\n - {name}: {len(order_nums)} DNA, order_nums: {listed}"
+        log.warning(message + TextColors.RESET)
+    else:
+        log.info(
+                f"\n{TextColors.OK}All DNA in {file_name} satisfy the {len(logic_file)} Logic rules.{TextColors.RESET}"
+        )
+
+    return violations
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with open(sys.argv[2]) as f:
+        broken_rules = validate_dna_file(sys.argv[1], json.load(f))
+    sys.exit(1 if broken_rules else 0)
@@ -0,0 +1,203 @@
+# Purpose:
+# This file generates candidate NFT DNA in fixed size chunks for dna_generator.py. Every chunk is drawn from its own
+# seed derived from the collection seed and the chunk index, so chunks can be generated in any order, in any process,
+# and merged back into the same dna_list. It does not import bpy so it can run in a process pool outside of Blender.
+
+import random
+import logging
+
+import numpy as np
+
+from . import logic, material_generator, sampler, dna_codec, rule_compiler, constrained_sampler
+from .compiled_hierarchy import compile_hierarchy
+
+log = logging.getLogger(__name__)
+
+# Number of candidate DNA in a chunk:
+CHUNK_SIZE = 1024
+
+# Seeds of Rarity quota allocations are spawned under this key, apart from the seeds of candidate chunks:
+QUOTA_SPAWN_KEY = 1
+
+
+class DNAChunkGenerator:
+    """
+    Draws chunk number chunk_index of the candidate DNA stream defined by the hierarchy, seed, Rarity, Logic and
+    Materials settings. Candidate chunk_index * CHUNK_SIZE + i is always the same DNA for the same settings.
+
+    logic_mode "repair" applies the Logic rules to DNA breaking them, one rule at a time (see logic.py). "direct" draws
+    those DNA again from the Variants the rules allow instead, see constrained_sampler.py.
+    """
+
+    def __init__(
+            self,
+            hierarchy,
+            seed,
+            enable_rarity,
+            enable_logic,
+            logic_file,
+            enable_materials,
+            materials_file,
+            materials,
+            logic_mode="repair",
+    ):
+        self.hierarchy = compile_hierarchy(hierarchy)  # Shared by sampling, Logic, Materials and packing
+        self.seed = seed
+        self.enable_rarity = enable_rarity
+        self.enable_logic = enable_logic
+        self.logic_file = logic_file
+        self.enable_materials = enable_materials
+        self.materials_file = materials_file
+        self.logic_mode = logic_mode
+
+        self.sampling_table = sampler.SamplingTable(self.hierarchy, enable_rarity)
+        self.codec = dna_codec.DNACodec(self.hierarchy, materials)
+
+        # The Materials file is compiled once, not read again for every DNA:
+        self.materials_catalog = None
+        if enable_materials:
+            self.materials_catalog = material_generator.MaterialsCatalog(self.hierarchy, materials, enable_rarity)
+
+        # Logic rules are compiled once, not for every DNA:
+        self.constrained_sampler = None
+        if enable_logic:
+            self.logic_file = rule_compiler.compile_rules(self.hierarchy, logic_file, enable_rarity)
+            if logic_mode == "direct":
+                self.constrained_sampler = constrained_sampler.ConstrainedSampler(self.logic_file, enable_rarity)
+
+        # Random mode walks a permutation of the combination space instead, every candidate is unique:
+        self.permutation = None
+        if not enable_rarity and not enable_logic and self.sampling_table.combinations <= sampler.MAX_PERMUTATION_SIZE:
+            self.permutation = sampler.IndexPermutation(self.sampling_table.combinations, seed)
+
+    def chunk_rngs(self, chunk_index):
+        """Returns the NumPy Generator and random.Random instance of a chunk."""
+        numpy_seed, python_seed = np.random.SeedSequence([self.seed, chunk_index]).spawn(2)
+        return np.random.default_rng(numpy_seed), random.Random(int(python_seed.generate_state(1, np.uint64)[0]))
+
+    def single_complete_dna(self, digits, rng, apply_logic=True):
+        """
+        This function applies Logic and Materials to a single DNA if Logic or Materials specified, then packs it.
+        Logic is skipped with apply_logic=False, for DNA known to break no rule.
+        """
+        debug = log.isEnabledFor(logging.DEBUG)
+
+        if debug:
+            log.debug(
+                    f"\n================"
+                    f"\n{'Rarity' if self.enable_rarity else 'Original'} DNA: {dna_codec.format_dna(digits)}"
+            )
+
+        if self.enable_logic and apply_logic:
+            digits = logic.logicafy_dna_single(self.hierarchy, digits, self.logic_file, self.enable_rarity, rng)
+            if debug:
+                log.debug(
+                        f"\n================"
+                        f"\nLogic DNA: {dna_codec.format_dna(digits)}"
+                )
+                logic.check_logic_dna(self.logic_file, digits)
+
+        material_digits = None
+        if self.enable_materials:
+            material_digits = material_generator.apply_materials(
+                    self.hierarchy,
+                    digits,
+                    self.materials_catalog,
+                    self.enable_rarity,
+                    rng,
+            )
+            if debug:
+                log.debug(
+                        f"\n================"
+                        f"\nMaterials DNA: {dna_codec.format_dna(digits, material_digits)}"
+                        f"\n================\n"
+                )
+
+        return self.codec.encode(digits, material_digits)
+
+    def logic_dna(self, digits, rng):
+        """single_complete_dna() of a DNA going through Logic, None if Logic gave up on it (see logic.py)."""
+        try:
+            return self.single_complete_dna(digits, rng)
+        except logic.RepairLimitReached as error:
+            log.debug(f"\n{error} The candidate DNA is discarded.")
+            return None
+
+    def generate(self, chunk_index):
+        """
+        Returns the packed candidate DNA of chunk chunk_index, in candidate order and including duplicates. Candidates
+        Logic gave up on are None.
+        """
+        numpy_rng, python_rng = self.chunk_rngs(chunk_index)
+
+        if self.permutation is not None:
+            start = chunk_index * CHUNK_SIZE
+            stop = min(start + CHUNK_SIZE, self.sampling_table.combinations)
+            positions = np.arange(start, max(start, stop), dtype=np.uint64)
+            dna_matrix = self.sampling_table.decode_indices(self.permutation.permute(positions))
+        else:
+            dna_matrix = self.sampling_table.sample(CHUNK_SIZE, numpy_rng)
+
+        if self.enable_logic:
+            if self.constrained_sampler is not None:
+                # In direct mode, DNA breaking a rule are re-drawn breaking none, in order:
+                broken = self.logic_file.violation_matrix(dna_matrix).any(axis=1)
+                for i in np.flatnonzero(broken).tolist():
+                    dna_matrix[i] = self.constrained_sampler.sample(python_rng)
+                broken[:] = False
+            else:
+                # The whole chunk is checked against the rules at once. DNA no rule applies to are left unchanged by
+                # Logic and draw nothing from python_rng, only the others go through Logic one at a time:
+                broken = self.logic_file.repair_matrix(dna_matrix).any(axis=1)
+
+            if not self.enable_materials:
+                packed_dna = self.codec.encode_matrix(dna_matrix)
+                for i in np.flatnonzero(broken).tolist():
+                    packed_dna[i] = self.logic_dna(dna_matrix[i].tolist(), python_rng)
+                return packed_dna
+
+            # Logic draws from python_rng between the Materials of DNA, they are applied one DNA at a time:
+            if broken.any():
+                return [
+                    self.logic_dna(digits, python_rng) if apply_logic
+                    else self.single_complete_dna(digits, python_rng, False)
+                    for digits, apply_logic in zip(dna_matrix.tolist(), broken.tolist())
+                ]
+
+        return self.encode_with_materials(dna_matrix, python_rng)
+
+    def encode_with_materials(self, dna_matrix, rng):
+        """
+        Packs every row of a DNA matrix that needs no Logic, with Materials drawn for the whole matrix at once when
+        enabled. Draws the same Materials from rng as single_complete_dna() on each row in turn.
+        """
+        if not self.enable_materials:
+            return self.codec.encode_matrix(dna_matrix)
+        if log.isEnabledFor(logging.DEBUG):
+            return [self.single_complete_dna(digits, rng, False) for digits in dna_matrix.tolist()]
+        return self.codec.encode_matrix(dna_matrix, self.materials_catalog.sample_matrix(dna_matrix, rng))
+
+    def generate_quota(self, num_dna, taken=()):
+        """
+        Returns num_dna packed DNA in which every Variant appears exactly its Rarity quota number of times, see
+        sampler.allocate_quotas(), and the number of DNA left out because no unique DNA could be made for them.
+        """
+        numpy_seed, python_seed = np.random.SeedSequence(self.seed, spawn_key=(QUOTA_SPAWN_KEY,)).spawn(2)
+        python_rng = random.Random(int(python_seed.generate_state(1, np.uint64)[0]))
+
+        dna_matrix, num_dropped = self.sampling_table.allocate_quotas(num_dna, np.random.default_rng(numpy_seed), taken)
+
+        return self.encode_with_materials(dna_matrix, python_rng), num_dropped
+
+
+# Process pool entry points, each worker process builds its own DNAChunkGenerator once:
+_chunk_generator = None
+
+
+def init_worker(*args):
+    global _chunk_generator
+    _chunk_generator = DNAChunkGenerator(*args)
+
+
+def generate_chunk(chunk_index):
+    return _chunk_generator.generate(chunk_index)
@@ -11,9 +11,13 @@ import smtplib
 import logging
 import datetime
 import platform
-import traceback
 
+from . import progress_journal, state_store, layer_compositor, layer_renderer
 from .helpers import TextColors, Loader
+from .dna_codec import parse_dna
+from .material_generator import load_materials_catalog
+from .scene_state import SceneState
+from .compiled_hierarchy import compile_hierarchy
 from .metadata_templates import create_cardano_metadata, createSolanaMetaData, create_erc721_meta_data
 
 log = logging.getLogger(__name__)
@@ -62,6 +66,7 @@ def save_generation_state(input):
 
                     "enable_images": input.enable_images,
                     "image_file_format": input.image_file_format,
+                    "render_mode": input.render_mode,
 
                     "enable_animations": input.enable_animations,
                     "animation_file_format": input.animation_file_format,
@@ -111,14 +116,19 @@ def save_generation_state(input):
     save_batch(batch, file_name)
 
 
-def save_completed(full_single_dna, a, x, batch_json_save_path, batch_to_generate):
-    """Saves progress of rendering to batch.json file."""
+def save_completed(completed, batch_json_save_path, batch_to_generate):
+    """
+    Saves progress of rendering to batch.json file once the Batch is rendered, completed flags each position of
+    batch_dna_list. Progress is kept in the Batch's progress journal until then, see progress_journal.py.
+    """
 
     file_name = os.path.join(batch_json_save_path, "Batch{}.json".format(batch_to_generate))
     batch = json.load(open(file_name))
-    index = batch["batch_dna_list"].index(a)
-    batch["batch_dna_list"][index][full_single_dna]["complete"] = True
-    batch["Generation Save"][-1]["DNA Generated"] = x
+    for entry, is_completed in zip(batch["batch_dna_list"], completed):
+        if is_completed:
+            for dna_data in entry.values():
+                dna_data["complete"] = True
+    batch["Generation Save"][-1]["DNA Generated"] = sum(completed)
 
     save_batch(batch, file_name)
 
@@ -139,6 +149,58 @@ def get_batch_data(batch_to_generate, batch_json_save_path):
     return nfts_in_batch, hierarchy, batch_dna_list
 
 
+def composite_batch_images(input, batch_dna_list, completed, hierarchy, scene_state, materials_catalog=None):
+    """
+    Composites the images of the NFTs of batch_dna_list not completed yet from layers, rendering the layers missing
+    from the Layer_Cache folder first. See layer_compositor.py.
+    """
+    layer_compositor.check_file_format(input.image_file_format)
+    layer_renderer.check_composite_scene()
+
+    cache_folder = layer_compositor.layer_cache_path(input.save_path, layer_renderer.render_resolution())
+    image_folder = os.path.join(input.nft_batch_save_path, "Batch" + str(input.batch_to_generate), "Images")
+
+    image_paths = []
+    image_layers = []
+    for position, a in enumerate(batch_dna_list):
+        if completed[position]:
+            continue
+        full_single_dna = list(a.keys())[0]
+        digits, material_digits = parse_dna(full_single_dna)
+
+        name = input.nft_name + "_" + str(a[full_single_dna]['order_num'] + input.order_num_offset)
+        image_paths.append(os.path.join(image_folder, name))
+        image_layers.append(layer_compositor.nft_layers(hierarchy, digits, material_digits, materials_catalog))
+
+    if input.enable_debug or not image_paths:
+        return
+
+    layer_renderer.render_layers(
+            cache_folder,
+            [layer for layers in image_layers for layer in layers],
+            scene_state,
+            materials_catalog,
+    )
+
+    os.makedirs(image_folder, exist_ok=True)
+    composite_time_start = time.time()
+
+    # Compositing uses every CPU unless a number of workers is given:
+    workers = input.workers if input.workers > 1 else os.cpu_count() or 1
+    layer_compositor.composite_images(
+            (
+                (image_path, input.image_file_format, [layer_compositor.layer_file(cache_folder, *l) for l in layers])
+                for image_path, layers in zip(image_paths, image_layers)
+            ),
+            workers,
+    )
+
+    log.info(
+            f"{TextColors.OK}TIME [Composited {len(image_paths)} Images]: {time.time() - composite_time_start}s."
+            f"\n{TextColors.RESET}"
+    )
+
+
 def render_and_save_nfts(input):
     """
     Renders the NFT DNA in a Batch#.json, where # is renderBatch in config.py. Turns off the viewport camera and
@@ -146,6 +208,7 @@ def render_and_save_nfts(input):
     """
 
     time_start_1 = time.time()
+    nft_render_times = {}  # Render time of every NFT generated, by DNA
 
     # If failed Batch is detected and user is resuming its generation:
     if input.fail_state:
@@ -153,9 +216,11 @@ def render_and_save_nfts(input):
                 f"{TextColors.OK}\nResuming Batch #{input.failed_batch}{TextColors.RESET}"
         )
         nfts_in_batch, hierarchy, batch_dna_list = get_batch_data(input.failed_batch, input.batch_json_save_path)
-        for a in range(input.failed_dna):
-            del batch_dna_list[0]
-        x = input.failed_dna + 1
+        journal_file = progress_journal.journal_path(input.batch_json_save_path, input.batch_to_generate)
+
+        # NFTs that finished rendering before the failure are skipped:
+        completed = progress_journal.read_completed(journal_file, len(batch_dna_list), input.failed_dna)
+        x = sum(completed) + 1
 
     # If user is generating the normal way:
     else:
@@ -164,121 +229,97 @@ def render_and_save_nfts(input):
         )
         nfts_in_batch, hierarchy, batch_dna_list = get_batch_data(input.batch_to_generate, input.batch_json_save_path)
         save_generation_state(input)
+        journal_file = progress_journal.journal_path(input.batch_json_save_path, input.batch_to_generate)
+        completed = bytearray(len(batch_dna_list))
         x = 1
 
+    # Status, timings and attempts of the Batch and its NFTs, read by the UI and the headless CLI:
+    generation_state = state_store.StateStore(input.batch_json_save_path)
+    generation_state.start_batch(
+            input.batch_to_generate,
+            [list(a.values())[0]['order_num'] for a in batch_dna_list],
+            completed,
+    )
+
+    # Every NFT rendered is appended to the journal instead of rewriting Batch#.json. The journal decides which NFTs
+    # are done, GenerationState.db follows it each time journal lines are synced to disk:
+    journal = progress_journal.ProgressJournal(
+            journal_file,
+            input.batch_to_generate,
+            len(batch_dna_list),
+            resume=bool(input.fail_state),
+            on_sync=lambda entries: generation_state.complete_nfts(input.batch_to_generate, entries),
+    )
+
+    # Variants are looked up by order number in the compiled hierarchy, see compiled_hierarchy.py:
+    compiled_hierarchy = compile_hierarchy(hierarchy)
+
+    # The Materials file is read once for the whole Batch, see material_generator.MaterialsCatalog:
     if input.enable_materials:
-        materials_file = json.load(open(input.materials_file))
+        materials_catalog = load_materials_catalog(compiled_hierarchy, input.materials_file)
+
+    # Collections and Materials are only changed where an NFT differs from the one before, see scene_state.py:
+    scene_state = SceneState(hierarchy)
+
+    # In composite render mode every image is composited from layers up front instead of rendered in the loop:
+    composite_images = input.enable_images and input.render_mode == "composite"
+    if composite_images:
+        composite_batch_images(
+                input,
+                batch_dna_list,
+                completed,
+                compiled_hierarchy,
+                scene_state,
+                materials_catalog if input.enable_materials else None,
+        )
+
+    for position, a in enumerate(batch_dna_list):
+        if completed[position]:
+            continue
 
-    for a in batch_dna_list:
         full_single_dna = list(a.keys())[0]
         order_num_offset = input.order_num_offset
         order_num = a[full_single_dna]['order_num'] + order_num_offset
 
-        # Material handling:
-        if input.enable_materials:
-            single_dna, material_dna = full_single_dna.split(':')
-
-        if not input.enable_materials:
-            single_dna = full_single_dna
+        # DNA is parsed once into Variant and Material order numbers, see dna_codec.py:
+        digits, material_digits = parse_dna(full_single_dna)
 
-        def match_dna_to_variant(single_dna):
+        def match_dna_to_variant(digits):
             """
-            Matches each DNA number separated by "-" to its attribute, then its variant.
+            Matches each Variant order number in digits to its attribute, then its variant.
             """
+            return compiled_hierarchy.match_dna(digits)
 
-            list_attributes = list(hierarchy.keys())
-            list_dna_deconstructed = single_dna.split('-')
-            dna_dictionary = {}
-
-            for i, j in zip(list_attributes, list_dna_deconstructed):
-                dna_dictionary[i] = j
-
-            for x in dna_dictionary:
-                for k in hierarchy[x]:
-                    k_num = hierarchy[x][k]["number"]
-                    if k_num == dna_dictionary[x]:
-                        dna_dictionary.update({x: k})
-            return dna_dictionary
-
-        def match_material_dna_to_material(single_dna, material_dna, materials_file):
+        def match_material_dna_to_material(digits, material_digits, materials_catalog):
             """
             Matches the Material DNA to it's selected Materials unless a 0 is present meaning no material for that variant was selected.
             """
-            list_attributes = list(hierarchy.keys())
-            list_dna_deconstructed = single_dna.split('-')
-            list_material_dna_deconstructed = material_dna.split('-')
-
             full_dna_dict = {}
 
-            for attribute, variant, material in zip(
-                    list_attributes,
-                    list_dna_deconstructed,
-                    list_material_dna_deconstructed
-            ):
+            for variant, material in zip(match_dna_to_variant(digits).values(), material_digits):
+                if material != 0:  # If material is not empty
+                    # Getting Materials name from Materials index in the Materials List
+                    material = materials_catalog.material_name(variant, material)
 
-                for var in hierarchy[attribute]:
-                    if hierarchy[attribute][var]['number'] == variant:
-                        variant = var
-
-                if material != '0':  # If material is not empty
-                    for variant_m in materials_file:
-                        if variant == variant_m:
-                            # Getting Materials name from Materials index in the Materials List
-                            materials_list = list(materials_file[variant_m]["Material List"].keys())
-
-                            material = materials_list[int(material) - 1]  # Subtract 1 because '0' means empty mat
-                            break
-
-                full_dna_dict[variant] = material
+                full_dna_dict[variant] = str(material)
 
             return full_dna_dict
 
         metadata_material_dict = {}
 
         if input.enable_materials:
-            material_dna_dictionary = match_material_dna_to_material(single_dna, material_dna, materials_file)
+            material_dna_dictionary = match_material_dna_to_material(digits, material_digits, materials_catalog)
 
             for var_mat in list(material_dna_dictionary.keys()):
                 if material_dna_dictionary[var_mat]!='0':
-                    if not materials_file[var_mat]['Variant Objects']:
-                        """
-                        If objects to apply material to not specified, apply to all objects in Variant collection.
-                        """
-                        metadata_material_dict[var_mat] = material_dna_dictionary[var_mat]
-
-                        for obj in bpy.data.collections[var_mat].all_objects:
-                            selected_object = bpy.data.objects.get(obj.name)
-                            selected_object.active_material = bpy.data.materials[material_dna_dictionary[var_mat]]
-
-                    if materials_file[var_mat]['Variant Objects']:
-                        """
-                        If objects to apply material to are specified, apply material only to objects specified withing 
-                        the Variant collection.
-                        """
-                        metadata_material_dict[var_mat] = material_dna_dictionary[var_mat]
-
-                        for obj in materials_file[var_mat]['Variant Objects']:
-                            selected_object = bpy.data.objects.get(obj)
-                            selected_object.active_material = bpy.data.materials[material_dna_dictionary[var_mat]]
-
-        # Turn off render camera and viewport camera for all collections in hierarchy
-        for i in hierarchy:
-            for j in hierarchy[i]:
-                try:
-                    bpy.data.collections[j].hide_render = True
-                    bpy.data.collections[j].hide_viewport = True
-                except KeyError:
-                    log.error(
-                            f"\n{traceback.format_exc()}"
-                            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                            f"The Collection '{j}' appears to be missing or has been renamed. If you made any changes "
-                            f"to your .blend file scene, ensure you re-create your NFT Data so Blend_My_NFTs can read "
-                            f"your scene. For more information see:{TextColors.RESET}"
-                            f"\nhttps://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
-                    )
-                    raise TypeError()
-
-        dna_dictionary = match_dna_to_variant(single_dna)
+                    """
+                    If objects to apply material to are specified, apply material only to objects specified withing
+                    the Variant collection. Otherwise apply to all objects in Variant collection.
+                    """
+                    metadata_material_dict[var_mat] = material_dna_dictionary[var_mat]
+                    scene_state.apply_material(var_mat, material_dna_dictionary[var_mat], materials_catalog)
+
+        dna_dictionary = match_dna_to_variant(digits)
         name = input.nft_name + "_" + str(order_num)
 
         # Change Text Object in Scene to match DNA string:
@@ -299,11 +340,8 @@ def render_and_save_nfts(input):
 
         log.info(f"\nDNA Code:{full_single_dna}")
 
-        for c in dna_dictionary:
-            collection = dna_dictionary[c]
-            if collection != '0':
-                bpy.data.collections[collection].hide_render = False
-                bpy.data.collections[collection].hide_viewport = False
+        # Turn off render camera and viewport camera for all collections in hierarchy but the selected Variants:
+        scene_state.show_variants(dna_dictionary.values())
 
         time_start_2 = time.time()
 
@@ -333,7 +371,7 @@ def render_and_save_nfts(input):
                     os.remove(file_path)
 
         # Generation/Rendering:
-        if input.enable_images:
+        if input.enable_images and not composite_images:
 
             log.info(f"\n{TextColors.OK}-------- Image --------{TextColors.RESET}")
 
@@ -580,18 +618,22 @@ def render_and_save_nfts(input):
         with open(os.path.join(bmnft_data_folder, "Data_" + name + ".json"), 'w') as outfile:
             outfile.write(json_meta_data + '\n')
 
-        log.info(f"{TextColors.OK}\nTIME [NFT {name} Generated]: {time.time() - time_start_2}s")
+        nft_render_times[full_single_dna] = time.time() - time_start_2
+        log.info(f"{TextColors.OK}\nTIME [NFT {name} Generated]: {nft_render_times[full_single_dna]}s")
 
-        save_completed(full_single_dna, a, x, input.batch_json_save_path, input.batch_to_generate)
+        journal.record(position, a[full_single_dna]['order_num'], nft_render_times[full_single_dna])
+        completed[position] = 1
 
         x += 1
 
-    for i in hierarchy:
-        for j in hierarchy[i]:
-            bpy.data.collections[j].hide_render = False
-            bpy.data.collections[j].hide_viewport = False
+    scene_state.show_all()
+
+    save_completed(completed, input.batch_json_save_path, input.batch_to_generate)
+    journal.remove()
 
     batch_complete_time = time.time() - time_start_1
+    generation_state.finish_batch(input.batch_to_generate, batch_complete_time)
+    generation_state.close()
 
     log.info(
             f"\nAll NFTs in Batch {input.batch_to_generate} successfully generated and saved at:"
@@ -599,8 +641,12 @@ def render_and_save_nfts(input):
             f"\nTIME [Batch {input.batch_to_generate} Generated]: {batch_complete_time}s\n"
     )
 
+    # Per NFT render times are read back by render_costs.py to balance batches by render cost. Images composited from
+    # layers take no render time per NFT, render_costs.py skips those Batches:
     batch_info = {"Batch Render Time": batch_complete_time, "Number of NFTs generated in Batch": x - 1,
-                  "Average time per generation": batch_complete_time / x - 1}
+                  "Average time per generation": batch_complete_time / x - 1,
+                  "NFT Render Times": nft_render_times,
+                  "Render Mode": "composite" if composite_images else "full"}
 
     batch_info_folder = os.path.join(
             input.nft_batch_save_path,
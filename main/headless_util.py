@@ -32,7 +32,8 @@ def get_python_args():
 
     parser.add_argument("--operation",
                         dest="operation",
-                        choices=['create-dna', 'generate-nfts', 'refactor-batches'],
+                        choices=['create-dna', 'generate-nfts', 'refactor-batches', 'verify-dna',
+                                 'extend-dna', 'count-dna', 'validate-dna', 'batch-status'],
                         required=True,
                         help="Choose which operation you want to perform"
                         )
@@ -51,6 +52,14 @@ def get_python_args():
                         help="Overwrite the batch number in the config file"
                         )
 
+    parser.add_argument("--dna-file",
+                        dest="dna_file",
+                        metavar='FILE',
+                        required=False,
+                        help="NFT record or Batch#.json file checked against the Logic rules by validate-dna, the NFT "
+                             "record by default"
+                        )
+
     parser.add_argument("--batch-data",
                         dest="batch_data_path",
                         metavar='FOLDER',
@@ -65,6 +74,74 @@ def get_python_args():
                         help="Overwrite the logic file path in the config file"
                         )
 
+    parser.add_argument("--time-budget",
+                        dest="time_budget",
+                        type=float,
+                        required=False,
+                        help="Stop drawing DNA after this many seconds when creating DNA"
+                        )
+
+    parser.add_argument("--attempt-budget",
+                        dest="attempt_budget",
+                        type=int,
+                        required=False,
+                        help="Stop drawing DNA after this many candidate DNA when creating DNA"
+                        )
+
+    parser.add_argument("--seed",
+                        dest="seed",
+                        type=int,
+                        required=False,
+                        help="Seed used to create DNA, the same seed and settings always create the same DNA"
+                        )
+
+    parser.add_argument("--workers",
+                        dest="workers",
+                        type=int,
+                        default=1,
+                        required=False,
+                        help="Number of processes used to create DNA"
+                        )
+
+    parser.add_argument("--rarity-mode",
+                        dest="rarity_mode",
+                        choices=['weighted', 'quota'],
+                        required=False,
+                        help="Overwrite the Rarity mode, 'quota' gives every Variant exactly its share of the "
+                             "collection"
+                        )
+
+    parser.add_argument("--logic-mode",
+                        dest="logic_mode",
+                        choices=['repair', 'direct'],
+                        required=False,
+                        help="Overwrite the Logic mode, 'direct' draws DNA breaking a rule again from the Variants the "
+                             "rules allow"
+                        )
+
+    parser.add_argument("--batch-strategy",
+                        dest="batch_strategy",
+                        choices=['contiguous', 'round_robin', 'by_size', 'by_cost'],
+                        required=False,
+                        help="Overwrite how DNA are split into batches when creating DNA"
+                        )
+
+    parser.add_argument("--batch-render-order",
+                        dest="batch_render_order",
+                        choices=['record', 'min_changes'],
+                        required=False,
+                        help="Overwrite the order NFTs are rendered in within a batch, 'min_changes' keeps "
+                             "consecutive NFTs as similar as possible"
+                        )
+
+    parser.add_argument("--render-mode",
+                        dest="render_mode",
+                        choices=['full', 'composite'],
+                        required=False,
+                        help="Overwrite how NFT images are made, 'composite' renders every Variant once and "
+                             "composites the images from them"
+                        )
+
     parser.add_argument("--resume-failed-batch",
                         dest="resume_failed_batch",
                         action="store_true",
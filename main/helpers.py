@@ -2,7 +2,6 @@ import bpy
 import os
 import sys
 import json
-import copy
 import logging
 import tempfile
 import platform
@@ -11,7 +10,11 @@ from time import sleep
 from itertools import cycle
 from threading import Thread
 from shutil import get_terminal_size
-from collections import Counter, defaultdict
+from collections import Counter
+from contextlib import contextmanager
+
+from . import scene_scanner, combination_counter, progress_journal, state_store
+from .text_colors import TextColors
 
 log = logging.getLogger(__name__)
 
@@ -21,7 +24,7 @@ log = logging.getLogger(__name__)
 # Constants are used for storing or updating constant values that may need to be changes depending on system
 # requirements and different use-cases.
 
-removeList = [".gitignore", ".DS_Store", "desktop.ini", ".ini"]
+removeList = [".gitignore", ".DS_Store", "desktop.ini", ".ini", "BatchIndex.json"]
 
 
 def remove_file_by_extension(dirlist):
@@ -42,19 +45,6 @@ def remove_file_by_extension(dirlist):
     return return_dirs
 
 
-# TODO: fix colours in console logs and find a way to include coloured text in .txt file.
-
-class TextColors:
-    """
-    The colour of console messages.
-    """
-
-    OK = '\033[92m'  # GREEN
-    WARNING = '\033[93m'  # YELLOW
-    ERROR = '\033[91m'  # RED
-    RESET = '\033[0m'  # RESET COLOR
-
-
 def save_result(result):
     """
     Saves json result to json file at the specified path.
@@ -75,122 +65,86 @@ def save_result(result):
 
 # This section retrieves the Scene hierarchy from the current Blender file.
 
+# The hierarchy and its number of combinations are cached in a SceneSnapshot keyed on a fingerprint of the collection
+# tree, the scene is only scanned again when collections are added, removed, renamed or moved. Inside a
+# scene_snapshot() block the snapshot is not even fingerprinted again, so one operation sees a single scene state.
 
-def get_hierarchy():
-    """
-    Returns the hierarchy of a given Blender scene.
-    """
-
-    coll = bpy.context.scene.collection
-
-    script_ignore_collection = bpy.data.collections["Script_Ignore"]
-
-    list_all_coll_in_scene = []
-    list_all_collections = []
-
-    def traverse_tree(t):
-        yield t
-        for child in t.children:
-            yield from traverse_tree(child)
+class SceneSnapshot:
+    """The hierarchy and number of combinations of the scene at a given collection tree fingerprint."""
 
-    for c in traverse_tree(coll):
-        list_all_coll_in_scene.append(c)
+    __slots__ = ("fingerprint", "hierarchy", "combinations")
 
-    for i in list_all_coll_in_scene:
-        list_all_collections.append(i.name)
+    def __init__(self, fingerprint, hierarchy, combinations):
+        self.fingerprint = fingerprint
+        self.hierarchy = hierarchy
+        self.combinations = combinations
 
-    list_all_collections.remove(script_ignore_collection.name)
 
-    if "Scene Collection" in list_all_collections:
-        list_all_collections.remove("Scene Collection")
+_scene_snapshot = None
+_pinned_snapshots = 0  # Number of open scene_snapshot() blocks
+_valid_combinations = (None, None)  # (settings, count) of the last get_valid_combinations() call
 
-    if "Master Collection" in list_all_collections:
-        list_all_collections.remove("Master Collection")
 
-    def all_script_ignore(script_ignore_coll):
-        # Removes all collections, sub collections in Script_Ignore collection from list_all_collections.
+def collection_tree_fingerprint():
+    """
+    Returns the name and number of children of every collection in the scene's collection tree, in depth first order.
+    Cheap enough to compute on every depsgraph update, it changes whenever the hierarchy could.
+    """
+    fingerprint = []
+    stack = [bpy.context.scene.collection]
+    while stack:
+        collection = stack.pop()
+        children = collection.children
+        fingerprint.append((collection.name, len(children)))
+        stack.extend(reversed(children[:]))
+    return tuple(fingerprint)
 
-        for collection in list(script_ignore_coll.children):
-            list_all_collections.remove(collection.name)
-            list_coll = list(collection.children)
-            if len(list_coll) > 0:
-                all_script_ignore(collection)
 
-    all_script_ignore(script_ignore_collection)
-    list_all_collections.sort()
+def get_scene_snapshot():
+    """Returns the SceneSnapshot of the current scene, scanning the scene only if its collection tree changed."""
+    global _scene_snapshot
 
-    exclude = ["_"]  # Excluding characters that identify a Variant
-    attribute_collections = copy.deepcopy(list_all_collections)
+    if _pinned_snapshots and _scene_snapshot is not None:
+        return _scene_snapshot
 
-    def filter_num():
-        """
-        This function removes items from 'attribute_collections' if they include values from the 'exclude' variable.
-        It removes child collections from the parent collections in from the "list_all_collections" list.
-        """
-        for x in attribute_collections:
-            if any(i in x for i in exclude):
-                attribute_collections.remove(x)
+    fingerprint = collection_tree_fingerprint()
+    if _scene_snapshot is None or _scene_snapshot.fingerprint != fingerprint:
+        hierarchy = scan_hierarchy()
+        _scene_snapshot = SceneSnapshot(fingerprint, hierarchy, count_combinations(hierarchy))
 
-    for i in range(len(list_all_collections)):
-        filter_num()
+    return _scene_snapshot
 
-    attribute_variants = [x for x in list_all_collections if x not in attribute_collections]
-    attribute_collections1 = copy.deepcopy(attribute_collections)
 
-    def attribute_data(att_vars):
-        """
-        Creates a dictionary of each attribute
-        """
-        all_att_data_list = {}
-        for i in att_vars:
-            # Check if name follows naming conventions:
-            if int(i.count("_")) > 2 and int(i.split("_")[1]) > 0:
-                log.error(
-                        f"\n{traceback.format_exc()}"
-                        f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                        f"There is a naming issue with the following Attribute/Variant: '{i}'\n"
-                        f"Review the naming convention of Attribute and Variant collections here:\n{TextColors.RESET}"
-                        f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
-                )
-                raise Exception()
-
-            try:
-                number = i.split("_")[1]
-                name = i.split("_")[0]
-                rarity = i.split("_")[2]
-            except IndexError:
-                log.error(
-                        f"\n{traceback.format_exc()}"
-                        f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
-                        f"There is a naming issue with the following Attribute/Variant: '{i}'\n"
-                        f"Review the naming convention of Attribute and Variant collections here:\n{TextColors.RESET}"
-                        f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
-                )
-                raise Exception()
-
-            all_att_data_list[i] = {"name": name, "number": number, "rarity": rarity}
-        return all_att_data_list
+@contextmanager
+def scene_snapshot():
+    """
+    Pins the current SceneSnapshot for the duration of the with block. check_scene(), get_hierarchy(),
+    get_combinations() and raise_error_zero_combinations() all reuse it instead of reading the scene again.
+    """
+    global _pinned_snapshots
 
-    variant_meta_data = attribute_data(attribute_variants)
+    snapshot = get_scene_snapshot()
+    _pinned_snapshots += 1
+    try:
+        yield snapshot
+    finally:
+        _pinned_snapshots -= 1
 
-    hierarchy = {}
-    for i in attribute_collections1:
-        col_par_long = list(bpy.data.collections[str(i)].children)
-        col_par_short = {}
-        for x in col_par_long:
-            col_par_short[x.name] = None
-        hierarchy[i] = col_par_short
 
-    for a in hierarchy:
-        for b in hierarchy[a]:
-            for x in variant_meta_data:
-                if str(x) == str(b):
-                    (hierarchy[a])[b] = variant_meta_data[x]
+def get_hierarchy():
+    """
+    Returns the hierarchy of the current Blender scene from the cached SceneSnapshot. The dictionary is shared between
+    callers and must not be modified.
+    """
+    return get_scene_snapshot().hierarchy
 
-    return hierarchy
 
+def scan_hierarchy():
+    """
+    Returns the hierarchy of a given Blender scene, see scene_scanner.py.
+    """
+    return scene_scanner.scan_collection_tree(bpy.context.scene.collection, bpy.data.collections["Script_Ignore"])
 
-# ======== GET COMBINATIONS ======== #
 
 # This section is used to get the number of combinations for checks and the UI display
 
@@ -199,8 +153,11 @@ def get_combinations():
     Returns "combinations", the number of all possible NFT DNA for a given Blender scene formatted to BMNFTs conventions
     combinations.
     """
+    return get_scene_snapshot().combinations
 
-    hierarchy = get_hierarchy()
+
+def count_combinations(hierarchy):
+    """Returns the number of all possible NFT DNA of a hierarchy."""
     hierarchy_by_num = []
 
     for i in hierarchy:
@@ -217,9 +174,41 @@ def get_combinations():
     return combinations
 
 
+def get_valid_combinations(enable_rarity, enable_logic, logic_file, enable_materials, materials_file):
+    """
+    Returns the number of unique NFT DNA of the current Blender scene valid under the Rarity, Logic and Materials
+    settings, see combination_counter.py. It is only counted again when the scene or the settings changed.
+    """
+    global _valid_combinations
+
+    snapshot = get_scene_snapshot()
+    materials = None
+    if enable_materials:
+        with open(materials_file) as f:
+            materials = json.load(f)
+
+    settings = (
+        snapshot.fingerprint,
+        enable_rarity,
+        json.dumps(logic_file, sort_keys=True) if enable_logic else None,
+        json.dumps(materials, sort_keys=True),
+    )
+    if _valid_combinations[0] != settings:
+        _valid_combinations = (settings, combination_counter.count_valid_combinations(
+                snapshot.hierarchy,
+                enable_rarity,
+                enable_logic,
+                logic_file,
+                enable_materials,
+                materials,
+        ))
+
+    return _valid_combinations[1]
+
+
 # ======== CHECKS ======== #
 
-# This section is used to check the NFTRecord.json for duplicate NFT DNA and returns any found in the console.
+# This section is used to check the NFTRecord.jsonl for duplicate NFT DNA and returns any found in the console.
 # It also checks the percentage each variant is chosen in the NFTRecord, then compares it with its rarity percentage
 # set in the .blend file.
 
@@ -258,24 +247,20 @@ def check_scene():  # Not complete
 
 
 def check_rarity(hierarchy, dna_list_formatted, save_path):
-    """Checks rarity percentage of each Variant, then sends it to RarityData.json in NFT_Data folder."""
+    """
+    Checks rarity percentage of each Variant, then sends it to RarityData.json in NFT_Data folder. dna_list_formatted
+    can be any iterable of dna_list entries, such as record.iter_dna(), it is only read once.
+    """
 
-    dna_list = [list(i.keys())[0] for i in dna_list_formatted]
-    num_nfts_generated = len(dna_list)
-    num_dict = defaultdict(list)
-    hierarchy.keys()
+    num_nfts_generated = 0
+    num_dict = {k: Counter() for k in hierarchy.keys()}
 
-    for i in dna_list:
-        dna_split_list = i.split("-")
+    for i in dna_list_formatted:
+        dna_split_list = list(i.keys())[0].partition(":")[0].split("-")
+        num_nfts_generated += 1
 
         for j, k in zip(dna_split_list, hierarchy.keys()):
-            num_dict[k].append(j)
-
-    num_dict = dict(num_dict)
-
-    for i in num_dict:
-        count = dict(Counter(num_dict[i]))
-        num_dict[i] = count
+            num_dict[k][j] += 1
 
     full_num_name = {}
 
@@ -323,15 +308,12 @@ def check_rarity(hierarchy, dna_list_formatted, save_path):
 
 
 def check_duplicates(dna_list_formatted):
-    """Checks if there are duplicates in dna_list before NFTRecord.json is sent to JSON file."""
-    dna_list = []
-    for i in dna_list_formatted:
-        dna_list.append(list(i.keys())[0])
-
+    """Checks if there are duplicates in dna_list, any iterable of dna_list entries such as record.iter_dna()."""
     duplicates = 0
     seen = set()
 
-    for x in dna_list:
+    for i in dna_list_formatted:
+        x = list(i.keys())[0]
         if x in seen:
             duplicates += 1
         seen.add(x)
@@ -354,16 +336,36 @@ def check_failed_batches(batch_json_save_path):
     failed_dna_index = None
 
     if os.path.isdir(batch_json_save_path):
+        # Batches rendered by this version are tracked in GenerationState.db, see state_store.py:
+        failed_batch_state = state_store.find_failed_batch(batch_json_save_path)
+        if failed_batch_state is not None:
+            if failed_batch_state:
+                fail_state = True
+                failed_batch, failed_dna = failed_batch_state
+            return fail_state, failed_batch, failed_dna, failed_dna_index
+
         batch_folders = remove_file_by_extension(os.listdir(batch_json_save_path))
 
         for i in batch_folders:
+            if progress_journal.is_journal(i):
+                continue
+
             batch = json.load(open(os.path.join(batch_json_save_path, i)))
+            batch_num = int(i.removeprefix("Batch").removesuffix(".json"))
             nfts_in_batch = batch["nfts_in_batch"]
             if "Generation Save" in batch:
                 dna_generated = batch["Generation Save"][-1]["DNA Generated"]
+
+                # Batches still rendering keep their progress in a journal, see progress_journal.py:
+                num_completed = progress_journal.count_completed(
+                        progress_journal.journal_path(batch_json_save_path, batch_num)
+                )
+                if num_completed is not None:
+                    dna_generated = num_completed
+
                 if dna_generated is not None and dna_generated < nfts_in_batch:
                     fail_state = True
-                    failed_batch = int(i.removeprefix("Batch").removesuffix(".json"))
+                    failed_batch = batch_num
                     failed_dna = dna_generated
 
     return fail_state, failed_batch, failed_dna, failed_dna_index
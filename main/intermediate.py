@@ -3,7 +3,8 @@ import logging
 import bpy
 import json
 
-from main import dna_generator, exporter
+from main import dna_generator, exporter, helpers, dna_validator, record
+from main.text_colors import TextColors
 
 log = logging.getLogger(__name__)
 
@@ -11,60 +12,110 @@ log = logging.getLogger(__name__)
 #  process into one file.
 
 
-def send_to_record(input, reverse_order=False):
+def get_logic_rules(enable_logic_json, logic_file, reverse_order=False):
+    """Returns the Logic rules of the Logic.json file at logic_file, or of the Logic rules set in the UI."""
+    if enable_logic_json and logic_file:
+        return json.load(open(logic_file))
+
+    if enable_logic_json and not logic_file:
+        log.error(
+                f"No Logic.json file path set. Please set the file path to your Logic.json file."
+        )
+        raise ValueError()
+
+    scn = bpy.context.scene
+    logic_rules = {}
+    num = 1
+    if reverse_order:
+        items = [scn.logic_fields[i] for i in range(scn.logic_fields_index, -1, -1)]
+    else:
+        items = scn.logic_fields
+    for item in items:
+        item_list1 = item.item_list1
+        rule_type = item.rule_type
+        item_list2 = item.item_list2
+        logic_rules[f"Rule-{num}"] = {
+            "IF": item_list1.split(','),
+            rule_type: item_list2.split(',')
+        }
+        num += 1
+    return logic_rules
+
+
+def send_to_record(input, reverse_order=False, extend=False):
+    if input.enable_logic:
+        input.logic_file = get_logic_rules(input.enable_logic_json, input.logic_file, reverse_order)
+
+    # check_scene(), DNA generation and the checks after it all read the scene once:
+    with helpers.scene_snapshot():
+        dna_generator.send_to_record(
+                input.collection_size,
+                input.nfts_per_batch,
+                input.save_path,
+                input.enable_rarity,
+                input.enable_logic,
+                input.logic_file,
+                input.enable_materials,
+                input.materials_file,
+                input.blend_my_nfts_output,
+                input.batch_json_save_path,
+                input.enable_debug,
+                input.log_path,
+                input.time_budget,
+                input.attempt_budget,
+                input.seed,
+                input.workers,
+                extend,
+                input.rarity_mode,
+                input.batch_strategy,
+                input.batch_render_order,
+                input.logic_mode,
+        )
+
+
+def count_combinations(input):
+    """
+    Logs and returns the number of unique NFT DNA the scene can generate with the Rarity, Logic and Materials settings
+    of input, see combination_counter.py.
+    """
+    logic_file = None
     if input.enable_logic:
-        if input.enable_logic_json and input.logic_file:
-            input.logic_file = json.load(open(input.logic_file))
+        logic_file = get_logic_rules(input.enable_logic_json, input.logic_file)
+
+    with helpers.scene_snapshot():
+        combinations = helpers.get_combinations()
+        valid_combinations = helpers.get_valid_combinations(
+                input.enable_rarity,
+                input.enable_logic,
+                logic_file,
+                input.enable_materials,
+                input.materials_file,
+        )
 
-        if input.enable_logic_json and not input.logic_file:
+    log.info(f"\nVariant combinations: {combinations}")
+    if valid_combinations is None:
+        log.info(f"\nThe Logic rules link too many Attributes to count the valid combinations exactly.")
+    else:
+        log.info(f"\nCombinations valid under the Rarity, Logic and Materials settings: {valid_combinations}")
+    return valid_combinations
+
+
+def validate_dna(input, dna_file=None):
+    """
+    Checks the DNA of the NFT record, or of dna_file, an NFT record or Batch#.json file, against the Logic rules of
+    input. Returns {rule name: [order_nums]} of the broken rules, see dna_validator.py.
+    """
+    if dna_file is None:
+        dna_file = record.find_record(input.blend_my_nfts_output)
+        if dna_file is None:
             log.error(
-                    f"No Logic.json file path set. Please set the file path to your Logic.json file."
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"No NFT record found in {input.blend_my_nfts_output}. Create NFT Data first.{TextColors.RESET}"
             )
-            raise
-
-        if not input.enable_logic_json:
-            scn = bpy.context.scene
-            if reverse_order:
-                input.logic_file = {}
-                num = 1
-                for i in range(scn.logic_fields_index, -1, -1):
-                    item = scn.logic_fields[i]
-
-                    item_list1 = item.item_list1
-                    rule_type = item.rule_type
-                    item_list2 = item.item_list2
-                    input.logic_file[f"Rule-{num}"] = {
-                        "IF": item_list1.split(','),
-                        rule_type: item_list2.split(',')
-                    }
-                    num += 1
-            else:
-                input.logic_file = {}
-                num = 1
-                for item in scn.logic_fields:
-                    item_list1 = item.item_list1
-                    rule_type = item.rule_type
-                    item_list2 = item.item_list2
-                    input.logic_file[f"Rule-{num}"] = {
-                        "IF": item_list1.split(','),
-                        rule_type: item_list2.split(',')
-                    }
-                    num += 1
-
-    dna_generator.send_to_record(
-            input.collection_size,
-            input.nfts_per_batch,
-            input.save_path,
-            input.enable_rarity,
-            input.enable_logic,
-            input.logic_file,
-            input.enable_materials,
-            input.materials_file,
-            input.blend_my_nfts_output,
-            input.batch_json_save_path,
-            input.enable_debug,
-            input.log_path
-    )
+            raise FileNotFoundError()
+
+    logic_file = get_logic_rules(input.enable_logic_json, input.logic_file)
+    return dna_validator.validate_dna_file(dna_file, logic_file)
 
 
 def render_and_save_nfts(input, reverse_order=False):
@@ -0,0 +1,177 @@
+# Purpose:
+# This file builds NFT images for the "composite" render mode of exporter.py. Every Variant collection, with each of its
+# Materials, is rendered once on a transparent film into an RGBA layer (see layer_renderer.py). Each NFT image is then
+# alpha-composited from the layers of its Variants in Attribute order, over the base layer of the scene without any
+# Variant. Only fixed-camera, layered scenes look the same as a full render this way. Layers are cached in
+# Blend_My_NFTs Output/Layer_Cache, one folder per render resolution, and the cache is cleared whenever NFT data is
+# created again. It does not import bpy so images can be composited in a process pool outside of Blender.
+
+import os
+import re
+import zlib
+import shutil
+import struct
+import hashlib
+import logging
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .text_colors import TextColors
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Only needed for JPEG images, PNG images are written without it
+
+log = logging.getLogger(__name__)
+
+LAYER_CACHE_FOLDER = "Layer_Cache"
+BASE_LAYER_NAME = "Base"
+
+# Number of NFT images handed to a compositing process at once:
+COMPOSITE_CHUNK_SIZE = 8
+
+
+def layer_cache_path(save_path, resolution=None):
+    """
+    Returns the Layer_Cache folder of save_path, next to Generated NFT Batches, or its subfolder for layers rendered at
+    resolution, (width, height) in pixels.
+    """
+    cache_path = os.path.join(save_path, "Blend_My_NFTs Output", LAYER_CACHE_FOLDER)
+    if resolution is None:
+        return cache_path
+    return os.path.join(cache_path, "{}x{}".format(*resolution))
+
+
+def clear_layer_cache(save_path):
+    """Deletes the layers cached for save_path, they may not match the scene NFT data is created from anymore."""
+    shutil.rmtree(layer_cache_path(save_path), ignore_errors=True)
+
+
+def layer_file(cache_folder, variant=None, material=None):
+    """
+    Returns the path of the layer of variant with material, or of the base layer if variant is None. Names are made
+    safe for file systems and stay unique.
+    """
+    if variant is None:
+        return os.path.join(cache_folder, f"{BASE_LAYER_NAME}.npy")
+
+    name = variant if material is None else f"{variant}__{material}"
+    safe_name = re.sub(r"[^\w.-]", "_", name)
+    digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+    return os.path.join(cache_folder, f"{safe_name}_{digest}.npy")
+
+
+def nft_layers(hierarchy, digits, material_digits=None, materials_catalog=None):
+    """
+    Returns (variant, material) of the layers of a DNA in the order they are composited, the base layer (None, None)
+    first. hierarchy is a compiled hierarchy, Material names are looked up in materials_catalog, a MaterialsCatalog.
+    """
+    layers = [(None, None)]
+    for i, digit in enumerate(digits):
+        variant = hierarchy.variant_at(i, digit)
+        if variant is None:  # Empty Attributes add no layer
+            continue
+        material = None
+        if material_digits and material_digits[i] != 0:
+            material = materials_catalog.material_name(variant.key, material_digits[i])
+        layers.append((variant.key, material))
+    return layers
+
+
+def check_file_format(file_format):
+    """Raises ValueError if NFT images cannot be composited into file_format."""
+    if file_format == "PNG" or (file_format == "JPEG" and Image is not None):
+        return
+    log.error(
+            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+            f"The composite render mode writes PNG images, or JPEG images when the Pillow package is installed. "
+            f"Set the Image File Format to PNG or use the full render mode.{TextColors.RESET}"
+    )
+    raise ValueError()
+
+
+def write_png(file_name, rgba):
+    """Writes an (height x width x 4) uint8 RGBA array, top row first, to an 8 bit RGBA PNG file."""
+    height, width, _ = rgba.shape
+
+    # Every row starts with filter type 0, no filtering:
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    with open(file_name, 'wb') as outfile:
+        outfile.write(b"\x89PNG\r\n\x1a\n")
+        outfile.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        outfile.write(chunk(b"IDAT", zlib.compress(rows.tobytes())))
+        outfile.write(chunk(b"IEND", b""))
+
+
+def composite(layers):
+    """
+    Returns the uint8 RGBA image of (height x width x 4) uint8 RGBA layers with straight alpha, each one placed over
+    the ones before it.
+    """
+    height, width, _ = layers[0].shape
+    color = np.zeros((height, width, 3), dtype=np.float32)  # Premultiplied by alpha
+    alpha = np.zeros((height, width, 1), dtype=np.float32)
+
+    for layer in layers:
+        if layer.shape != (height, width, 4):
+            log.error(
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"The layers in the {LAYER_CACHE_FOLDER} folder do not all have the same resolution. Create NFT "
+                    f"Data again so they are rendered again.{TextColors.RESET}"
+            )
+            raise ValueError()
+
+        layer_alpha = layer[..., 3:].astype(np.float32) / 255
+        transmitted = 1 - layer_alpha
+        color *= transmitted
+        color += layer[..., :3].astype(np.float32) / 255 * layer_alpha
+        alpha *= transmitted
+        alpha += layer_alpha
+
+    np.divide(color, alpha, out=color, where=alpha > 0)
+    image = np.concatenate([color, alpha], axis=2)
+    return (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def composite_image(task):
+    """Composites one NFT image from task, (image file name without extension, file format, layer files)."""
+    image_path, file_format, files = task
+    image = composite([np.load(f, mmap_mode='r') for f in files])
+
+    if file_format == "PNG":
+        write_png(f"{image_path}.png", image)
+    else:
+        Image.fromarray(image, "RGBA").convert("RGB").save(f"{image_path}.jpg", "JPEG")
+
+
+def composite_images(tasks, workers=1):
+    """Composites the NFT images of tasks, see composite_image(), in a pool of workers processes if workers > 1."""
+    tasks = list(tasks)
+    if workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                list(executor.map(composite_image, tasks, chunksize=COMPOSITE_CHUNK_SIZE))
+            return
+        except BrokenProcessPool:
+            log.warning(
+                    f"\n{traceback.format_exc()}"
+                    f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                    f"The compositing processes stopped unexpectedly. Images will be composited in this process "
+                    f"instead.{TextColors.RESET}"
+            )
+
+    for task in tasks:
+        composite_image(task)
@@ -0,0 +1,105 @@
+# Purpose:
+# This file renders the RGBA layers of the "composite" render mode of exporter.py, see layer_compositor.py. Each layer
+# is rendered once with only its Variant collection shown, on a transparent film, and cached in the Layer_Cache folder
+# as a NumPy array. Layers already in the cache are not rendered again until NFT data is created again, see
+# layer_compositor.layer_cache_path().
+
+import bpy
+import os
+import logging
+
+import numpy as np
+
+from .text_colors import TextColors
+from .layer_compositor import layer_file
+
+log = logging.getLogger(__name__)
+
+# Objects of these types in Script_Ignore add nothing to a render by themselves, any other would be in every layer:
+LAYER_SAFE_OBJECT_TYPES = ("CAMERA", "LIGHT", "LIGHT_PROBE", "EMPTY")
+
+
+def check_composite_scene():
+    """
+    Raises ValueError if the scene cannot be composited from layers: Script_Ignore objects whose type is not in
+    LAYER_SAFE_OBJECT_TYPES would show in every layer and cover the layers below.
+    """
+    blocking_objects = [
+        obj.name for obj in bpy.data.collections["Script_Ignore"].all_objects
+        if obj.type not in LAYER_SAFE_OBJECT_TYPES
+    ]
+    if blocking_objects:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"The composite render mode only works when Script_Ignore holds objects of these types only: "
+                f"{', '.join(LAYER_SAFE_OBJECT_TYPES)}. Move these objects into a Variant collection or use the full "
+                f"render mode: {blocking_objects}{TextColors.RESET}"
+        )
+        raise ValueError()
+
+
+def _save_layer(png_path, file_name):
+    """Loads a rendered PNG and saves it as an (height x width x 4) uint8 RGBA array, top row first."""
+    image = bpy.data.images.load(png_path)
+    try:
+        width, height = image.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+
+    rgba = np.flipud(pixels.reshape(height, width, 4))  # Blender stores the bottom row first
+    np.save(file_name, (np.clip(rgba, 0, 1) * 255 + 0.5).astype(np.uint8))
+    os.remove(png_path)
+
+
+def render_resolution():
+    """Returns (width, height) in pixels of the images the scene renders."""
+    render = bpy.context.scene.render
+    scale = render.resolution_percentage / 100
+    return int(render.resolution_x * scale), int(render.resolution_y * scale)
+
+
+def render_layers(cache_folder, layers, scene_state, materials_catalog=None):
+    """
+    Renders the (variant, material) layers not in cache_folder yet, see layer_compositor.nft_layers(). The base layer
+    keeps the scene's film transparency, Variant layers are rendered on a transparent film.
+    """
+    missing = [layer for layer in dict.fromkeys(layers) if not os.path.exists(layer_file(cache_folder, *layer))]
+    if not missing:
+        return
+    os.makedirs(cache_folder, exist_ok=True)
+
+    render = bpy.context.scene.render
+    saved_settings = (
+        render.filepath,
+        render.film_transparent,
+        render.image_settings.file_format,
+        render.image_settings.color_mode,
+        render.image_settings.color_depth,
+    )
+
+    log.info(f"\n{TextColors.OK}Rendering {len(missing)} layers for compositing.{TextColors.RESET}")
+    try:
+        render.image_settings.file_format = "PNG"
+        render.image_settings.color_mode = "RGBA"
+        render.image_settings.color_depth = "8"
+
+        for variant, material in missing:
+            scene_state.show_variants([variant] if variant is not None else [])
+            if material is not None:
+                scene_state.apply_material(variant, material, materials_catalog)
+
+            render.film_transparent = variant is not None or saved_settings[1]
+            file_name = layer_file(cache_folder, variant, material)
+            render.filepath = f"{file_name[:-len('.npy')]}.png"
+            bpy.ops.render.render(write_still=True)
+            _save_layer(render.filepath, file_name)
+    finally:
+        (
+            render.filepath,
+            render.film_transparent,
+            render.image_settings.file_format,
+            render.image_settings.color_mode,
+            render.image_settings.color_depth,
+        ) = saved_settings
@@ -2,17 +2,145 @@
 # The purpose of this file is to apply the materials a user sets in a given .json file to the Variant collection objects
 # also specified in the .json file. The Materialized DNA is then returned in the following format: 1-1-1:1-1-1
 # Where the numbers right of the ":" are the material numbers applied to the respective Variants to the left of the ":"
+# The Materials file is compiled once per run into a MaterialsCatalog, shared by dna_worker.py and exporter.py.
 
 import json
 import random
 import logging
 import traceback
-from .helpers import TextColors
+from itertools import accumulate
+
+import numpy as np
+
+from .text_colors import TextColors
+from .compiled_hierarchy import compile_hierarchy
 
 log = logging.getLogger(__name__)
 
 
-def select_material(material_list, variant, enable_rarity):
+def _material_list_error(variant):
+    log.error(
+            f"\n{traceback.format_exc()}"
+            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+            f"An issue was found within the Material List of the Variant collection '{variant}'. For more "
+            f"information on Blend_My_NFTs compatible scenes, see:\n{TextColors.RESET}"
+            f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+    )
+    raise IndexError()
+
+
+class MaterialTable:
+    """
+    The Material List of one Variant: Material names by order number and the cumulative weights they are drawn with,
+    None when drawn uniformly. Draws exactly as select_material() does, from the same random numbers.
+    """
+
+    __slots__ = ("variant", "names", "numbers", "variant_objects", "cum_weights", "_cum_array")
+
+    def __init__(self, variant, variant_materials, enable_rarity):
+        material_list = variant_materials["Material List"]
+        weights = [float(w) for w in material_list.values()]
+
+        self.variant = variant
+        self.names = tuple(material_list)
+        self.numbers = range(1, len(self.names) + 1)  # 0 means no Material
+        self.variant_objects = variant_materials["Variant Objects"]
+
+        # Only the weight of the last Material decides whether weights are used, as in select_material():
+        self.cum_weights = None
+        if enable_rarity and weights and weights[-1] != 0:
+            self.cum_weights = list(accumulate(weights))
+        self._cum_array = np.array(self.cum_weights or [], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def draw(self, rng):
+        """Returns the order number of a Material drawn with rng."""
+        if not self.names:
+            _material_list_error(self.variant)
+        return rng.choices(self.numbers, cum_weights=self.cum_weights, k=1)[0]
+
+    def draw_many(self, draws):
+        """Returns the order numbers of the Materials draw() returns for an array of rng.random() results."""
+        if not self.names:
+            _material_list_error(self.variant)
+        if self.cum_weights is None:
+            return np.floor(draws * float(len(self.names))).astype(np.int64) + 1
+        positions = np.searchsorted(self._cum_array, draws * (self.cum_weights[-1] + 0.0), side="right")
+        return np.minimum(positions, len(self.names) - 1) + 1
+
+
+class MaterialsCatalog:
+    """
+    A Materials file dictionary compiled for a hierarchy, its Material Lists indexed by Variant collection name and by
+    Attribute and Variant order number.
+    """
+
+    def __init__(self, hierarchy, materials, enable_rarity=False):
+        hierarchy = compile_hierarchy(hierarchy)
+        self.tables = {variant: MaterialTable(variant, m, enable_rarity) for variant, m in materials.items()}
+
+        # Tables of each Attribute by Variant order number, and as table positions for whole DNA matrices:
+        self._table_list = list(self.tables.values())
+        position = {table.variant: i for i, table in enumerate(self._table_list)}
+        self.attribute_tables = []
+        self._lookups = []
+        for attribute in hierarchy.attributes:
+            by_number = {n: self.tables[v.key] for n, v in attribute.by_number.items() if v.key in self.tables}
+            lookup = np.full(max(attribute.by_number, default=0) + 1, -1, dtype=np.int64)
+            for n, v in attribute.by_number.items():
+                lookup[n] = position.get(v.key, -1)
+            self.attribute_tables.append(by_number)
+            self._lookups.append(lookup)
+
+    def material_name(self, variant, material_number):
+        """Returns the name of the Material with order number material_number in the Material List of variant."""
+        return self.tables[variant].names[material_number - 1]  # Subtract 1 because '0' means empty mat
+
+    def variant_objects(self, variant):
+        return self.tables[variant].variant_objects
+
+    def sample(self, digits, rng):
+        """Returns the Material order numbers of a DNA given as Variant order numbers, 0 where there are none."""
+        material_digits = []
+        for by_number, digit in zip(self.attribute_tables, digits):
+            table = by_number.get(digit)
+            material_digits.append(table.draw(rng) if table is not None else 0)
+        return material_digits
+
+    def sample_matrix(self, dna_matrix, rng):
+        """
+        Returns the Material order numbers of every row of an (N x Attributes) DNA matrix as a matrix. Draws the same
+        Materials from rng as calling sample() on each row in turn.
+        """
+        positions = np.empty(dna_matrix.shape, dtype=np.int64)
+        for i, lookup in enumerate(self._lookups):
+            positions[:, i] = lookup[dna_matrix[:, i]]
+
+        # One rng.random() per Variant with Materials, in row order:
+        rows, columns = np.nonzero(positions >= 0)
+        table_positions = positions[rows, columns]
+        random_ = rng.random
+        draws = np.array([random_() for _ in range(len(rows))], dtype=np.float64)
+
+        material_numbers = np.zeros(len(rows), dtype=np.int64)
+        for table_position in np.unique(table_positions).tolist():
+            selected = table_positions == table_position
+            material_numbers[selected] = self._table_list[table_position].draw_many(draws[selected])
+
+        material_matrix = np.zeros(dna_matrix.shape, dtype=np.int64)
+        material_matrix[rows, columns] = material_numbers
+        return material_matrix
+
+
+def load_materials_catalog(hierarchy, materials_file, enable_rarity=False):
+    """Reads a Materials file and returns its MaterialsCatalog."""
+    with open(materials_file) as f:
+        return MaterialsCatalog(hierarchy, json.load(f), enable_rarity)
+
+
+def select_material(material_list, variant, enable_rarity, rng=random):
     """Selects a material from a passed material list. """
     material_list_of_i = []  # List of Material names instead of order numbers
     rarity_list_of_i = []
@@ -39,9 +167,9 @@ def select_material(material_list, variant, enable_rarity):
     if enable_rarity:
         try:
             if if_zero_bool:
-                selected_material = random.choices(material_list_of_i, k=1)
+                selected_material = rng.choices(material_list_of_i, k=1)
             elif not if_zero_bool:
-                selected_material = random.choices(material_list_of_i, weights=rarity_list_of_i, k=1)
+                selected_material = rng.choices(material_list_of_i, weights=rarity_list_of_i, k=1)
         except IndexError:
             log.error(
                     f"\n{traceback.format_exc()}"
@@ -53,7 +181,7 @@ def select_material(material_list, variant, enable_rarity):
             raise IndexError()
     else:
         try:
-            selected_material = random.choices(material_list_of_i, k=1)
+            selected_material = rng.choices(material_list_of_i, k=1)
         except IndexError:
             log.error(
                     f"\n{traceback.format_exc()}"
@@ -68,66 +196,33 @@ def select_material(material_list, variant, enable_rarity):
 
 
 def get_variant_att_index(variant, hierarchy):
-    variant_attribute = None
+    variant = compile_hierarchy(hierarchy).variant(variant)
+    return variant.attribute_index, variant.order_number
 
-    for attribute in hierarchy:
-        for variant_h in hierarchy[attribute]:
-            if variant_h == variant:
-                variant_attribute = attribute
 
-    attribute_index = list(hierarchy.keys()).index(variant_attribute)
-    variant_order_num = variant.split("_")[1]
-    return attribute_index, variant_order_num
-
-
-def match_dna_to_variant(hierarchy, single_dna):
+def match_dna_to_variant(hierarchy, digits):
     """
-    Matches each DNA number separated by "-" to its attribute, then its variant.
+    Matches each Variant order number in digits to its attribute, then its variant.
     """
+    return compile_hierarchy(hierarchy).match_dna(digits)
 
-    list_attributes = list(hierarchy.keys())
-    list_dna_decunstructed = single_dna.split('-')
-    dna_dictionary = {}
-
-    for i, j in zip(list_attributes, list_dna_decunstructed):
-        dna_dictionary[i] = j
 
-    for x in dna_dictionary:
-        for k in hierarchy[x]:
-            k_num = hierarchy[x][k]["number"]
-            if k_num == dna_dictionary[x]:
-                dna_dictionary.update({x: k})
-    return dna_dictionary
-
-
-def apply_materials(hierarchy, single_dna, materials_file, enable_rarity):
+def apply_materials(hierarchy, digits, materials_file, enable_rarity, rng=random):
     """
     DNA with applied material example: "1-1:1-1" <Normal DNA>:<Selected Material for each Variant>
 
     The Material DNA will select the material for the Variant order number in the NFT DNA based on the Variant Material
-    list in the Variant_Material.json file.
-    """
-
-    single_dna_dict = match_dna_to_variant(hierarchy, single_dna)
-    materials_file = json.load(open(materials_file))
-    deconstructed_material_dna = {}
+    list in the Variant_Material.json file. Takes the NFT DNA as a list of Variant order numbers and returns the list of
+    selected Material order numbers, 0 where a Variant has no Materials (see dna_codec.py).
 
-    for a in single_dna_dict:
-        complete = False
-        for b in materials_file:
-            if single_dna_dict[a] == b:
-                material_name, material_list, = select_material(materials_file[b]['Material List'], b, enable_rarity)
-
-                # Gets the Order Number of the Material
-				# We add 1 to the index because 0 is what we return on an invalid lookup. 
-				# If we don't add 1 then when material index 0 is chosen randomly we will not change materials, 
-				# and conversly the last material in the list will never show up
-                material_order_num = (list(material_list.keys()).index(material_name))+1
+    materials_file is read into a MaterialsCatalog if it is not one already. Build the catalog once with
+    MaterialsCatalog when applying Materials to many DNA.
+    """
+    if not isinstance(materials_file, MaterialsCatalog):
+        materials_file = load_materials_catalog(hierarchy, materials_file, enable_rarity)
 
-                deconstructed_material_dna[a] = str(material_order_num)
-                complete = True
-        if not complete:
-            deconstructed_material_dna[a] = "0"
+    # Material order numbers start at 1 because 0 means no Material, see MaterialTable:
+    material_digits = materials_file.sample(digits, rng)
 
     # This section is now incorrect and needs updating:
 
@@ -136,14 +231,8 @@ def apply_materials(hierarchy, single_dna, materials_file, enable_rarity):
     # Attribute 'B' = 1, 'C' = 2, 'D' = 3, etc. For each pair you want to equal another, add its number it to this list:
     # synced_material_attributes = [1, 2]
     #
-    # first_mat = deconstructed_material_dna[synced_material_attributes[0]]
+    # first_mat = material_digits[synced_material_attributes[0]]
     # for i in synced_material_attributes:
-    #     deconstructed_material_dna[i] = first_mat
-
-    material_dna = ""
-    for a in deconstructed_material_dna:
-        num = "-" + str(deconstructed_material_dna[a])
-        material_dna += num
-    material_dna = ''.join(material_dna.split('-', 1))
+    #     material_digits[i] = first_mat
 
-    return f"{single_dna}:{material_dna}"
+    return material_digits
@@ -0,0 +1,139 @@
+# Purpose:
+# This file writes and reads Batch#.progress.jsonl, the journal of the NFTs of a Batch that finished rendering. One line
+# is appended per NFT instead of rewriting the whole Batch#.json, a crash can at worst cut the last line short. The
+# journal is read back into a completion bitmap when a failed Batch is resumed, and folded into Batch#.json once the
+# Batch is complete. It does not import bpy.
+
+import os
+import json
+import logging
+
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+JOURNAL_FORMAT = "Blend_My_NFTs Progress"
+JOURNAL_VERSION = 1
+
+JOURNAL_SUFFIX = ".progress.jsonl"
+
+# Lines are handed to the OS as they are written, but only forced to disk once this many are waiting. GenerationState.db
+# is updated at the same cadence, see state_store.py:
+SYNC_EVERY = 16
+
+
+def journal_path(batch_json_save_path, batch_num):
+    """Returns the path of the progress journal of Batch batch_num."""
+    return os.path.join(batch_json_save_path, f"Batch{batch_num}{JOURNAL_SUFFIX}")
+
+
+def is_journal(file_name):
+    return file_name.endswith(JOURNAL_SUFFIX)
+
+
+def _read_lines(file_name):
+    """Returns the header and the complete entry lines of a journal, a line cut short by a crash is left out."""
+    with open(file_name) as f:
+        lines = f.read().split('\n')[:-1]  # Text after the last newline was never finished
+
+    header = json.loads(lines[0]) if lines else {}
+    if header.get("format") != JOURNAL_FORMAT or header.get("version") != JOURNAL_VERSION:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"{file_name} is not a progress journal this version of Blend_My_NFTs can read.{TextColors.RESET}"
+        )
+        raise ValueError()
+
+    return header, lines[1:]
+
+
+def read_completed(file_name, nfts_in_batch, num_generated=0):
+    """
+    Returns a bytearray of nfts_in_batch flags, 1 for every position of the Batch's batch_dna_list that finished
+    rendering. Without a journal, as for Batches rendered by earlier versions, the first num_generated positions are
+    taken as completed.
+    """
+    completed = bytearray(nfts_in_batch)
+    if not os.path.exists(file_name):
+        completed[:num_generated] = b"\x01" * min(num_generated, nfts_in_batch)
+        return completed
+
+    _, lines = _read_lines(file_name)
+    for line in lines:
+        completed[json.loads(line)["position"]] = 1
+    return completed
+
+
+def count_completed(file_name):
+    """Returns the number of NFTs a journal records as completed, None if there is no journal."""
+    if not os.path.exists(file_name):
+        return None
+    _, lines = _read_lines(file_name)
+    return len({json.loads(line)["position"] for line in lines})
+
+
+class ProgressJournal:
+    """
+    Appends the completed NFTs of a Batch to its journal. A new journal replaces any earlier one unless resume is set,
+    resuming continues after the last complete line.
+
+    The journal is the authoritative record of which NFTs are done. on_sync, if given, is called with the entries
+    forced to disk by each sync, [(position, order_num, render_time)], so copies of the progress never get ahead of it.
+    """
+
+    def __init__(self, file_name, batch_num, nfts_in_batch, resume=False, on_sync=None):
+        self.file_name = file_name
+        self.on_sync = on_sync
+        self._unsynced = []
+
+        if resume and os.path.exists(file_name):
+            _read_lines(file_name)  # Checks the header
+
+            # Drops a line cut short by a crash, so the next line starts on its own:
+            with open(file_name, 'rb+') as f:
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+
+            self._file = open(file_name, 'a')
+        else:
+            self._file = open(file_name, 'w')
+            self._write_line({
+                "format": JOURNAL_FORMAT,
+                "version": JOURNAL_VERSION,
+                "batch": batch_num,
+                "nfts_in_batch": nfts_in_batch,
+            })
+            self.sync()
+
+    def _write_line(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=True) + '\n')
+        self._file.flush()
+
+    def record(self, position, order_num, render_time=None):
+        """Records that the NFT at position in batch_dna_list, with order_num, finished rendering in render_time s."""
+        self._write_line({"position": position, "order_num": order_num, "render_time": render_time})
+        self._unsynced.append((position, order_num, render_time))
+        if len(self._unsynced) >= SYNC_EVERY:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        synced, self._unsynced = self._unsynced, []
+        if synced and self.on_sync is not None:
+            self.on_sync(synced)
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def remove(self):
+        """Closes and deletes the journal, once its progress is saved in Batch#.json."""
+        self.close()
+        os.remove(self.file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if not self._file.closed:
+            self.close()
@@ -0,0 +1,150 @@
+# Purpose:
+# This file writes and reads NFTRecord.jsonl, the permanent record of all generated DNA, as JSON Lines. The first line
+# is a header holding the hierarchy and seed, every following line is one dna_list entry. Records are written and read
+# one DNA at a time so memory use does not grow with the collection size. NFTRecord.json files of earlier versions are
+# still read.
+
+import os
+import json
+import logging
+
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+RECORD_FORMAT = "Blend_My_NFTs NFTRecord"
+RECORD_VERSION = 1
+
+RECORD_FILE_NAME = "NFTRecord.jsonl"
+LEGACY_RECORD_FILE_NAME = "NFTRecord.json"
+
+
+def record_path(blend_my_nfts_output):
+    """Returns the path NFTRecord.jsonl is written to."""
+    return os.path.join(blend_my_nfts_output, RECORD_FILE_NAME)
+
+
+def find_record(blend_my_nfts_output):
+    """Returns the path of the NFTRecord.jsonl, or earlier NFTRecord.json, in blend_my_nfts_output, None if neither."""
+    for file_name in (RECORD_FILE_NAME, LEGACY_RECORD_FILE_NAME):
+        path = os.path.join(blend_my_nfts_output, file_name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _is_legacy(file_name):
+    return file_name.endswith(LEGACY_RECORD_FILE_NAME)
+
+
+def read_header(file_name):
+    """Returns the header of a record, a dictionary with at least "hierarchy" and "seed"."""
+    if _is_legacy(file_name):
+        with open(file_name) as f:
+            data_dictionary = json.load(f)
+        data_dictionary.pop("dna_list")
+        data_dictionary.setdefault("seed", None)
+        return data_dictionary
+
+    with open(file_name) as f:
+        header = json.loads(f.readline())
+
+    if header.get("format") != RECORD_FORMAT or header.get("version") != RECORD_VERSION:
+        log.error(
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"{file_name} is not an NFT record this version of Blend_My_NFTs can read.{TextColors.RESET}"
+        )
+        raise ValueError()
+
+    return header
+
+
+def iter_dna(file_name):
+    """Yields the dna_list entries of a record, {"1-2-3": {"complete": False, "order_num": 1}}, in order_num order."""
+    if _is_legacy(file_name):
+        with open(file_name) as f:
+            yield from json.load(f)["dna_list"]
+        return
+
+    with open(file_name) as f:
+        f.readline()  # Header
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_dna_list(file_name):
+    """
+    Returns every dna_list entry of a record as a list, in order_num order. Parses the whole record at once, faster than
+    iter_dna() when all DNA are needed in memory anyway.
+    """
+    if _is_legacy(file_name):
+        return list(iter_dna(file_name))
+
+    with open(file_name) as f:
+        f.readline()  # Header
+        return json.loads("[" + ",".join(line for line in f if line.strip()) + "]")
+
+
+def count_dna(file_name):
+    """Returns the number of DNA in a record."""
+    if _is_legacy(file_name):
+        return sum(1 for _ in iter_dna(file_name))
+
+    # Every line after the header is one DNA, they do not need to be parsed to be counted:
+    with open(file_name) as f:
+        f.readline()
+        return sum(1 for line in f if line.strip())
+
+
+class RecordWriter:
+    """
+    Writes an NFTRecord.jsonl one dna_list entry at a time. Entries go to a temporary file that replaces the record
+    when the writer is closed without an error, a failed run leaves the previous record in place.
+    """
+
+    def __init__(self, file_name, hierarchy, seed):
+        self.file_name = file_name
+        self.temp_file_name = f"{file_name}.tmp"
+        self.num_dna = 0
+
+        self._file = open(self.temp_file_name, 'w')
+        self._write_line({
+            "format": RECORD_FORMAT,
+            "version": RECORD_VERSION,
+            "seed": seed,
+            "hierarchy": hierarchy,
+        })
+
+    def _write_line(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=True) + '\n')
+
+    def write(self, entry):
+        self._write_line(entry)
+        self.num_dna += 1
+
+    def write_all(self, entries):
+        for entry in entries:
+            self.write(entry)
+
+    def close(self):
+        self._file.close()
+        os.replace(self.temp_file_name, self.file_name)
+
+        # An NFTRecord.json left by an earlier version is superseded by this record:
+        legacy_file_name = os.path.join(os.path.dirname(self.file_name), LEGACY_RECORD_FILE_NAME)
+        if os.path.exists(legacy_file_name):
+            os.remove(legacy_file_name)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.temp_file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,152 @@
+# Purpose:
+# This file estimates how long each NFT DNA takes to render from the render times of NFTs that were already generated,
+# for the "by_cost" strategy of batch_planner.py. Render times are harvested from the batch_info.json file of every
+# generated batch and, for batches generated before per-NFT times were saved there, from the per-NFT times in
+# BMNFTs_Log.txt. A per Variant cost is fitted to them so DNA that were never rendered can be estimated too.
+
+import os
+import re
+import json
+import logging
+import tempfile
+
+import numpy as np
+
+from .dna_codec import parse_dna
+from .text_colors import TextColors
+from .compiled_hierarchy import compile_hierarchy
+
+log = logging.getLogger(__name__)
+
+# Pulls every Variant cost towards the average render time, in number of NFTs worth of evidence:
+RIDGE_STRENGTH = 1.0
+
+# Estimated costs never drop below this share of the average render time:
+MIN_COST_SHARE = 0.1
+
+NFT_TIME_PATTERN = re.compile(r"TIME \[NFT (.+?) Generated\]: ([0-9.eE+-]+)s")
+
+
+def harvest_render_times(nft_batch_save_path, log_path=None):
+    """
+    Returns {DNA string: render time in seconds} of every NFT rendered into nft_batch_save_path. DNA rendered more than
+    once keep their latest time. Batches composited from layers are left out.
+    """
+    render_times = {}
+    if not os.path.isdir(nft_batch_save_path):
+        return render_times
+
+    # Render times logged by the exporter, matched to their DNA through the BMNFT_data files:
+    logged_times = {}
+    log_file = os.path.join(log_path or tempfile.gettempdir(), "BMNFTs_Log.txt")
+    if os.path.exists(log_file):
+        with open(log_file, errors="replace") as f:
+            for line in f:
+                match = NFT_TIME_PATTERN.search(line)
+                if match:
+                    logged_times[match.group(1)] = float(match.group(2))
+
+    for batch_folder in sorted(os.listdir(nft_batch_save_path)):
+        batch_info_path = os.path.join(nft_batch_save_path, batch_folder, "batch_info.json")
+        if not os.path.exists(batch_info_path):
+            continue
+
+        with open(batch_info_path) as f:
+            batch_info = json.load(f)
+
+        # Times of NFTs composited from layers say nothing about full renders, see layer_compositor.py:
+        if batch_info.get("Render Mode") == "composite":
+            continue
+
+        if "NFT Render Times" in batch_info:
+            render_times.update(batch_info["NFT Render Times"])
+            continue
+
+        bmnft_data_folder = os.path.join(nft_batch_save_path, batch_folder, "BMNFT_data")
+        if not os.path.isdir(bmnft_data_folder):
+            continue
+
+        batch_dna = {}
+        for data_file in os.listdir(bmnft_data_folder):
+            if data_file.startswith("Data_") and data_file.endswith(".json"):
+                with open(os.path.join(bmnft_data_folder, data_file)) as f:
+                    data = json.load(f)
+                batch_dna[data["name"]] = data["nft_dna"]
+
+        # Without logged times every NFT of the batch gets the batch's average:
+        average_time = batch_info["Batch Render Time"] / max(len(batch_dna), 1)
+        for name, single_dna in batch_dna.items():
+            render_times[single_dna] = logged_times.get(name, average_time)
+
+    return render_times
+
+
+class RenderCostModel:
+    """
+    Additive render cost model: the render time of a DNA is the average render time plus the cost of each of its
+    Variants. Variant costs are fitted to harvested render times with ridge regression, Variants without any history
+    cost nothing extra.
+    """
+
+    def __init__(self, hierarchy, render_times):
+        hierarchy = compile_hierarchy(hierarchy)
+        self.attributes = list(hierarchy.attribute_names)
+
+        # One column per Attribute and Variant order number:
+        self.columns = {}
+        for a in hierarchy.attributes:
+            for v in a.variants:
+                self.columns[(a.name, v.number)] = len(self.columns)
+
+        self.num_samples = len(render_times)
+        self.average_time = float(np.mean(list(render_times.values()))) if render_times else 1.0
+        self.variant_costs = np.zeros(len(self.columns) + 1)
+
+        if render_times:
+            # Each NFT has one Variant per Attribute, the normal equations are accumulated from the column pairs of
+            # every NFT instead of building the (NFTs x Variants) feature matrix. Empty Attributes and Variants that
+            # are no longer in the hierarchy fall in the extra last column, which is dropped:
+            num_columns = len(self.columns)
+            dna_columns = np.array([self._dna_columns(single_dna) for single_dna in render_times], dtype=np.int64)
+            times = np.array(list(render_times.values())) - self.average_time
+
+            gram = np.zeros((num_columns + 1, num_columns + 1))
+            moments = np.zeros(num_columns + 1)
+            for i in range(dna_columns.shape[1]):
+                np.add.at(moments, dna_columns[:, i], times)
+                for j in range(dna_columns.shape[1]):
+                    np.add.at(gram, (dna_columns[:, i], dna_columns[:, j]), 1)
+
+            gram = gram[:num_columns, :num_columns] + RIDGE_STRENGTH * np.eye(num_columns)
+            self.variant_costs = np.append(np.linalg.solve(gram, moments[:num_columns]), 0.0)
+
+    def _dna_columns(self, single_dna):
+        """Returns the column of each Attribute's Variant in a DNA string, the extra last column if it has none."""
+        digits, _ = parse_dna(single_dna)
+        digits += [0] * (len(self.attributes) - len(digits))
+        return [self.columns.get((a, digit), len(self.columns)) for a, digit in zip(self.attributes, digits)]
+
+    def cost(self, single_dna):
+        """Returns the estimated render time of a DNA string in seconds."""
+        estimate = self.average_time + sum(self.variant_costs[c] for c in self._dna_columns(single_dna))
+        return max(float(estimate), MIN_COST_SHARE * self.average_time)
+
+
+def estimate_costs(hierarchy, dna_strings, nft_batch_save_path, log_path=None):
+    """Returns the estimated render time of every DNA string in dna_strings, in order."""
+    render_times = harvest_render_times(nft_batch_save_path, log_path)
+
+    if not render_times:
+        log.warning(
+                f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                f"No render times were found in {nft_batch_save_path}. Every NFT is assumed to take as long to render, "
+                f"render a batch first to balance batches by render cost.{TextColors.RESET}"
+        )
+
+    model = RenderCostModel(hierarchy, render_times)
+    log.info(
+            f"\nRender costs estimated from {model.num_samples} rendered NFTs, average render time: "
+            f"{model.average_time:.2f}s."
+    )
+
+    return [model.cost(single_dna) for single_dna in dna_strings]
@@ -0,0 +1,85 @@
+# Purpose:
+# This file orders the DNA of a batch so consecutive NFTs differ in as few Attributes and Materials as possible, for
+# batch_planner.py. Fewer Variant collections and Materials change between renders, so Blender rebuilds less scene
+# state. Only the order in Batch#.json changes, NFTs keep their order_num and so their name.
+
+import numpy as np
+
+from .dna_codec import parse_dna
+
+RENDER_ORDERS = ("record", "min_changes")
+
+# Batches up to this size are ordered by greedy nearest neighbour, which compares every pair of DNA. Larger batches are
+# sorted along a reflected (boustrophedon) walk over the Attributes instead:
+GREEDY_LIMIT = 4096
+
+
+def dna_vectors(batch_dna_list):
+    """Returns an (N x Attributes + Materials) matrix of the Variant and Material order numbers of every DNA."""
+    rows = []
+    for entry in batch_dna_list:
+        digits, material_digits = parse_dna(list(entry.keys())[0])
+        rows.append(digits + (material_digits or [0] * len(digits)))
+    return np.array(rows, dtype=np.int64)
+
+
+def nearest_neighbour_order(vectors):
+    """
+    Starts at the first DNA and always moves on to the remaining DNA with the fewest different Variants and Materials,
+    the first one in batch order on ties. Returns the positions in render order.
+    """
+    num_dna = len(vectors)
+    remaining = np.ones(num_dna, dtype=bool)
+    order = [0]
+    remaining[0] = False
+
+    for _ in range(num_dna - 1):
+        distances = (vectors != vectors[order[-1]]).sum(axis=1)
+        distances[~remaining] = vectors.shape[1] + 1
+        position = int(np.argmin(distances))
+        order.append(position)
+        remaining[position] = False
+
+    return order
+
+
+def reflected_order(vectors):
+    """
+    Sorts DNA along a walk of the combination space in which every Attribute is walked forwards and backwards in turn,
+    like a mixed-radix Gray code, so neighbouring combinations differ in a single Attribute. Returns the positions in
+    render order.
+    """
+    radices = [int(r) for r in vectors.max(axis=0) + 1]
+
+    keys = []
+    for row in vectors.tolist():
+        walk_position = 0
+        for digit, radix in zip(row, radices):
+            if walk_position % 2:
+                digit = radix - 1 - digit
+            walk_position = walk_position * radix + digit
+        keys.append(walk_position)
+
+    return sorted(range(len(vectors)), key=keys.__getitem__)
+
+
+def order_batch(batch_dna_list, render_order="record"):
+    """Returns batch_dna_list in render order, see RENDER_ORDERS."""
+    if render_order == "record" or len(batch_dna_list) < 3:
+        return batch_dna_list
+
+    vectors = dna_vectors(batch_dna_list)
+    if len(batch_dna_list) <= GREEDY_LIMIT:
+        order = nearest_neighbour_order(vectors)
+    else:
+        order = reflected_order(vectors)
+
+    return [batch_dna_list[i] for i in order]
+
+
+def count_changes(batch_dna_list):
+    """Returns the total number of Variants and Materials that change between consecutive DNA of a batch."""
+    if len(batch_dna_list) < 2:
+        return 0
+    vectors = dna_vectors(batch_dna_list)
+    return int((vectors[1:] != vectors[:-1]).sum())
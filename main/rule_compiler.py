@@ -0,0 +1,511 @@
+# Purpose:
+# This file compiles the rules of a Logic.json file, or of the Logic rules set in the UI, into a RuleTable once per run
+# for logic.py. Each side of a rule, the IF Variants and the THEN or NOT Variants, becomes a bitmask over a one-hot
+# encoding of the DNA, so checking a rule takes a few integer operations instead of rebuilding the rule dictionaries
+# from the hierarchy. Two checks are compiled: whether a DNA satisfies a rule, for validating, counting and drawing
+# DNA, and whether logic.py applies a rule to a DNA, which it also does to some DNA already satisfying it. The
+# Variants an applied rule re-selects from, and their weights, are precomputed. It does not import bpy.
+
+import logging
+import traceback
+
+import numpy as np
+
+from .text_colors import TextColors
+from .compiled_hierarchy import compile_hierarchy
+
+log = logging.getLogger(__name__)
+
+RULE_TYPES = ("THEN", "NOT")
+
+# Rules reading Attributes with up to this many combinations of order numbers are checked against DNA matrices through
+# a lookup table of those combinations, see RuleTable.violation_matrix() and RuleTable.repair_matrix():
+MAX_RULE_LOOKUP_SIZE = 1 << 16
+
+
+class DNABits:
+    """
+    One-hot encoding of a DNA: Attribute i takes bits offsets[i] to offsets[i] + radices[i] - 1 and the bit of its
+    Variant order number is set, digit 0 (Empty) included.
+    """
+
+    def __init__(self, hierarchy):
+        self.radices = [max(a.by_number, default=0) + 1 for a in hierarchy.attributes]
+        self.offsets = []
+        offset = 0
+        for radix in self.radices:
+            self.offsets.append(offset)
+            offset += radix
+
+    def bit(self, attribute_index, number):
+        return 1 << (self.offsets[attribute_index] + number)
+
+    def span(self, attribute_index):
+        """Returns the bits of every order number of an Attribute."""
+        return ((1 << self.radices[attribute_index]) - 1) << self.offsets[attribute_index]
+
+    def encode(self, digits):
+        bits = 0
+        for offset, digit in zip(self.offsets, digits):
+            bits |= 1 << (offset + digit)
+        return bits
+
+
+def rule_items(hierarchy, rule_list_items):
+    """
+    Returns {Attribute name: [Variant names]} of the items listed on one side of a rule. An Attribute item stands for
+    all of its Variants in hierarchy order, Variant items are added to their Attribute in rule order. Items that are
+    neither are ignored.
+    """
+    items = {}
+    for item in rule_list_items:
+        if item in hierarchy:
+            items[item] = list(hierarchy.attribute(item).variant_names)
+
+        variant = hierarchy.variant(item)
+        if variant is not None:
+            variant_names = items.setdefault(variant.attribute, [])
+            if item not in variant_names:
+                variant_names.append(item)
+
+    return items
+
+
+class RuleSide:
+    """
+    The Variants listed on one side of a rule, as returned by rule_items().
+
+    mask holds the bits of every listed Variant, full_mask those of listed Variants whose whole Attribute is listed.
+    attribute_masks holds, for each listed Attribute in rule order, its index, span and the bits of its listed
+    Variants. choices holds, for each listed Attribute in rule order, its index, whether it is listed in full, and the
+    Variant order numbers and weights a rule re-selects from. columns holds the same checks as the masks as lookup
+    tables by Variant order number for each listed Attribute, to check whole DNA matrices at once. span holds the bits
+    of every order number of the listed Attributes.
+    """
+
+    __slots__ = ("mask", "full_mask", "span", "attribute_indices", "attribute_masks", "choices", "columns")
+
+    def __init__(self, hierarchy, dna_bits, items, enable_rarity, invert):
+        self.mask = 0
+        self.full_mask = 0
+        self.span = 0
+        self.attribute_indices = []
+        self.attribute_masks = []
+        self.choices = []
+        self.columns = []
+
+        for attribute_name, variant_names in items.items():
+            attribute = hierarchy.attribute(attribute_name)
+            full_att = tuple(variant_names) == attribute.variant_names  # True if full attribute in rules
+
+            # The last entry of each lookup table stands for order numbers the Attribute does not have:
+            selected = np.zeros(dna_bits.radices[attribute.index] + 1, dtype=bool)
+            attribute_mask = 0
+            for variant_name in variant_names:
+                number = hierarchy.variant(variant_name).number
+                bit = dna_bits.bit(attribute.index, number)
+                attribute_mask |= bit
+                if full_att:
+                    self.full_mask |= bit
+                selected[number] = True
+            self.mask |= attribute_mask
+
+            unselected = selected.sum() - selected > 0  # Another listed Variant is not selected
+            self.columns.append((attribute.index, selected, unselected, selected & full_att))
+
+            # NOT rules re-select from the Variants of a partly listed Attribute that are not listed:
+            if invert:
+                variants = [v for v in attribute.variants if v.key not in variant_names]
+            else:
+                variants = [hierarchy.variant(v) for v in variant_names]
+
+            self.span |= dna_bits.span(attribute.index)
+            self.attribute_indices.append(attribute.index)
+            self.attribute_masks.append((attribute.index, dna_bits.span(attribute.index), attribute_mask))
+            self.choices.append((attribute.index, attribute_name, full_att, *variant_choice(variants, enable_rarity)))
+
+
+def variant_choice(variants, enable_rarity):
+    """
+    Returns the Variant order numbers and weights rng.choices() re-selects from when a rule is applied. Weights
+    are None when drawn uniformly: without Rarity, or when the last Variant is weighted 0.
+    """
+    numbers = [v.number for v in variants]
+    weights = [v.weight for v in variants]
+
+    if not enable_rarity or (weights and weights[-1] == 0):
+        weights = None
+    return numbers, weights
+
+
+def choose_variant(numbers, weights, attribute_name, rng):
+    try:
+        return rng.choices(numbers, weights=weights, k=1)[0]
+    except IndexError:
+        log.error(
+            f"\n{traceback.format_exc()}"
+            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+            f"An issue was found within the Attribute collection '{attribute_name}'. For more information on "
+            f"Blend_My_NFTs compatible scenes, see:\n{TextColors.RESET}"
+            f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+        )
+        raise IndexError()
+
+
+class CompiledRule:
+    """
+    A THEN or NOT part of a Logic rule, see RuleTable. reads holds the indices of the Attributes deciding whether the
+    rule is satisfied or applied, writes those of the Attributes applying it can change.
+
+    A DNA satisfies a THEN rule if, when an IF Variant is selected, every THEN Attribute holds one of its listed
+    Variants. It satisfies a NOT rule if, when an IF Variant is selected, no NOT Variant is selected: Attributes listed
+    in full are then Empty (0).
+    """
+
+    __slots__ = ("name", "rule_type", "if_side", "result_side", "reads", "writes")
+
+    def __init__(self, name, rule_type, if_side, result_side):
+        self.name = name
+        self.rule_type = rule_type
+        self.if_side = if_side
+        self.result_side = result_side
+        self.reads = frozenset(if_side.attribute_indices) | frozenset(result_side.attribute_indices)
+        self.writes = frozenset(result_side.attribute_indices)
+
+    def satisfied_by(self, bits):
+        """Returns True if the DNA one-hot encoded as bits satisfies the rule."""
+        if not bits & self.if_side.mask:
+            return True
+        if self.rule_type == "NOT":
+            return not bits & self.result_side.mask
+        return all(bits & mask for _, _, mask in self.result_side.attribute_masks)
+
+    def violated_by(self, bits):
+        return not self.satisfied_by(bits)
+
+    def violated_by_partial(self, bits, assigned):
+        """
+        Returns True if every DNA completing a partly chosen DNA breaks the rule. bits holds the chosen Variants of the
+        Attributes whose bits are set in assigned, see DNABits.span().
+        """
+        if not bits & self.if_side.mask:
+            return False
+        if self.rule_type == "NOT":
+            return bits & self.result_side.mask != 0
+        return any(assigned & span and not bits & mask for _, span, mask in self.result_side.attribute_masks)
+
+    def triggered_by(self, bits):
+        """
+        Returns True if logic.py applies the rule to the DNA one-hot encoded as bits, which includes every DNA breaking
+        the rule. The rule is checked as written, then with its IF and THEN/NOT sides swapped.
+        """
+        return (
+                _breaks(bits, self.if_side, self.result_side, self.rule_type == "NOT")
+                or _breaks(bits, self.result_side, self.if_side, self.rule_type == "NOT")
+        )
+
+    def apply(self, bits, digits, rng):
+        """
+        Applies the rule to digits, a list of Variant order numbers, in place. If any IF Variant is selected, NOT rules
+        set fully listed Attributes to Empty (0) and re-select the others from their unlisted Variants, THEN rules
+        re-select every listed Attribute from its listed Variants.
+        """
+        if not bits & self.if_side.mask:
+            return
+
+        for attribute_index, attribute_name, full_att, numbers, weights in self.result_side.choices:
+            if self.rule_type == "NOT" and full_att:
+                digits[attribute_index] = 0
+            else:
+                digits[attribute_index] = choose_variant(numbers, weights, attribute_name, rng)
+
+
+class _MaskSide:
+    """The masks of one side of an EmptyRule, see RuleSide."""
+
+    __slots__ = ("mask", "span", "attribute_indices")
+
+    def __init__(self, mask, span, attribute_indices):
+        self.mask = mask
+        self.span = span
+        self.attribute_indices = attribute_indices
+
+
+class EmptyRule:
+    """
+    Logic only leaves an Attribute Empty (0) by applying a NOT rule listing it in full. When no rule can unselect the IF
+    Variants of those NOT rules afterwards, an EmptyRule is satisfied by a DNA unless its Attribute is Empty while
+    none of those NOT rules has an IF Variant selected. It is checked like a
+    CompiledRule by combination_counter.py and constrained_sampler.py, see RuleTable.constraints.
+    """
+
+    __slots__ = ("name", "rule_type", "if_side", "result_side", "reads", "writes")
+
+    def __init__(self, dna_bits, attribute_index, if_sides):
+        self.name = f"Empty Attribute {attribute_index}"
+        self.rule_type = "EMPTY"
+        self.if_side = _MaskSide(0, 0, [])
+        for if_side in if_sides:
+            self.if_side.mask |= if_side.mask
+            self.if_side.span |= if_side.span
+            self.if_side.attribute_indices.extend(
+                    i for i in if_side.attribute_indices if i not in self.if_side.attribute_indices
+            )
+        self.result_side = _MaskSide(
+                dna_bits.bit(attribute_index, 0),
+                dna_bits.span(attribute_index),
+                [attribute_index],
+        )
+        self.reads = frozenset(self.if_side.attribute_indices) | {attribute_index}
+        self.writes = frozenset()
+
+    def satisfied_by(self, bits):
+        return not bits & self.result_side.mask or bits & self.if_side.mask != 0
+
+    def violated_by(self, bits):
+        return not self.satisfied_by(bits)
+
+    def violated_by_partial(self, bits, assigned):
+        return self.violated_by(bits) and self.if_side.span & ~assigned == 0
+
+
+def _breaks(bits, if_side, result_side, is_not):
+    """
+    Checks if logic.py applies a given rule to a DNA, the bitmask form of the checks logic.py did with rule
+    dictionaries. This is not whether the DNA satisfies the rule, see CompiledRule.satisfied_by().
+    """
+    if_bool = bits & if_side.mask != 0  # An IF Variant is selected
+    result_bool = bits & result_side.mask != 0  # A THEN/NOT Variant is selected
+    then_bool = result_side.mask & ~bits != 0  # A THEN/NOT Variant is not selected
+    full_att_bool = bits & result_side.full_mask != 0  # A selected THEN/NOT Variant is part of a full Attribute
+
+    if if_bool and then_bool:
+        return True
+    if if_bool and result_bool and is_not:
+        return True
+    # If Variants in 'if_dict' not found in the DNA, and 'result_dict' variants are found in the DNA, and they are a
+    # part of a full Attribute in 'then_dict':
+    return not if_bool and result_bool and full_att_bool
+
+
+def _side_matrix(dna_matrix, side):
+    """
+    Returns, for every row of a DNA matrix, whether a Variant of side is selected, whether a Variant of side is not
+    selected, and whether a selected Variant of side is part of a full Attribute.
+    """
+    selected = np.zeros(len(dna_matrix), dtype=bool)
+    unselected = np.zeros(len(dna_matrix), dtype=bool)
+    full = np.zeros(len(dna_matrix), dtype=bool)
+
+    for attribute_index, selected_lookup, unselected_lookup, full_lookup in side.columns:
+        numbers = np.clip(dna_matrix[:, attribute_index], 0, len(selected_lookup) - 1)
+        selected |= selected_lookup[numbers]
+        unselected |= unselected_lookup[numbers]
+        full |= full_lookup[numbers]
+
+    return selected, unselected, full
+
+
+def _breaks_matrix(if_bool, result_bool, then_bool, full_att_bool, is_not):
+    """_breaks() for every row of a DNA matrix at once, from the _side_matrix() of both sides."""
+    return (if_bool & then_bool) | (if_bool & result_bool & is_not) | (~if_bool & result_bool & full_att_bool)
+
+
+def _rule_violations(rule, dna_matrix):
+    """CompiledRule.violated_by() for every row of a DNA matrix at once."""
+    if_selected = np.zeros(len(dna_matrix), dtype=bool)
+    for attribute_index, selected_lookup, _, _ in rule.if_side.columns:
+        if_selected |= selected_lookup[np.clip(dna_matrix[:, attribute_index], 0, len(selected_lookup) - 1)]
+
+    # NOT rules are broken by a selected NOT Variant, THEN rules by a THEN Attribute holding no listed Variant:
+    result_broken = np.zeros(len(dna_matrix), dtype=bool)
+    for attribute_index, selected_lookup, _, _ in rule.result_side.columns:
+        selected = selected_lookup[np.clip(dna_matrix[:, attribute_index], 0, len(selected_lookup) - 1)]
+        result_broken |= selected if rule.rule_type == "NOT" else ~selected
+
+    return if_selected & result_broken
+
+
+def _rule_triggers(rule, dna_matrix):
+    """CompiledRule.triggered_by() for every row of a DNA matrix at once."""
+    is_not = rule.rule_type == "NOT"
+    if_selected, if_unselected, if_full = _side_matrix(dna_matrix, rule.if_side)
+    result_selected, result_unselected, result_full = _side_matrix(dna_matrix, rule.result_side)
+
+    return (
+            _breaks_matrix(if_selected, result_selected, result_unselected, result_full, is_not)
+            | _breaks_matrix(result_selected, if_selected, if_unselected, if_full, is_not)
+    )
+
+
+class RuleTable:
+    """
+    The rules of a logic_file compiled for a hierarchy. Rules keep the order of the logic_file, a rule with both a
+    THEN and a NOT part compiles to two CompiledRules, THEN first.
+
+    readers holds, for every Attribute, the positions in rules of the rules reading it: once applying a rule changed
+    some Attributes, only their readers can be broken or mended by it.
+    """
+
+    def __init__(self, hierarchy, logic_file, enable_rarity):
+        self.hierarchy = compile_hierarchy(hierarchy)
+        self.dna_bits = DNABits(self.hierarchy)
+        self.rules = []
+
+        for rule in logic_file:
+            if_items = rule_items(self.hierarchy, logic_file[rule]["IF"])
+            if_side = RuleSide(self.hierarchy, self.dna_bits, if_items, enable_rarity, False)
+
+            for rule_type in RULE_TYPES:
+                if rule_type in logic_file[rule]:
+                    result_items = rule_items(self.hierarchy, logic_file[rule][rule_type])
+                    result_side = RuleSide(
+                            self.hierarchy,
+                            self.dna_bits,
+                            result_items,
+                            enable_rarity,
+                            rule_type == "NOT",
+                    )
+                    self.rules.append(CompiledRule(rule, rule_type, if_side, result_side))
+
+        # Attributes NOT rules list in full can be Empty. They stay Empty only while one of those rules applies, unless
+        # a rule can unselect the IF Variants of those rules after they were applied:
+        emptying = {}
+        written = 0  # Bits of every order number a rule can set
+        for rule in self.rules:
+            for attribute_index, _, full_att, numbers, _ in rule.result_side.choices:
+                if rule.rule_type == "NOT" and full_att:
+                    emptying.setdefault(attribute_index, []).append(rule.if_side)
+                    written |= self.dna_bits.bit(attribute_index, 0)
+                else:
+                    for number in numbers:
+                        written |= self.dna_bits.bit(attribute_index, number)
+        self.emptied = set(emptying)
+
+        self.empty_rules = []
+        for attribute_index, if_sides in sorted(emptying.items()):
+            empty_rule = EmptyRule(self.dna_bits, attribute_index, if_sides)
+            if written & empty_rule.if_side.span & ~empty_rule.if_side.mask == 0:
+                self.empty_rules.append(empty_rule)
+
+        # Every DNA Logic can make satisfies these, the Logic rules first:
+        self.constraints = self.rules + self.empty_rules
+
+        self.readers = [[] for _ in self.hierarchy.attributes]
+        for j, rule in enumerate(self.rules):
+            for attribute_index in sorted(rule.reads):
+                self.readers[attribute_index].append(j)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def cycles(self):
+        """
+        Returns the groups of rules that can keep changing each other's Attributes, as lists of rule names in rule
+        order: the strongly connected components of more than one rule in the graph linking every rule to the rules
+        reading an Attribute it writes. Repairing a DNA with these rules may not come to an end.
+        """
+        successors = []
+        for j, rule in enumerate(self.rules):
+            successors.append(sorted({k for i in rule.writes for k in self.readers[i] if k != j}))
+
+        # Tarjan's algorithm, iterative:
+        index = {}
+        low_link = {}
+        on_stack = set()
+        stack = []
+        components = []
+        for root in range(len(self.rules)):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                j, next_successor = work.pop()
+                if next_successor == 0:
+                    index[j] = low_link[j] = len(index)
+                    stack.append(j)
+                    on_stack.add(j)
+
+                for position in range(next_successor, len(successors[j])):
+                    k = successors[j][position]
+                    if k not in index:
+                        work.append((j, position + 1))
+                        work.append((k, 0))
+                        break
+                    if k in on_stack:
+                        low_link[j] = min(low_link[j], index[k])
+                else:
+                    if low_link[j] == index[j]:
+                        component = []
+                        while True:
+                            k = stack.pop()
+                            on_stack.discard(k)
+                            component.append(k)
+                            if k == j:
+                                break
+                        if len(component) > 1:
+                            components.append(sorted(component))
+                    if work:
+                        parent = work[-1][0]
+                        low_link[parent] = min(low_link[parent], low_link[j])
+
+        # The THEN and NOT parts of a single rule are not a cycle between rules:
+        cycles = [list(dict.fromkeys(self.rules[j].name for j in component)) for component in sorted(components)]
+        return [names for names in cycles if len(names) > 1]
+
+    def violation_matrix(self, dna_matrix):
+        """
+        Returns an (N x rules) boolean matrix, True where row i of an (N x Attributes) matrix of Variant order numbers
+        breaks rule j, see CompiledRule.satisfied_by().
+        """
+        return self._rule_matrix(dna_matrix, _rule_violations)
+
+    def repair_matrix(self, dna_matrix):
+        """
+        Returns an (N x rules) boolean matrix, True where logic.logicafy_dna_single() applies rule j to row i of an
+        (N x Attributes) matrix of Variant order numbers. Rows no rule applies to are left unchanged by it.
+        """
+        return self._rule_matrix(dna_matrix, _rule_triggers)
+
+    def _rule_matrix(self, dna_matrix, rule_check):
+        """Returns rule_check(rule, dna_matrix) of every rule as the columns of an (N x rules) boolean matrix."""
+        dna_matrix = np.asarray(dna_matrix, dtype=np.int64)
+        columns = np.asfortranarray(dna_matrix)
+        violations = np.zeros((len(dna_matrix), len(self.rules)), dtype=bool, order="F")  # Filled column by column
+
+        # Rules reading the same Attributes share one lookup key per row:
+        rules_by_reads = {}
+        for j, rule in enumerate(self.rules):
+            rules_by_reads.setdefault(tuple(sorted(rule.reads)), []).append(j)
+
+        for reads, rule_indices in rules_by_reads.items():
+            # The last lookup entry of each Attribute stands for order numbers it does not have, see RuleSide:
+            sizes = [self.dna_bits.radices[i] + 1 for i in reads]
+            num_combinations = int(np.prod(sizes))
+
+            if num_combinations > MAX_RULE_LOOKUP_SIZE:
+                for j in rule_indices:
+                    violations[:, j] = rule_check(self.rules[j], dna_matrix)
+                continue
+
+            # Each rule is checked once for every combination of order numbers of the Attributes it reads, rows then
+            # look their combination up:
+            key = np.zeros(len(dna_matrix), dtype=np.int64)
+            for i, size in zip(reads, sizes):
+                key = key * size + np.clip(columns[:, i], 0, size - 1)
+
+            combinations = np.zeros((num_combinations, dna_matrix.shape[1]), dtype=np.int64)
+            if reads:
+                combinations[:, list(reads)] = np.indices(sizes).reshape(len(reads), -1).T
+
+            for j in rule_indices:
+                violations[:, j] = rule_check(self.rules[j], combinations)[key]
+
+        return violations
+
+
+def compile_rules(hierarchy, logic_file, enable_rarity):
+    """Returns logic_file compiled into a RuleTable, or logic_file itself if it already is one."""
+    if isinstance(logic_file, RuleTable):
+        return logic_file
+    return RuleTable(hierarchy, logic_file, enable_rarity)
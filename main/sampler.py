@@ -0,0 +1,242 @@
+# Purpose:
+# This file precomputes the Variant weight tables of every Attribute in the hierarchy once, then draws whole blocks of
+# NFT DNA at a time as an (N x Attributes) integer matrix with NumPy. Used by dna_generator.py instead of calling
+# random.choices() once per Attribute per DNA.
+#
+# When neither Rarity nor Logic are enabled, dna_generator.py instead walks a seeded pseudo-random permutation of the
+# combination space (IndexPermutation) and decodes each index straight into a unique DNA, without any rejection.
+#
+# In Rarity quota mode allocate_quotas() turns every Variant's weight into an exact count for the collection instead.
+
+import logging
+import traceback
+
+import numpy as np
+
+from .text_colors import TextColors
+from .compiled_hierarchy import compile_hierarchy
+
+log = logging.getLogger(__name__)
+
+# Largest combination space walked by IndexPermutation. Feistel halves must fit in 32 bits for the uint64 round
+# function, above this the chance of drawing a duplicate DNA at random is negligible anyway.
+MAX_PERMUTATION_SIZE = 2 ** 62
+
+# Number of DNA drawn, decoded and packed at a time:
+BLOCK_SIZE = 65536
+
+# Random swaps tried per duplicate DNA before allocate_quotas() gives up on it:
+MAX_SWAP_TRIES = 1000
+
+
+class SamplingTable:
+    """
+    Per Attribute Variant numbers and cumulative weights built once from the hierarchy. Rows drawn with sample() hold
+    the Variant order numbers of each Attribute, in hierarchy order.
+    """
+
+    def __init__(self, hierarchy, enable_rarity):
+        hierarchy = compile_hierarchy(hierarchy)
+        self.attributes = list(hierarchy.attribute_names)
+        self.numbers = []  # Variant order numbers of each Attribute
+        self.weights = []  # Variant weights of each Attribute, None when drawn uniformly
+        self.cumulative = []  # Normalized cumulative weights of each Attribute, None when drawn uniformly
+
+        for attribute in hierarchy.attributes:
+            if len(attribute) == 0:
+                log.error(
+                    f"\n{traceback.format_exc()}"
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"An issue was found within the Attribute collection '{attribute.name}'. For more information on "
+                    f"Blend_My_NFTs compatible scenes, see:\n{TextColors.RESET}"
+                    f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+                )
+                raise IndexError()
+
+            numbers = attribute.numbers
+            self.numbers.append(numbers)
+
+            cumulative = None
+            weights = None
+            if enable_rarity:
+                weights = attribute.weights
+                total = weights.sum()
+
+                # An Attribute with all of its Variants weighted 0 is drawn uniformly:
+                if total > 0:
+                    cumulative = np.cumsum(weights) / total
+            self.cumulative.append(cumulative)
+            self.weights.append(weights if cumulative is not None else None)
+
+        self.combinations = 1
+        for numbers in self.numbers:
+            self.combinations *= len(numbers)
+
+    def sample(self, n, rng):
+        """Draws n DNA as an (n x Attributes) matrix of Variant order numbers using the NumPy Generator rng."""
+        dna_matrix = np.empty((n, len(self.attributes)), dtype=np.int64)
+
+        for column, (numbers, cumulative) in enumerate(zip(self.numbers, self.cumulative)):
+            if cumulative is None:
+                indices = rng.integers(0, len(numbers), size=n)
+            else:
+                indices = np.searchsorted(cumulative, rng.random(n), side="right")
+                np.minimum(indices, len(numbers) - 1, out=indices)  # Guards against float rounding of the last bin
+
+            dna_matrix[:, column] = numbers[indices]
+
+        return dna_matrix
+
+    def decode_indices(self, indices):
+        """
+        Decodes combination indices in 0..combinations-1 as mixed-radix numbers, one digit per Attribute, into an
+        (n x Attributes) matrix of Variant order numbers.
+        """
+        indices = np.asarray(indices, dtype=np.uint64)
+        dna_matrix = np.empty((len(indices), len(self.attributes)), dtype=np.int64)
+
+        for column, numbers in enumerate(self.numbers):
+            radix = np.uint64(len(numbers))
+            dna_matrix[:, column] = numbers[(indices % radix).astype(np.int64)]
+            indices = indices // radix
+
+        return dna_matrix
+
+    def allocate_quotas(self, n, rng, taken=()):
+        """
+        Draws n DNA in which every Variant appears exactly its quota_counts() number of times. Each Attribute column
+        is shuffled on its own, then duplicate rows, and rows already in taken (a collection of rows as tuples of
+        Variant order numbers), are made unique by swapping a Variant with another row, which keeps every count.
+        Returns the (rows x Attributes) matrix of Variant order numbers and the number of rows that stayed duplicates
+        and were left out.
+        """
+        index_matrix = np.empty((n, len(self.attributes)), dtype=np.int64)
+        for column, numbers in enumerate(self.numbers):
+            counts = quota_counts(self.weights[column], n, len(numbers))
+            index_matrix[:, column] = rng.permutation(np.repeat(np.arange(len(numbers)), counts))
+
+        # Rows are compared as mixed-radix keys of their Variant indices, Python integers never overflow:
+        places = []
+        place = 1
+        for numbers in self.numbers:
+            places.append(place)
+            place *= len(numbers)
+
+        positions = [{int(number): i for i, number in enumerate(numbers)} for numbers in self.numbers]
+        taken_keys = set()
+        for row in taken:
+            if all(digit in position for digit, position in zip(row, positions)):
+                taken_keys.add(sum(position[digit] * p for digit, position, p in zip(row, positions, places)))
+
+        rows = index_matrix.tolist()
+        keys = [sum(i * p for i, p in zip(row, places)) for row in rows]
+
+        duplicates = []
+        for r, key in enumerate(keys):
+            if key in taken_keys:
+                duplicates.append(r)
+            else:
+                taken_keys.add(key)
+        pending = set(duplicates)
+
+        dropped = []
+        for r in duplicates:
+            for _ in range(MAX_SWAP_TRIES):
+                column = int(rng.integers(len(places)))
+                s = int(rng.integers(n))
+                if s in pending or rows[s][column] == rows[r][column]:
+                    continue
+
+                change = (rows[s][column] - rows[r][column]) * places[column]
+                new_key_r = keys[r] + change
+                new_key_s = keys[s] - change
+                if new_key_r in taken_keys or new_key_s in taken_keys or new_key_r == new_key_s:
+                    continue
+
+                taken_keys.remove(keys[s])
+                taken_keys.update((new_key_r, new_key_s))
+                rows[r][column], rows[s][column] = rows[s][column], rows[r][column]
+                keys[r], keys[s] = new_key_r, new_key_s
+                pending.remove(r)
+                break
+            else:
+                dropped.append(r)
+
+        index_matrix = np.array(rows, dtype=np.int64).reshape(n, len(self.attributes))
+        if dropped:
+            index_matrix = np.delete(index_matrix, dropped, axis=0)
+
+        dna_matrix = np.empty_like(index_matrix)
+        for column, numbers in enumerate(self.numbers):
+            dna_matrix[:, column] = numbers[index_matrix[:, column]]
+
+        return dna_matrix, len(dropped)
+
+
+def quota_counts(weights, n, num_variants):
+    """
+    Splits n DNA between the Variants of an Attribute in proportion to their weights with largest remainder rounding,
+    the counts always add up to n. weights None splits n evenly.
+    """
+    if weights is None:
+        weights = np.ones(num_variants, dtype=np.float64)
+
+    shares = weights / weights.sum() * n
+    counts = np.floor(shares).astype(np.int64)
+
+    # Largest remainders first, ties go to the Variant listed first:
+    remainder = n - int(counts.sum())
+    order = np.argsort(-(shares - counts), kind="stable")
+    counts[order[:remainder]] += 1
+
+    return counts
+
+
+class IndexPermutation:
+    """
+    Seeded pseudo-random permutation of 0..size-1. A 4 round balanced Feistel network permutes the smallest even
+    power of two covering size, indices landing outside of 0..size-1 are encrypted again (cycle walking) until they
+    land inside it. Memory use is constant and every position maps to a unique index.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, size, seed):
+        if size > MAX_PERMUTATION_SIZE:
+            raise ValueError(f"IndexPermutation supports at most {MAX_PERMUTATION_SIZE} indices, got {size}.")
+
+        self.size = size
+
+        bits = max(2, (size - 1).bit_length())
+        bits += bits % 2
+        self.half_bits = np.uint64(bits // 2)
+        self.half_mask = np.uint64((1 << (bits // 2)) - 1)
+
+        key_rng = np.random.default_rng(seed)
+        self.keys = [np.uint64(k) for k in key_rng.integers(0, 2 ** 63, size=self.ROUNDS, dtype=np.int64)]
+
+    def _round(self, x, key):
+        # splitmix64 finalizer, uint64 multiplication wraps around:
+        x = (x ^ key) * np.uint64(0x9E3779B97F4A7C15)
+        x ^= x >> np.uint64(29)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(32)
+        return x & self.half_mask
+
+    def _encrypt(self, x):
+        left = x >> self.half_bits
+        right = x & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def permute(self, positions):
+        """Returns the permuted index of every position in positions as a uint64 array."""
+        indices = self._encrypt(np.asarray(positions, dtype=np.uint64))
+
+        outside = indices >= np.uint64(self.size)
+        while outside.any():
+            indices[outside] = self._encrypt(indices[outside])
+            outside = indices >= np.uint64(self.size)
+
+        return indices
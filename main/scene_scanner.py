@@ -0,0 +1,123 @@
+# Purpose:
+# This file builds the hierarchy of a Blender scene for helpers.py(scan_hierarchy) in a single walk over the collection
+# tree. Attributes and Variants are told apart and Variant names are parsed while walking, so the hierarchy is built in
+# time linear in the number of collections. It only reads the .name and .children of collections and does not import
+# bpy, the benchmark at the bottom runs it on synthetic collection trees:
+#
+#   python -m main.scene_scanner 5000 20000
+
+import sys
+import time
+import logging
+import traceback
+
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+# Collections whose name holds this character are Variants, all others are Attributes:
+VARIANT_SEPARATOR = "_"
+
+IGNORED_COLLECTION_NAMES = ("Scene Collection", "Master Collection")
+
+
+def parse_variant_name(variant):
+    """Returns {"name", "number", "rarity"} of a Variant collection named "<name>_<order number>_<rarity>"."""
+    parts = variant.split(VARIANT_SEPARATOR)
+
+    # Check if name follows naming conventions:
+    if len(parts) < 3 or (len(parts) > 3 and int(parts[1]) > 0):
+        log.error(
+                f"\n{traceback.format_exc()}"
+                f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                f"There is a naming issue with the following Attribute/Variant: '{variant}'\n"
+                f"Review the naming convention of Attribute and Variant collections here:\n{TextColors.RESET}"
+                f"https://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+        )
+        raise Exception()
+
+    return {"name": parts[0], "number": parts[1], "rarity": parts[2]}
+
+
+def scan_collection_tree(scene_collection, script_ignore_collection):
+    """
+    Returns the hierarchy of the collection tree under scene_collection, leaving out script_ignore_collection and
+    everything in it. Attributes are sorted by name, their Variants keep the order of the Attribute's children.
+    """
+    attributes = {}  # Attribute name: collection
+    variants = {}  # Variant name: {"name", "number", "rarity"}
+
+    stack = list(reversed(scene_collection.children[:]))
+    while stack:
+        collection = stack.pop()
+        name = collection.name
+        if name == script_ignore_collection.name or name in IGNORED_COLLECTION_NAMES:
+            continue
+
+        if VARIANT_SEPARATOR in name:
+            if name not in variants:
+                variants[name] = parse_variant_name(name)
+        else:
+            attributes[name] = collection
+
+        stack.extend(reversed(collection.children[:]))
+
+    hierarchy = {}
+    for attribute in sorted(attributes):
+        hierarchy[attribute] = {child.name: variants.get(child.name) for child in attributes[attribute].children}
+
+    return hierarchy
+
+
+# ======== BENCHMARK ======== #
+
+class _SyntheticCollection:
+    __slots__ = ("name", "children")
+
+    def __init__(self, name, children=()):
+        self.name = name
+        self.children = list(children)
+
+
+def synthetic_collection_tree(num_collections, variants_per_attribute=20, objects_per_variant=2):
+    """
+    Returns (scene collection, Script_Ignore collection) of a synthetic tree with about num_collections collections:
+    Attributes of variants_per_attribute Variants, each Variant holding objects_per_variant sub-collections.
+    """
+    per_attribute = 1 + variants_per_attribute * (1 + objects_per_variant)
+    script_ignore = _SyntheticCollection("Script_Ignore", [_SyntheticCollection("Camera_Rig")])
+
+    roots = [script_ignore]
+    for a in range(max(-(-num_collections // per_attribute), 1)):
+        variants = []
+        for v in range(1, variants_per_attribute + 1):
+            objects = [_SyntheticCollection(f"Part{a}x{v}x{o}_0_0") for o in range(objects_per_variant)]
+            variants.append(_SyntheticCollection(f"Attribute{a}Variant{v}_{v}_{v * 5}", objects))
+        roots.append(_SyntheticCollection(f"Attribute{a}", variants))
+
+    return _SyntheticCollection("Scene Collection", roots), script_ignore
+
+
+def benchmark(sizes=(5000, 10000, 20000), repeats=3):
+    """Times scan_collection_tree() on synthetic trees of each size, returns [(collections, seconds)]."""
+    results = []
+    for size in sizes:
+        scene_collection, script_ignore = synthetic_collection_tree(size)
+
+        best = float("inf")
+        for _ in range(repeats):
+            time_start = time.perf_counter()
+            hierarchy = scan_collection_tree(scene_collection, script_ignore)
+            best = min(best, time.perf_counter() - time_start)
+
+        num_collections = sum(1 + sum(1 + len(v.children) for v in a.children) for a in scene_collection.children)
+        results.append((num_collections, best))
+        print(
+                f"{num_collections} collections, {len(hierarchy)} Attributes: {best * 1000:.1f}ms "
+                f"({best / num_collections * 1e6:.2f}us per collection)"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    benchmark([int(i) for i in sys.argv[1:]] or (5000, 10000, 20000))
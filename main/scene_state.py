@@ -0,0 +1,95 @@
+# Purpose:
+# This file keeps track of the Variant collections shown and the Materials assigned in the scene while exporter.py
+# renders a Batch. Collection, object and Material handles are looked up in bpy.data once, and each NFT only changes
+# what differs from the NFT before it, so Blender re-evaluates as little of the scene as possible between renders.
+
+import bpy
+import logging
+import traceback
+
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+
+class SceneState:
+    """
+    The Variant collections of a hierarchy and the Materials of their objects, as last set by this SceneState. Changes
+    made to the scene by anything else while it is in use are not seen.
+    """
+
+    def __init__(self, hierarchy):
+        self.collections = {}
+        for attribute in hierarchy:
+            for variant in hierarchy[attribute]:
+                try:
+                    self.collections[variant] = bpy.data.collections[variant]
+                except KeyError:
+                    log.error(
+                            f"\n{traceback.format_exc()}"
+                            f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                            f"The Collection '{variant}' appears to be missing or has been renamed. If you made any "
+                            f"changes to your .blend file scene, ensure you re-create your NFT Data so Blend_My_NFTs "
+                            f"can read your scene. For more information see:{TextColors.RESET}"
+                            f"\nhttps://github.com/torrinworx/Blend_My_NFTs#blender-file-organization-and-structure\n"
+                    )
+                    raise TypeError()
+
+        self.visible = None  # Names of the shown collections, None until the first NFT hides all others
+        self.applied_materials = {}  # Material name by object name
+        self._material_objects = {}
+        self._materials = {}
+
+    def _set_visible(self, variant, visible):
+        collection = self.collections.get(variant) or bpy.data.collections[variant]
+        collection.hide_render = not visible
+        collection.hide_viewport = not visible
+
+    def show_variants(self, variants):
+        """Shows the collections of variants, Variant names or '0' for Empty, and hides every other Variant."""
+        shown = {v for v in variants if v != '0'}
+
+        if self.visible is None:
+            for variant in self.collections:
+                if variant not in shown:
+                    self._set_visible(variant, False)
+            changed = shown
+        else:
+            for variant in self.visible - shown:
+                self._set_visible(variant, False)
+            changed = shown - self.visible
+
+        for variant in changed:
+            self._set_visible(variant, True)
+        self.visible = shown
+
+    def show_all(self):
+        """Shows every Variant collection again, as they were before rendering."""
+        for variant in self.collections:
+            self._set_visible(variant, True)
+        self.visible = set(self.collections)
+
+    def material_objects(self, variant, materials_catalog):
+        """
+        Returns the objects of variant that its Materials are applied to: the Variant Objects of the Materials file,
+        or every object of the Variant collection if none are listed.
+        """
+        if variant not in self._material_objects:
+            object_names = materials_catalog.variant_objects(variant)
+            if object_names:
+                objects = [bpy.data.objects.get(name) for name in object_names]
+            else:
+                objects = [bpy.data.objects.get(obj.name) for obj in self.collections[variant].all_objects]
+            self._material_objects[variant] = objects
+        return self._material_objects[variant]
+
+    def apply_material(self, variant, material_name, materials_catalog):
+        """Assigns the Material material_name to the objects of variant that do not have it from an earlier NFT."""
+        if material_name not in self._materials:
+            self._materials[material_name] = bpy.data.materials[material_name]
+        material = self._materials[material_name]
+
+        for obj in self.material_objects(variant, materials_catalog):
+            if self.applied_materials.get(obj.name) != material_name:
+                obj.active_material = material
+                self.applied_materials[obj.name] = material_name
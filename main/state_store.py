@@ -0,0 +1,277 @@
+# Purpose:
+# This file keeps GenerationState.db, an SQLite database in the Batch_Data folder holding the rendering status, timings,
+# worker and number of attempts of every Batch and NFT. exporter.py updates it in one transaction when a Batch starts or
+# finishes, and each time the Batch's progress journal syncs completed NFTs to disk (see progress_journal.py). The
+# journal stays the authoritative record of what is done, the database can lag it by fewer than SYNC_EVERY NFTs and is
+# brought up to date from it when the Batch is resumed. The Generate NFTs panel, the Resume Failed Batch operator and
+# the headless 'batch-status' operation read what failed and what is left with single indexed queries instead of opening
+# every Batch#.json. It does not import bpy.
+
+import os
+import re
+import json
+import time
+import socket
+import sqlite3
+import logging
+import pathlib
+
+from . import progress_journal
+from .text_colors import TextColors
+
+log = logging.getLogger(__name__)
+
+STATE_FILE_NAME = "GenerationState.db"
+SCHEMA_VERSION = 1
+
+PENDING = "pending"
+RENDERING = "rendering"
+COMPLETE = "complete"
+
+_SCHEMA = """
+CREATE TABLE batches (
+    batch_num INTEGER PRIMARY KEY,
+    nfts_in_batch INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    num_completed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    started_at REAL,
+    finished_at REAL,
+    render_time REAL
+);
+CREATE INDEX batches_by_status ON batches (status, started_at);
+
+CREATE TABLE nfts (
+    batch_num INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    order_num INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    started_at REAL,
+    completed_at REAL,
+    render_time REAL,
+    PRIMARY KEY (batch_num, position)
+);
+CREATE INDEX nfts_by_status ON nfts (batch_num, status);
+"""
+
+
+def state_path(batch_json_save_path):
+    """Returns the path of the GenerationState.db of a Batch_Data folder."""
+    return os.path.join(batch_json_save_path, STATE_FILE_NAME)
+
+
+def worker_id():
+    """Returns the name of this rendering process, "<host name>:<process id>"."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class StateStore:
+    """
+    The GenerationState.db of a Batch_Data folder, created if missing. A new database takes over the progress of
+    Batches rendered before it existed from their Batch#.json files and progress journals.
+    """
+
+    def __init__(self, batch_json_save_path, read_only=False):
+        self.batch_json_save_path = batch_json_save_path
+        self.file_name = state_path(batch_json_save_path)
+
+        if read_only:
+            uri = pathlib.Path(self.file_name).resolve().as_uri()  # Escapes '#', '%' and '?' in the path
+            self._connection = sqlite3.connect(f"{uri}?mode=ro", uri=True)
+            return
+
+        self._connection = sqlite3.connect(self.file_name, timeout=30)
+        (version,) = self._connection.execute("PRAGMA user_version").fetchone()
+        if version == 0:
+            with self._connection:
+                self._connection.executescript(_SCHEMA)
+                self._import_batches(batch_json_save_path)
+                self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        elif version != SCHEMA_VERSION:
+            log.error(
+                    f"\n{TextColors.ERROR}Blend_My_NFTs Error:\n"
+                    f"{self.file_name} was created by a different version of Blend_My_NFTs. Delete it to start "
+                    f"tracking Batches again.{TextColors.RESET}"
+            )
+            raise ValueError()
+
+    def _import_batches(self, batch_json_save_path):
+        for file_name in os.listdir(batch_json_save_path):
+            match = re.fullmatch(r"Batch(\d+)\.json", file_name)
+            if not match:
+                continue
+            batch_num = int(match.group(1))
+
+            with open(os.path.join(batch_json_save_path, file_name)) as f:
+                batch = json.load(f)
+            if "Generation Save" not in batch:
+                continue
+
+            num_completed = progress_journal.count_completed(
+                    progress_journal.journal_path(batch_json_save_path, batch_num)
+            )
+            if num_completed is None:
+                num_completed = batch["Generation Save"][-1]["DNA Generated"]
+            if num_completed is None:
+                continue
+
+            status = COMPLETE if num_completed >= batch["nfts_in_batch"] else RENDERING
+            self._connection.execute(
+                    "INSERT INTO batches (batch_num, nfts_in_batch, status, num_completed, attempts) "
+                    "VALUES (?, ?, ?, ?, 1)",
+                    (batch_num, batch["nfts_in_batch"], status, num_completed),
+            )
+
+    def start_batch(self, batch_num, order_nums, completed, worker=None):
+        """
+        Marks a Batch as rendering by worker, this process by default. order_nums are the order_nums of its
+        batch_dna_list, completed flags the positions already rendered (see progress_journal.read_completed()). NFTs
+        not rendered yet count one more attempt.
+        """
+        worker = worker or worker_id()
+        now = time.time()
+        with self._connection:
+            self._connection.execute(
+                    "INSERT INTO batches (batch_num, nfts_in_batch, status, num_completed, attempts, worker_id, "
+                    "started_at) VALUES (?, ?, ?, ?, 1, ?, ?) "
+                    "ON CONFLICT (batch_num) DO UPDATE SET nfts_in_batch = excluded.nfts_in_batch, "
+                    "status = excluded.status, num_completed = excluded.num_completed, attempts = attempts + 1, "
+                    "worker_id = excluded.worker_id, started_at = excluded.started_at, finished_at = NULL",
+                    (batch_num, len(order_nums), RENDERING, sum(completed), worker, now),
+            )
+            self._connection.executemany(
+                    "INSERT INTO nfts (batch_num, position, order_num, status, attempts, worker_id, started_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (batch_num, position) DO UPDATE SET order_num = excluded.order_num, "
+                    "status = excluded.status, attempts = attempts + excluded.attempts, "
+                    "worker_id = CASE WHEN excluded.attempts THEN excluded.worker_id ELSE worker_id END, "
+                    "started_at = CASE WHEN excluded.attempts THEN excluded.started_at ELSE started_at END",
+                    (
+                        (
+                            batch_num, position, order_num,
+                            COMPLETE if is_completed else PENDING,
+                            0 if is_completed else 1,
+                            worker, now,
+                        )
+                        for position, (order_num, is_completed) in enumerate(zip(order_nums, completed))
+                    ),
+            )
+
+    def complete_nfts(self, batch_num, entries):
+        """
+        Marks NFTs of a Batch as rendered, entries are (position, order_num, render_time) as synced by the Batch's
+        progress journal.
+        """
+        now = time.time()
+        with self._connection:
+            changed = 0
+            for position, _, render_time in entries:
+                changed += self._connection.execute(
+                        "UPDATE nfts SET status = ?, completed_at = ?, render_time = ? "
+                        "WHERE batch_num = ? AND position = ? AND status != ?",
+                        (COMPLETE, now, render_time, batch_num, position, COMPLETE),
+                ).rowcount
+            self._connection.execute(
+                    "UPDATE batches SET num_completed = num_completed + ? WHERE batch_num = ?",
+                    (changed, batch_num),
+            )
+
+    def finish_batch(self, batch_num, render_time):
+        """Marks a Batch as rendered, render_time is the time its last attempt took."""
+        with self._connection:
+            self._connection.execute(
+                    "UPDATE batches SET status = ?, finished_at = ?, render_time = ? WHERE batch_num = ?",
+                    (COMPLETE, time.time(), render_time, batch_num),
+            )
+
+    def failed_batch(self):
+        """
+        Returns (batch_num, number of NFTs rendered) of the Batch whose rendering started last without completing, None
+        if every started Batch completed. The database can lag the progress journal of a Batch, the journal's number
+        of NFTs rendered is taken when it is ahead.
+        """
+        rows = self._connection.execute(
+                "SELECT batch_num, nfts_in_batch, num_completed FROM batches WHERE status = ? ORDER BY started_at DESC",
+                (RENDERING,),
+        ).fetchall()
+        for batch_num, nfts_in_batch, num_completed in rows:
+            num_journaled = progress_journal.count_completed(
+                    progress_journal.journal_path(self.batch_json_save_path, batch_num)
+            )
+            num_completed = max(num_completed, num_journaled or 0)
+            if num_completed < nfts_in_batch:
+                return batch_num, num_completed
+        return None
+
+    def remaining(self, batch_num):
+        """Returns the order_nums of the NFTs of a Batch not rendered yet, in batch_dna_list order."""
+        rows = self._connection.execute(
+                "SELECT order_num FROM nfts WHERE batch_num = ? AND status != ? ORDER BY position",
+                (batch_num, COMPLETE),
+        )
+        return [order_num for (order_num,) in rows]
+
+    def batch_summaries(self):
+        """Returns a dictionary of the status, progress, attempts, worker and timings of every Batch started."""
+        self._connection.row_factory = sqlite3.Row
+        try:
+            rows = self._connection.execute("SELECT * FROM batches ORDER BY batch_num").fetchall()
+        finally:
+            self._connection.row_factory = None
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+def find_failed_batch(batch_json_save_path):
+    """
+    Returns (batch_num, number of NFTs rendered) of the failed Batch of a Batch_Data folder, see
+    StateStore.failed_batch(), or False if there is none. Returns None without a GenerationState.db.
+    """
+    if not os.path.exists(state_path(batch_json_save_path)):
+        return None
+    with StateStore(batch_json_save_path, read_only=True) as state:
+        return state.failed_batch() or False
+
+
+def log_batch_status(batch_json_save_path):
+    """Logs the status of every Batch started in a Batch_Data folder and what is left of the failed one."""
+    if not os.path.exists(state_path(batch_json_save_path)):
+        log.info(f"\nNo Batch has been rendered from {batch_json_save_path} yet.")
+        return
+
+    with StateStore(batch_json_save_path, read_only=True) as state:
+        batches = state.batch_summaries()
+        message = "\nBatches:"
+        for batch in batches:
+            message += (
+                f"\n - Batch {batch['batch_num']}: {batch['status']}, {batch['num_completed']}/"
+                f"{batch['nfts_in_batch']} NFTs, {batch['attempts']} attempts, worker {batch['worker_id']}"
+            )
+            if batch["render_time"] is not None:
+                message += f", {batch['render_time']:.1f}s"
+        log.info(message)
+
+        failed = state.failed_batch()
+        if failed:
+            batch_num, num_completed = failed
+            nfts_in_batch = next(b["nfts_in_batch"] for b in batches if b["batch_num"] == batch_num)
+            message = (
+                f"\n{TextColors.WARNING}Blend_My_NFTs Warning:\n"
+                f"Batch {batch_num} failed after {num_completed} of {nfts_in_batch} NFTs."
+            )
+            # NFTs of Batches imported from earlier versions are not tracked one by one:
+            remaining = state.remaining(batch_num)
+            if remaining:
+                message += f" order_nums left: {remaining}"
+            log.warning(message + TextColors.RESET)
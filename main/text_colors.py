@@ -0,0 +1,15 @@
+# Purpose:
+# This file holds the console message colours. It does not import bpy so modules that run outside of Blender, like the
+# DNA generation workers in dna_worker.py, can use it.
+
+# TODO: fix colours in console logs and find a way to include coloured text in .txt file.
+
+class TextColors:
+    """
+    The colour of console messages.
+    """
+
+    OK = '\033[92m'  # GREEN
+    WARNING = '\033[93m'  # YELLOW
+    ERROR = '\033[91m'  # RED
+    RESET = '\033[0m'  # RESET COLOR